@@ -2,7 +2,7 @@
 """
 Stack Manager - Frontend para gerenciamento de stacks Docker
 """
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, Response, render_template, jsonify, request, stream_with_context
 from flask_cors import CORS
 import subprocess
 import os
@@ -12,17 +12,61 @@ import json
 import yaml
 import time
 import requests
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+from stack_manager.bootstrap import LabBootstrap, format_report
+from stack_manager.catalog import StackCatalog
+from stack_manager.docker_client import DockerAPIError, DockerClient
+from stack_manager.events import EventBroker, format_sse
+from stack_manager.haproxy import HAProxyController, HAProxyRuntime, ReloadQueue
+from stack_manager.history import ScanHistory
+from stack_manager.jenkins import JenkinsClient, PipelineRegistry, job_name
+from stack_manager.jobs import JobManager
+from stack_manager.ports import PortAllocator, PortUnavailable, parse_ranges
+from stack_manager.sonarqube import SonarQubeClient
+from stack_manager.stack_spec import POOLERS, StackSpec, dump_stack
+from stack_manager.stack_update import format_plan, plan_stack_update, snapshot_updates, wait_for_rollout
+from stack_manager.swarm_status import SwarmStatusCollector, run_batch_query
+from stack_manager.teardown import LabTeardown
+from stack_manager.trivy import TrivyResultStore, TrivyScanner, scan_images
+from stack_manager.webhooks import parse_push, verify_signature
+
 app = Flask(__name__)
 CORS(app)
 
 # Configurações
 STACKS_DIR = 'stacks'
-SCRIPT_SUBIR = 'bash ./subir_lab.sh'
-SCRIPT_DESTRUIR = 'bash ./destruir_lab.sh'
 HAPROXY_CFG = 'lab-devops/haproxy/haproxy.cfg'
-DOCKER_COMPOSE = 'lab-devops/docker-compose.yaml'
+HAPROXY_CONTAINER = 'lab-haproxy'
+SWARM_MANAGER = 'lab-swarm1'
+SWARM_NODES = ['lab-swarm1', 'lab-swarm2']
+
+# Docker Engine API (socket montado no container do stack-manager)
+DOCKER_SOCKET = os.getenv('DOCKER_SOCKET', '/var/run/docker.sock')
+docker_api = DockerClient(DOCKER_SOCKET)
+
+# HAProxy em modo master-worker: Runtime API via TCP na rede de gerência
+# (mgmtnet, só HAProxy e Stack Manager), fora do alcance dos stacks; aceita
+# também o caminho de um socket Unix
+HAPROXY_RUNTIME = os.getenv('HAPROXY_RUNTIME', '172.31.1.10:9999')
+haproxy = HAProxyController(
+    docker_api,
+    HAPROXY_CONTAINER,
+    HAPROXY_CFG,
+    '/usr/local/etc/haproxy/haproxy.cfg',
+    HAProxyRuntime(HAPROXY_RUNTIME)
+)
+HAPROXY_SERVERS = [('swarm1', '172.31.0.11'), ('swarm2', '172.31.0.12')]
+
+# Alterações dentro da janela de debounce saem numa única escrita + reload validado
+HAPROXY_DEBOUNCE = float(os.getenv('HAPROXY_DEBOUNCE', '0.5'))
+HAPROXY_APPLY_TIMEOUT = 60
+haproxy_queue = ReloadQueue(haproxy, debounce=HAPROXY_DEBOUNCE)
+
+# Estado persistente do Stack Manager (jobs, índices, caches)
+DATA_DIR = os.getenv('DATA_DIR', 'data')
 
 # Configurações do Jenkins
 JENKINS_URL = os.getenv('JENKINS_URL', 'http://localhost:8083')
@@ -33,296 +77,128 @@ JENKINS_TOKEN = os.getenv('JENKINS_TOKEN', '')
 SONARQUBE_URL = os.getenv('SONARQUBE_URL', 'http://172.31.0.11:80/sonarqube')
 TRIVY_URL = os.getenv('TRIVY_URL', 'http://172.31.0.11:80/trivy')
 
+# Catálogo de stacks em memória (re-parseia apenas arquivos alterados)
+stack_catalog = StackCatalog(STACKS_DIR)
+
+# Portas públicas dos stacks: índice em disco, reconstruído a partir dos arquivos
+PORT_RANGES = parse_ranges(os.getenv('PORT_RANGES', '8084-8299'))
+os.makedirs(DATA_DIR, exist_ok=True)
+port_allocator = PortAllocator(os.path.join(DATA_DIR, 'ports.db'), PORT_RANGES)
+port_allocator.rebuild({s['name']: s['ports'] for s in stack_catalog.list()})
+
+# Coletor do estado do Swarm (uma consulta em lote por intervalo, para todos os clientes)
+STATUS_INTERVAL = float(os.getenv('STATUS_INTERVAL', '5'))
+swarm_status = SwarmStatusCollector(
+    lambda: run_batch_query(docker_api, SWARM_MANAGER),
+    catalog=stack_catalog,
+    interval=STATUS_INTERVAL
+)
+
+# Canal de eventos (SSE) compartilhado por todos os dashboards
+EVENTS_INTERVAL = float(os.getenv('EVENTS_INTERVAL', '2'))
+SECURITY_INTERVAL = float(os.getenv('SECURITY_INTERVAL', '30'))
+event_broker = EventBroker()
+_publishers_lock = threading.Lock()
+_publishers_started = False
+
+# Jobs assíncronos (pool limitado, serializados por stack, histórico em disco)
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '4'))
+# Deploys simultâneos dentro de um job em lote (/api/stacks/bulk)
+BULK_DEPLOY_WORKERS = int(os.getenv('BULK_DEPLOY_WORKERS', '4'))
+job_manager = JobManager(os.path.join(DATA_DIR, 'jobs'), max_workers=JOB_WORKERS)
+
+# Histórico de scans (Trivy e SonarQube) com resumo diário para tendências
+scan_history = ScanHistory(os.path.join(DATA_DIR, 'security-history.db'))
+
+def record_trivy_result(entry):
+    summary = entry['summary']
+    scan_history.record(
+        'trivy', entry['image'], summary,
+        summary=f"{entry['image']} - {summary.get('critical', 0)} críticas, {summary.get('high', 0)} altas",
+        details={k: entry.get(k) for k in ('digest', 'db_version', 'result_id', 'mode')},
+        ts=entry['scanned_ts']
+    )
+
+def record_sonar_results(data):
+    # Coleta periódica: só grava quando muda (ou uma vez por dia, para a série diária)
+    for project in data['projects']:
+        if project['error']:
+            continue
+        scan_history.record(
+            'sonar', project['key'],
+            {k: project[k] for k in ('bugs', 'vulnerabilities', 'code_smells', 'coverage') if project[k] is not None},
+            summary=f"{project['name']} - Quality Gate: {project['quality_gate']}",
+            details={'quality_gate': project['quality_gate']},
+            min_interval=86400
+        )
+
+# Métricas de todos os projetos do SonarQube: sessão com keep-alive, coleta
+# paralela e cache que continua respondendo com o SonarQube lento ou fora do ar
+SONARQUBE_TOKEN = os.getenv('SONARQUBE_TOKEN', '')
+SONARQUBE_CACHE_TTL = float(os.getenv('SONARQUBE_CACHE_TTL', '60'))
+SONARQUBE_STALE_TTL = float(os.getenv('SONARQUBE_STALE_TTL', '3600'))
+sonarqube = SonarQubeClient(
+    SONARQUBE_URL,
+    token=SONARQUBE_TOKEN,
+    ttl=SONARQUBE_CACHE_TTL,
+    stale_ttl=SONARQUBE_STALE_TTL,
+    on_refresh=record_sonar_results
+)
+
+# Resultados do Trivy em disco, por digest da imagem + versão do banco.
+# Os scans usam o servidor do stack trivy (TRIVY_URL) com fallback para o container local
+TRIVY_CACHE_TTL = int(os.getenv('TRIVY_CACHE_TTL', '86400'))
+trivy_store = TrivyResultStore(os.path.join(DATA_DIR, 'trivy'))
+TRIVY_SCANS_PER_NODE = int(os.getenv('TRIVY_SCANS_PER_NODE', '2'))
+TRIVY_PAGE_SIZE = 100
+# Intervalo para checar se o banco do Trivy mudou e reavaliar os SBOMs guardados
+TRIVY_DB_CHECK_INTERVAL = float(os.getenv('TRIVY_DB_CHECK_INTERVAL', '3600'))
+trivy_scanner = TrivyScanner(
+    lambda args, timeout, node=None: run_swarm_command(args, node=node or SWARM_MANAGER, timeout=timeout),
+    lambda args, timeout, node=None: docker_api.exec_start(node or SWARM_MANAGER, args, timeout=timeout),
+    trivy_store,
+    server_url=TRIVY_URL,
+    ttl=TRIVY_CACHE_TTL,
+    on_result=record_trivy_result
+)
+
+# Pipelines do Jenkins: sessão com crumb em cache, create-or-update do
+# config.xml e registro em disco da configuração de CI/CD de cada stack
+JENKINS_WORKERS = int(os.getenv('JENKINS_WORKERS', '8'))
+# Builds disparados por webhook (/api/cicd/webhook). Polling do SCM só como
+# fallback opcional, com um spec lento (ex.: 'H H/6 * * *'); vazio desativa
+JENKINS_POLL_SPEC = os.getenv('JENKINS_POLL_SPEC', '')
+# Sem segredo o webhook fica desativado (qualquer um poderia disparar builds)
+CICD_WEBHOOK_SECRET = os.getenv('CICD_WEBHOOK_SECRET', '')
+jenkins = JenkinsClient(JENKINS_URL, JENKINS_USER, JENKINS_TOKEN, workers=JENKINS_WORKERS,
+                        poll_spec=JENKINS_POLL_SPEC or None, trivy_url=TRIVY_URL, sonarqube_url=SONARQUBE_URL)
+pipeline_registry = PipelineRegistry(os.path.join(DATA_DIR, 'pipelines.json'))
+
 def create_jenkins_pipeline(stack_name, cicd_config):
-    """Cria uma pipeline no Jenkins para CI/CD do stack"""
-    try:
-        git_url = cicd_config.get('gitCloneUrl')
-        git_branch = cicd_config.get('gitBranch', 'main')
-        build_command = cicd_config.get('buildCommand', '')
-        dockerfile_path = cicd_config.get('dockerfilePath', 'Dockerfile')
-        docker_registry = cicd_config.get('dockerRegistry', '')
-        
-        # Definir nome da imagem
-        if docker_registry:
-            image_name = f"{docker_registry}/{stack_name}:latest"
-        else:
-            image_name = f"{stack_name}:latest"
-        
-        # Criar Jenkinsfile como script de pipeline
-        jenkinsfile_content = f"""
-pipeline {{
-    agent any
-    
-    environment {{
-        STACK_NAME = '{stack_name}'
-        IMAGE_NAME = '{image_name}'
-        DOCKER_REGISTRY = '{docker_registry}'
-    }}
-    
-    stages {{
-        stage('Clone Repository') {{
-            steps {{
-                git branch: '{git_branch}', url: '{git_url}'
-            }}
-        }}
-        
-        {f'''stage('Build Application') {{
-            steps {{
-                sh '{build_command}'
-            }}
-        }}''' if build_command else ''}
-        
-        stage('Build Docker Image') {{
-            steps {{
-                script {{
-                    docker.build("${{IMAGE_NAME}}", "-f {dockerfile_path} .")
-                }}
-            }}
-        }}
-        
-        {f'''stage('Push to Registry') {{
-            steps {{
-                script {{
-                    docker.withRegistry('https://index.docker.io/v1/', 'docker-credentials') {{
-                        docker.image("${{IMAGE_NAME}}").push()
-                    }}
-                }}
-            }}
-        }}''' if docker_registry else ''}
-        
-        stage('Deploy to Swarm') {{
-            steps {{
-                sh '''
-                    docker exec lab-swarm1 docker service update --image ${{IMAGE_NAME}} ${{STACK_NAME}}_${{STACK_NAME}} || \\
-                    docker exec lab-swarm1 docker stack deploy -c /stacks/${{STACK_NAME}}-stack.yaml ${{STACK_NAME}}
-                '''
-            }}
-        }}
-    }}
-    
-    post {{
-        success {{
-            echo '✅ Deploy realizado com sucesso!'
-        }}
-        failure {{
-            echo '❌ Falha no deploy!'
-        }}
-    }}
-}}
-"""
-        
-        # Configuração do job no formato XML
-        job_config = f"""<?xml version='1.1' encoding='UTF-8'?>
-<flow-definition plugin="workflow-job">
-  <description>Pipeline CI/CD para {stack_name}</description>
-  <keepDependencies>false</keepDependencies>
-  <properties>
-    <org.jenkinsci.plugins.workflow.job.properties.PipelineTriggersJobProperty>
-      <triggers>
-        <hudson.triggers.SCMTrigger>
-          <spec>H/5 * * * *</spec>
-          <ignorePostCommitHooks>false</ignorePostCommitHooks>
-        </hudson.triggers.SCMTrigger>
-      </triggers>
-    </org.jenkinsci.plugins.workflow.job.properties.PipelineTriggersJobProperty>
-  </properties>
-  <definition class="org.jenkinsci.plugins.workflow.cps.CpsFlowDefinition" plugin="workflow-cps">
-    <script>{jenkinsfile_content}</script>
-    <sandbox>true</sandbox>
-  </definition>
-  <triggers/>
-  <disabled>false</disabled>
-</flow-definition>"""
-        
-        # Criar job no Jenkins via API
-        job_name = f"{stack_name}-pipeline"
-        create_url = f"{JENKINS_URL}/createItem?name={job_name}"
-        
-        headers = {
-            'Content-Type': 'application/xml',
-        }
-        
-        # Tentar criar o job
-        if JENKINS_TOKEN:
-            response = requests.post(
-                create_url,
-                auth=(JENKINS_USER, JENKINS_TOKEN),
-                headers=headers,
-                data=job_config,
-                timeout=10
-            )
-        else:
-            # Sem autenticação (para ambiente de dev)
-            response = requests.post(
-                create_url,
-                headers=headers,
-                data=job_config,
-                timeout=10
-            )
-        
-        if response.status_code in [200, 201]:
-            return {
-                'success': True,
-                'job_name': job_name,
-                'job_url': f"{JENKINS_URL}/job/{job_name}",
-                'message': f'Pipeline {job_name} criada com sucesso no Jenkins'
-            }
-        else:
-            return {
-                'success': False,
-                'error': f'Erro ao criar job no Jenkins: {response.status_code} - {response.text}'
-            }
-            
-    except Exception as e:
-        return {
-            'success': False,
-            'error': f'Erro ao criar pipeline no Jenkins: {str(e)}'
-        }
+    """Cria (ou atualiza) a pipeline no Jenkins para CI/CD do stack"""
+    pipeline_registry.set(stack_name, cicd_config)
+    result = jenkins.provision(stack_name, cicd_config)
+    if not result['success']:
+        result['error'] = f"Erro ao criar pipeline no Jenkins: {result['error']}"
+    return result
 
 def get_available_stacks():
     """Lista todos os stacks disponíveis"""
-    stacks = []
-    if os.path.exists(STACKS_DIR):
-        for file in os.listdir(STACKS_DIR):
-            if file.endswith('.yaml') or file.endswith('.yml'):
-                stack_name = file.replace('-stack.yaml', '').replace('.yaml', '')
-                stack_info = {
-                    'name': stack_name,
-                    'file': file,
-                    'path': os.path.join(STACKS_DIR, file),
-                    'ports': [],
-                    'urls': []
-                }
-                
-                # Tentar ler informações do arquivo YAML
-                try:
-                    with open(stack_info['path'], 'r') as f:
-                        content = yaml.safe_load(f)
-                        if content and 'services' in content:
-                            stack_info['services'] = list(content['services'].keys())
-                            
-                            # Extrair portas expostas e URLs
-                            for service_name, service_config in content['services'].items():
-                                # Extrair URLs dos labels do Traefik (exceto para Portainer que usa porta direta)
-                                if 'deploy' in service_config and 'labels' in service_config['deploy'] and stack_name != 'portainer':
-                                    labels = service_config['deploy']['labels']
-                                    path_prefix = None
-                                    host_rule = None
-                                    
-                                    for label in labels:
-                                        if 'traefik.http.routers.' in label and '.rule=' in label:
-                                            rule_value = label.split('=', 1)[1] if '=' in label else ''
-                                            
-                                            # PathPrefix
-                                            if 'PathPrefix(' in rule_value:
-                                                path_prefix = rule_value.split('`')[1] if '`' in rule_value else None
-                                            # Host
-                                            elif 'Host(' in rule_value:
-                                                host_rule = rule_value.split('`')[1] if '`' in rule_value else None
-                                    
-                                    # Construir URL baseada nas regras do Traefik
-                                    if path_prefix:
-                                        url = f"http://localhost:8080{path_prefix}"
-                                        if url not in stack_info['urls']:
-                                            stack_info['urls'].append(url)
-                                    elif host_rule:
-                                        url = f"http://{host_rule}"
-                                        if url not in stack_info['urls']:
-                                            stack_info['urls'].append(url)
-                                
-                                # Extrair portas publicadas
-                                if 'ports' in service_config:
-                                    for port in service_config['ports']:
-                                        # Novo formato: dict com target/published/mode
-                                        if isinstance(port, dict):
-                                            if 'published' in port:
-                                                port_num = str(port['published'])
-                                                if port_num not in stack_info['ports']:
-                                                    stack_info['ports'].append(port_num)
-                                        # Formato antigo: string "host:container"
-                                        elif isinstance(port, str) and ':' in port:
-                                            public_port = port.split(':')[0]
-                                            if public_port not in stack_info['ports']:
-                                                stack_info['ports'].append(public_port)
-                                        # Formato simples: apenas número
-                                        elif isinstance(port, (int, str)):
-                                            port_num = str(port)
-                                            if port_num not in stack_info['ports']:
-                                                stack_info['ports'].append(port_num)
-                        else:
-                            stack_info['services'] = []
-                except:
-                    stack_info['services'] = []
-                
-                stacks.append(stack_info)
-    
-    return sorted(stacks, key=lambda x: x['name'])
+    return stack_catalog.list()
 
 def get_docker_stack_status():
-    """Verifica status dos stacks no Docker Swarm"""
-    try:
-        # Usar docker exec para acessar o Swarm
-        result = subprocess.run(
-            ['docker', 'exec', 'lab-swarm1', 'docker', 'stack', 'ls'],
-            capture_output=True,
-            text=True,
-            timeout=5
-        )
-        
-        if result.returncode == 0:
-            lines = result.stdout.strip().split('\n')
-            if len(lines) > 1:  # Tem header + dados
-                stacks = []
-                # Buscar informações de portas dos stacks disponíveis
-                available_stacks = get_available_stacks()
-                available_dict = {s['name']: s for s in available_stacks}
-                
-                for line in lines[1:]:  # Pula o header
-                    parts = line.split()
-                    if parts:
-                        stack_name = parts[0]
-                        stack_data = {
-                            'name': stack_name,
-                            'services': parts[1] if len(parts) > 1 else 'N/A'
-                        }
-                        
-                        # Adicionar portas se disponível
-                        if stack_name in available_dict:
-                            stack_data['ports'] = available_dict[stack_name].get('ports', [])
-                            stack_data['urls'] = available_dict[stack_name].get('urls', [])
-                        else:
-                            stack_data['ports'] = []
-                            stack_data['urls'] = []
-                        
-                        stacks.append(stack_data)
-                return stacks
-        return []
-    except:
-        return []
-
-def run_bash_command(command):
-    """Executa comando bash e retorna output"""
+    """Verifica status dos stacks no Docker Swarm (snapshot do coletor em background)"""
+    return swarm_status.snapshot()['running_stacks']
+
+def run_swarm_command(args, node=SWARM_MANAGER, timeout=300, on_line=None):
+    """Executa comando dentro de um node do Swarm via exec da Engine API"""
     try:
-        result = subprocess.run(
-            command,
-            shell=True,
-            capture_output=True,
-            text=True,
-            timeout=300,  # 5 minutos timeout
-            cwd=os.path.dirname(os.path.abspath(__file__))
-        )
-        
-        return {
-            'success': result.returncode == 0,
-            'stdout': result.stdout,
-            'stderr': result.stderr,
-            'returncode': result.returncode
-        }
-    except subprocess.TimeoutExpired:
+        return docker_api.exec_run(node, args, timeout=timeout, on_line=on_line)
+    except TimeoutError:
         return {
             'success': False,
             'stdout': '',
-            'stderr': 'Comando excedeu o tempo limite de 5 minutos',
+            'stderr': f'Comando excedeu o tempo limite de {timeout} segundos',
             'returncode': -1
         }
     except Exception as e:
@@ -333,35 +209,6 @@ def run_bash_command(command):
             'returncode': -1
         }
 
-def find_next_available_port(start_port=8084):
-    """Encontra a próxima porta disponível"""
-    try:
-        # Ler docker-compose.yaml para ver portas já mapeadas
-        used_ports = set()
-        
-        with open(DOCKER_COMPOSE, 'r') as f:
-            compose_content = yaml.safe_load(f)
-        
-        if 'services' in compose_content and 'haproxy' in compose_content['services']:
-            ports = compose_content['services']['haproxy'].get('ports', [])
-            for port_mapping in ports:
-                if isinstance(port_mapping, str) and ':' in port_mapping:
-                    public_port = int(port_mapping.split(':')[0])
-                    used_ports.add(public_port)
-        
-        # Ler stacks existentes
-        for stack in get_available_stacks():
-            used_ports.update(int(p) for p in stack['ports'])
-        
-        # Encontrar próxima porta disponível
-        next_port = start_port
-        while next_port in used_ports:
-            next_port += 1
-        
-        return next_port
-    except:
-        return start_port
-
 def detect_container_port(image_name):
     """Detecta porta padrão baseada na imagem"""
     # Mapa de imagens conhecidas e suas portas padrão
@@ -394,69 +241,38 @@ def detect_container_port(image_name):
 
 def update_haproxy_config(stack_name, ports):
     """Atualiza configuração do HAProxy com novas portas"""
+    return update_haproxy_routes({stack_name: ports})
+
+def update_haproxy_routes(stacks):
+    """Aplica as rotas de vários stacks ({stack: [portas]}) numa única escrita e reload"""
     try:
-        # 1. Atualizar haproxy.cfg
-        with open(HAPROXY_CFG, 'r') as f:
-            config = f.read()
-        
-        # Para cada porta pública
-        for port in ports:
-            frontend_name = f"{stack_name}_{port}"
-            backend_name = f"{stack_name}_{port}_backend"
-            
-            # Verificar se já existe configuração para esta porta
-            if f"bind *:{port}" in config:
-                continue
-            
-            # Adicionar frontend (antes da primeira linha "backend")
-            frontend_config = f"""
-frontend {frontend_name}
-    bind *:{port}
-    default_backend {backend_name}
-"""
-            # Inserir antes do primeiro backend
-            backend_pos = config.find('\nbackend ')
-            if backend_pos != -1:
-                config = config[:backend_pos] + frontend_config + config[backend_pos:]
-            else:
-                config += frontend_config
-            
-            # Adicionar backend no final
-            backend_config = f"""
-backend {backend_name}
-    balance roundrobin
-    server swarm1 172.31.0.11:{port} check
-    server swarm2 172.31.0.12:{port} check
-"""
-            config += backend_config
-        
-        # Salvar nova configuração do haproxy.cfg
-        with open(HAPROXY_CFG, 'w') as f:
-            f.write(config)
-        
-        # 2. Atualizar docker-compose.yaml para expor as portas
-        with open(DOCKER_COMPOSE, 'r') as f:
-            compose_content = yaml.safe_load(f)
+        # 1. Só portas da faixa publicada no lab-haproxy (uma vez, no bootstrap) recebem rota,
+        # então adicionar ou remover stacks nunca mexe no docker-compose.yaml nem recria o container
+        try:
+            published = haproxy.published_ports()
+        except (OSError, DockerAPIError):
+            published = {p for start, end in PORT_RANGES for p in range(start, end + 1)}
+        routes = {}
+        for stack_name, ports in stacks.items():
+            ports = [p for p in ports if str(p).isdigit()]
+            skipped = [p for p in ports if int(p) not in published]
+            if skipped:
+                print(f"Portas fora da faixa publicada no HAProxy (sem rota): {', '.join(map(str, skipped))}")
+            routes[stack_name] = [p for p in ports if int(p) in published]
         
-        # Adicionar portas no serviço haproxy
-        if 'services' in compose_content and 'haproxy' in compose_content['services']:
-            current_ports = compose_content['services']['haproxy'].get('ports', [])
-            
-            for port in ports:
-                port_mapping = f"{port}:{port}"
-                if port_mapping not in current_ports:
-                    current_ports.append(port_mapping)
-            
-            compose_content['services']['haproxy']['ports'] = sorted(current_ports)
-            
-            # Salvar docker-compose.yaml atualizado
-            with open(DOCKER_COMPOSE, 'w') as f:
-                yaml.dump(compose_content, f, default_flow_style=False, sort_keys=False)
+        # 2. Rotas dos stacks no modelo do haproxy.cfg; mudanças próximas saem num único reload
+        def apply_routes(config):
+            config.ensure_port_slots(PORT_RANGES, HAPROXY_SERVERS)
+            for stack_name, ports in routes.items():
+                config.set_stack_routes(stack_name, ports, HAPROXY_SERVERS)
         
-        # 3. Recriar HAProxy para aplicar mudanças
-        reload_result = run_bash_command('docker compose -f lab-devops/docker-compose.yaml up -d --force-recreate haproxy')
+        future = haproxy_queue.submit(apply_routes)
+        result = future.result(timeout=HAPROXY_APPLY_TIMEOUT)
+        if not result['success']:
+            print(f"Erro ao atualizar HAProxy: {result['error']}")
+            return False
         
-        return reload_result['success']
+        return True
     
     except Exception as e:
         print(f"Erro ao atualizar HAProxy: {e}")
@@ -465,33 +281,18 @@ backend {backend_name}
 def remove_haproxy_config(stack_name):
     """Remove configuração do HAProxy para um stack"""
     try:
-        with open(HAPROXY_CFG, 'r') as f:
-            lines = f.readlines()
+        # Só as seções <stack>_<porta>, sem pegar stacks com o mesmo prefixo
+        def remove_routes(config):
+            config.ensure_port_slots(PORT_RANGES, HAPROXY_SERVERS)
+            config.remove_stack_routes(stack_name)
         
-        new_lines = []
-        skip_until_next_section = False
-        
-        for i, line in enumerate(lines):
-            # Se encontrar frontend ou backend do stack, pular esta seção
-            if f"frontend {stack_name}_" in line or f"backend {stack_name}_" in line:
-                skip_until_next_section = True
-                continue
-            
-            # Parar de pular quando encontrar próxima seção
-            if skip_until_next_section and (line.startswith('frontend ') or line.startswith('backend ')):
-                skip_until_next_section = False
-            
-            if not skip_until_next_section:
-                new_lines.append(line)
-        
-        # Salvar configuração limpa
-        with open(HAPROXY_CFG, 'w') as f:
-            f.writelines(new_lines)
-        
-        # Recarregar HAProxy
-        reload_result = run_bash_command('docker compose -f lab-devops/docker-compose.yaml restart haproxy')
+        future = haproxy_queue.submit(remove_routes)
+        result = future.result(timeout=HAPROXY_APPLY_TIMEOUT)
+        if not result['success']:
+            print(f"Erro ao remover configuração HAProxy: {result['error']}")
+            return False
         
-        return reload_result['success']
+        return True
     
     except Exception as e:
         print(f"Erro ao remover configuração HAProxy: {e}")
@@ -511,12 +312,70 @@ def api_stacks():
 @app.route('/api/status')
 def api_status():
     """API: Status dos stacks em execução"""
-    running_stacks = get_docker_stack_status()
+    snapshot = swarm_status.snapshot()
     return jsonify({
-        'running_stacks': running_stacks,
-        'timestamp': datetime.now().isoformat()
+        'running_stacks': snapshot['running_stacks'],
+        'version': snapshot['version'],
+        'timestamp': snapshot['timestamp'] or datetime.now().isoformat()
     })
 
+def _publish_loop():
+    """Publica catálogo e métricas de segurança quando mudam (uma coleta para todos)"""
+    catalog_version = None
+    next_security = 0
+    next_db_check = 0
+    trivy_db_version = None
+    while True:
+        try:
+            stack_catalog.refresh()
+            if stack_catalog.version != catalog_version:
+                catalog_version = stack_catalog.version
+                event_broker.set_state('stacks', stack_catalog.list())
+            
+            if time.monotonic() >= next_security:
+                next_security = time.monotonic() + SECURITY_INTERVAL
+                event_broker.set_state('security', {
+                    'sonarqube': get_sonarqube_metrics(),
+                    'trivy': get_trivy_metrics()
+                })
+            
+            if time.monotonic() >= next_db_check:
+                next_db_check = time.monotonic() + TRIVY_DB_CHECK_INTERVAL
+                version = trivy_scanner.db_version(refresh=True)
+                if version and version != trivy_db_version:
+                    trivy_db_version = version
+                    submit_trivy_reevaluate()
+        except Exception as e:
+            print(f"Erro ao publicar eventos: {e}")
+        time.sleep(EVENTS_INTERVAL)
+
+def start_event_publishers():
+    """Inicia os produtores de eventos no primeiro cliente SSE"""
+    global _publishers_started
+    with _publishers_lock:
+        if _publishers_started:
+            return
+        _publishers_started = True
+    
+    swarm_status.add_listener(lambda snapshot: event_broker.set_state('status', snapshot['running_stacks']))
+    event_broker.set_state('status', swarm_status.snapshot()['running_stacks'])
+    event_broker.set_state('stacks', stack_catalog.list())
+    threading.Thread(target=_publish_loop, name='event-publisher', daemon=True).start()
+
+@app.route('/api/events')
+def api_events():
+    """API: Stream SSE com deltas de stacks, status do Swarm e segurança"""
+    start_event_publishers()
+    
+    last_event_id = request.headers.get('Last-Event-ID')
+    last_id = int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+    
+    return Response(
+        stream_with_context(event_broker.stream(last_id)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.route('/api/deploy', methods=['POST'])
 def api_deploy():
     """API: Deploy de um stack específico"""
@@ -527,27 +386,30 @@ def api_deploy():
         return jsonify({'success': False, 'error': 'Stack name required'}), 400
     
     # Verificar se o stack existe
-    stacks = get_available_stacks()
-    stack_info = next((s for s in stacks if s['name'] == stack_name), None)
-    
-    if not stack_info:
+    if not stack_catalog.get(stack_name):
         return jsonify({'success': False, 'error': 'Stack not found'}), 404
     
-    # Deploy individual do stack
-    stack_file = f"stacks/{stack_name}-stack.yaml"
-    command = f'docker exec lab-swarm1 docker stack deploy -c /stacks/{stack_name}-stack.yaml {stack_name}'
-    
-    result = run_bash_command(command)
+    job = job_manager.submit('deploy', f'stack:{stack_name}',
+                             lambda job: deploy_stack_job(job, stack_name),
+                             params={'stack': stack_name})
+    return job_response(job)
+
+def deploy_stack_job(job, stack_name):
+    """Job: deploy individual do stack"""
+    result = run_swarm_command(['docker', 'stack', 'deploy', '-c', f'/stacks/{stack_name}-stack.yaml', stack_name],
+                               on_line=job.log)
+    swarm_status.refresh_now()
     
     # Se deploy foi bem sucedido, atualizar HAProxy
-    if result['success'] and stack_info['ports']:
+    stack_info = stack_catalog.get(stack_name)
+    if result['success'] and stack_info and stack_info['ports']:
         update_haproxy_config(stack_name, stack_info['ports'])
     
-    return jsonify({
+    return {
         'success': result['success'],
         'output': result['stdout'],
         'error': result['stderr']
-    })
+    }
 
 @app.route('/api/remove', methods=['POST'])
 def api_remove():
@@ -558,8 +420,15 @@ def api_remove():
     if not stack_name:
         return jsonify({'success': False, 'error': 'Stack name required'}), 400
     
-    command = f'docker exec lab-swarm1 docker stack rm {stack_name}'
-    result = run_bash_command(command)
+    job = job_manager.submit('remove', f'stack:{stack_name}',
+                             lambda job: remove_stack_job(job, stack_name),
+                             params={'stack': stack_name})
+    return job_response(job)
+
+def remove_stack_job(job, stack_name):
+    """Job: remove o stack, a configuração do HAProxy e o arquivo YAML"""
+    result = run_swarm_command(['docker', 'stack', 'rm', stack_name], on_line=job.log)
+    swarm_status.refresh_now()
     
     # Se remoção foi bem sucedida, remover do HAProxy e deletar o arquivo
     if result['success']:
@@ -570,15 +439,20 @@ def api_remove():
         try:
             if os.path.exists(yaml_file):
                 os.remove(yaml_file)
+                stack_catalog.invalidate()
+                port_allocator.release(stack_name)
+                pipeline_registry.remove(stack_name)
+                job.log(f'Arquivo {yaml_file} removido com sucesso.')
                 result['stdout'] += f'\nArquivo {yaml_file} removido com sucesso.'
         except Exception as e:
+            job.log('stderr', f'Erro ao remover arquivo: {str(e)}')
             result['stderr'] += f'\nErro ao remover arquivo: {str(e)}'
     
-    return jsonify({
+    return {
         'success': result['success'],
         'output': result['stdout'],
         'error': result['stderr']
-    })
+    }
 
 @app.route('/api/stack-yaml/<stack_name>', methods=['GET'])
 def api_get_stack_yaml(stack_name):
@@ -609,102 +483,242 @@ def api_update_stack():
     if not stack_name or not yaml_content:
         return jsonify({'success': False, 'error': 'Stack name and YAML content required'}), 400
     
+    job = job_manager.submit('update', f'stack:{stack_name}',
+                             lambda job: update_stack_job(job, stack_name, yaml_content),
+                             params={'stack': stack_name})
+    return job_response(job)
+
+def update_stack_job(job, stack_name, yaml_content):
+    """Job: aplica o novo YAML como rolling update apenas dos serviços alterados"""
     yaml_file = f'./stacks/{stack_name}-stack.yaml'
     
     try:
-        # Salvar o novo conteúdo YAML no host
-        # (O volume está mapeado, então o arquivo fica disponível no swarm automaticamente)
-        with open(yaml_file, 'w', encoding='utf-8') as f:
-            f.write(yaml_content)
-        
-        # Remover stack antiga
-        remove_command = f'docker exec lab-swarm1 docker stack rm {stack_name}'
-        run_bash_command(remove_command)
-        
-        # Aguardar remoção completa
-        time.sleep(3)
-        
-        # Fazer redeploy com o novo YAML
-        # O arquivo já está disponível em /stacks/ via volume mount read-only
-        deploy_command = f'docker exec lab-swarm1 docker stack deploy -c /stacks/{stack_name}-stack.yaml {stack_name}'
-        deploy_result = run_bash_command(deploy_command)
-        
-        if deploy_result['success']:
-            return jsonify({
-                'success': True,
-                'output': f'Stack {stack_name} atualizada e redeployada com sucesso!\n{deploy_result["stdout"]}'
-            })
-        else:
-            return jsonify({
-                'success': False,
-                'error': deploy_result['stderr']
-            })
-            
-    except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+        new_compose = yaml.safe_load(yaml_content)
+    except yaml.YAMLError as e:
+        return {'success': False, 'error': f'YAML inválido: {e}'}
+    if not isinstance(new_compose, dict) or not new_compose.get('services'):
+        return {'success': False, 'error': 'YAML inválido: nenhum serviço definido'}
+    
+    # Versão atualmente em disco (última deployada) e serviços em execução
+    old_compose = None
+    if os.path.exists(yaml_file):
+        with open(yaml_file, 'r', encoding='utf-8') as f:
+            try:
+                old_compose = yaml.safe_load(f)
+            except yaml.YAMLError:
+                old_compose = None
+    
+    services_result = run_swarm_command(['docker', 'stack', 'services', stack_name, '--format', '{{.Name}}'])
+    prefix = f'{stack_name}_'
+    running = [n[len(prefix):] for n in services_result['stdout'].split() if n.startswith(prefix)]
+    
+    plan = plan_stack_update(old_compose, new_compose, running)
+    for line in format_plan(stack_name, plan):
+        job.log(line)
+    changes = plan['services']
+    
+    # Salvar o novo conteúdo YAML no host
+    # (O volume está mapeado, então o arquivo fica disponível no swarm automaticamente)
+    with open(yaml_file, 'w', encoding='utf-8') as f:
+        f.write(yaml_content)
+    stack_catalog.invalidate()
+    
+    # Portas editadas no YAML passam a pertencer ao stack no alocador
+    stack_info = stack_catalog.get(stack_name)
+    conflicts = port_allocator.assign(stack_name, stack_info['ports'] if stack_info else [])
+    if conflicts:
+        job.log('stderr', f"Portas já usadas por outros stacks: {', '.join(map(str, conflicts))}")
+    
+    if not plan['needs_deploy']:
+        return {
+            'success': True,
+            'skipped': True,
+            'output': f'Stack {stack_name} sem alterações; deploy não necessário.',
+            'changes': changes
+        }
+    
+    # Versão/UpdateStatus antes do deploy: o estado final de um update
+    # anterior não pode ser confundido com o do update que vai começar
+    changed = [name for name, change in changes.items() if change['action'] == 'changed']
+    before = snapshot_updates(run_swarm_command, stack_name, changed) if changed else {}
+    
+    # Deploy declarativo sem remover a stack: o Swarm só atualiza os serviços
+    # cuja spec mudou (rolling update conforme o update_config de cada um)
+    deploy_result = run_swarm_command(
+        ['docker', 'stack', 'deploy', '--prune', '--resolve-image', 'changed',
+         '-c', f'/stacks/{stack_name}-stack.yaml', stack_name],
+        on_line=job.log
+    )
+    swarm_status.refresh_now()
+    
+    if not deploy_result['success']:
+        return {
+            'success': False,
+            'error': deploy_result['stderr'],
+            'changes': changes
+        }
+    
+    if changed:
+        job.log(f"Acompanhando rolling update: {', '.join(changed)}")
+        states = wait_for_rollout(run_swarm_command, stack_name, changed, before)
+        for name, state in states.items():
+            changes[name]['update_state'] = state
+            job.log(f'  {name}: {state}')
+    
+    failed = [n for n, c in changes.items() if c.get('update_state') in ('rollback_completed', 'paused', 'rollback_paused', 'timeout')]
+    return {
+        'success': not failed,
+        'skipped': False,
+        'output': f'Stack {stack_name} atualizada in-place.\n{deploy_result["stdout"]}',
+        'error': f"Rolling update não concluído: {', '.join(failed)}" if failed else '',
+        'changes': changes
+    }
+
+def lab_report_job(job, runner):
+    """Job: executa bootstrap/teardown do lab e registra o tempo de cada etapa"""
+    report = runner.run()
+    swarm_status.refresh_now()
+    stack_catalog.invalidate()
+    
+    summary = format_report(report)
+    for line in summary.split('\n'):
+        job.log(line)
+    
+    failed = [s for s in report['steps'] if s['status'] == 'failed']
+    return {
+        'success': report['success'],
+        'output': summary,
+        'error': '\n'.join(f"{s['name']}: {s['error']}" for s in failed),
+        'steps': report['steps'],
+        'seconds': report['seconds']
+    }
 
 @app.route('/api/lab/start', methods=['POST'])
 def api_lab_start():
-    """API: Inicia todo o lab"""
-    result = run_bash_command(SCRIPT_SUBIR)
-    
-    return jsonify({
-        'success': result['success'],
-        'output': result['stdout'],
-        'error': result['stderr']
-    })
+    """API: Inicia todo o lab (DAG com etapas independentes em paralelo)"""
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    job = job_manager.submit('lab-start', 'lab', lambda job: lab_report_job(
+        job, LabBootstrap(docker_api, base_dir=base_dir, log=job.log)))
+    return job_response(job)
 
 @app.route('/api/lab/destroy', methods=['POST'])
 def api_lab_destroy():
-    """API: Destrói todo o lab"""
-    result = run_bash_command(SCRIPT_DESTRUIR)
+    """API: Destrói todo o lab (remoção concorrente e espera por convergência)"""
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    job = job_manager.submit('lab-destroy', 'lab', lambda job: lab_report_job(
+        job, LabTeardown(docker_api, base_dir=base_dir, log=job.log)))
+    return job_response(job)
+
+def job_response(job):
+    """Resposta 202 padrão para operações enfileiradas como job"""
+    return jsonify({
+        'success': True,
+        'job_id': job.id,
+        'status': job.status,
+        'job_url': f'/api/jobs/{job.id}',
+        'logs_url': f'/api/jobs/{job.id}/logs'
+    }), 202
+
+@app.route('/api/jobs')
+def api_jobs():
+    """API: Lista os jobs mais recentes"""
+    limit = request.args.get('limit', 50, type=int)
+    return jsonify({
+        'success': True,
+        'jobs': [job.to_dict() for job in job_manager.list(limit)]
+    })
+
+@app.route('/api/jobs/<job_id>')
+def api_job(job_id):
+    """API: Status de um job (com ?log=1 inclui o log completo)"""
+    job = job_manager.get(job_id)
+    if not job:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
     
     return jsonify({
-        'success': result['success'],
-        'output': result['stdout'],
-        'error': result['stderr']
+        'success': True,
+        'job': job.to_dict(include_log=request.args.get('log') == '1')
     })
 
-@app.route('/api/create-stack', methods=['POST'])
-def api_create_stack():
-    """API: Cria uma nova stack personalizada"""
-    data = request.json
+@app.route('/api/jobs/<job_id>/logs')
+def api_job_logs(job_id):
+    """API: Stream SSE do log do job, linha a linha, até o job terminar"""
+    job = job_manager.get(job_id)
+    if not job:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    
+    last_event_id = request.headers.get('Last-Event-ID', '')
+    offset = int(last_event_id) if last_event_id.isdigit() else request.args.get('offset', 0, type=int)
     
+    def generate():
+        for entry in job_manager.follow(job_id, offset):
+            if entry is None:
+                yield ': ping\n\n'
+            else:
+                yield format_sse('log', entry, entry['n'] + 1)
+        yield format_sse('end', job.to_dict())
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def validate_stack_request(data):
+    """Erro de validação dos dados de criação de um stack (ou None)"""
     # Validar dados obrigatórios MÍNIMOS
-    required_fields = ['name', 'image']
-    for field in required_fields:
+    for field in ('name', 'image'):
         if field not in data or not data[field]:
-            return jsonify({'success': False, 'error': f'Campo obrigatório: {field}'}), 400
-    
-    stack_name = data['name']
-    image = data['image']
+            return f'Campo obrigatório: {field}'
     
     # Validar nome do stack
-    if not stack_name.replace('-', '').replace('_', '').isalnum():
-        return jsonify({'success': False, 'error': 'Nome inválido. Use apenas letras, números e hífen'}), 400
+    if not data['name'].replace('-', '').replace('_', '').isalnum():
+        return 'Nome inválido. Use apenas letras, números e hífen'
     
-    # Auto-detectar porta do container se não especificada
-    container_port = data.get('containerPort')
-    if not container_port:
-        container_port = detect_container_port(image)
-        print(f"🔍 Porta do container detectada: {container_port} para imagem {image}")
+    # Validar campos numéricos (valores inválidos viram 400, não 500)
+    for field, label in (('publicPort', 'Porta pública'), ('containerPort', 'Porta do container'),
+                         ('replicas', 'Réplicas')):
+        if data.get(field) in (None, ''):
+            continue
+        try:
+            if int(data[field]) < 1:
+                raise ValueError
+        except (TypeError, ValueError):
+            return f'{label} deve ser um número inteiro positivo'
     
-    # Auto-atribuir porta pública se não especificada
-    public_port = data.get('publicPort')
-    if not public_port:
-        public_port = find_next_available_port()
-        print(f"🔍 Porta pública disponível: {public_port}")
+    if data.get('publicPort') and not port_allocator.in_range(int(data['publicPort'])):
+        ranges = ', '.join(f'{start}-{end}' for start, end in PORT_RANGES)
+        return f'Porta pública fora da faixa publicada no HAProxy ({ranges})'
     
-    # Valores padrão para campos opcionais
-    replicas = data.get('replicas', 1)
+    # Validar pool de conexões do banco
+    database = data.get('database') or {}
+    pooler = database.get('pooler')
+    if data.get('includeDatabase') and pooler:
+        db_type = database.get('type', 'mariadb')
+        if db_type not in POOLERS:
+            return f'Pool de conexões não disponível para {db_type}'
+        if pooler.get('mode') and pooler['mode'] not in POOLERS[db_type]['modes']:
+            return f"Modo do pool inválido para {db_type}. Use: {', '.join(POOLERS[db_type]['modes'])}"
+        try:
+            if pooler.get('poolSize') and int(pooler['poolSize']) < 1:
+                raise ValueError
+        except (TypeError, ValueError):
+            return 'Tamanho do pool deve ser um número inteiro positivo'
+    return None
+
+def complete_stack_data(data, public_port):
+    """Dados completos do stack, com porta do container auto-detectada se não informada"""
+    container_port = data.get('containerPort')
+    if not container_port:
+        container_port = detect_container_port(data['image'])
+        print(f"🔍 Porta do container detectada: {container_port} para imagem {data['image']}")
     
-    # Criar data completa com valores auto-detectados
-    complete_data = {
-        'name': stack_name,
-        'image': image,
+    return {
+        'name': data['name'],
+        'image': data['image'],
         'containerPort': container_port,
         'publicPort': public_port,
-        'replicas': replicas,
+        'replicas': data.get('replicas') or 1,
         'network': data.get('network', 'devops-network'),
         'healthCheck': data.get('healthCheck'),
         'envVars': data.get('envVars', {}),
@@ -715,20 +729,52 @@ def api_create_stack():
         'enableCICD': data.get('enableCICD', False),
         'cicd': data.get('cicd', {})
     }
+
+def write_stack_file(complete_data):
+    """Grava o YAML do stack e confirma a porta reservada; retorna o caminho"""
+    stack_file_path = os.path.join(STACKS_DIR, f"{complete_data['name']}-stack.yaml")
+    content = generate_stack_yaml(complete_data)
+    # Mesmo spec gera os mesmos bytes: arquivo idêntico não é regravado
+    try:
+        with open(stack_file_path) as f:
+            unchanged = f.read() == content
+    except OSError:
+        unchanged = False
+    if not unchanged:
+        with open(stack_file_path, 'w') as f:
+            f.write(content)
+    port_allocator.confirm(complete_data['name'])
+    return stack_file_path
+
+@app.route('/api/create-stack', methods=['POST'])
+def api_create_stack():
+    """API: Cria uma nova stack personalizada"""
+    data = request.json
+    
+    error = validate_stack_request(data)
+    if error:
+        return jsonify({'success': False, 'error': error}), 400
     
-    # Gerar conteúdo do YAML
-    stack_yaml = generate_stack_yaml(complete_data)
+    stack_name = data['name']
     
-    # Salvar arquivo
+    # Reservar a porta pública (a informada ou a próxima livre da faixa)
+    try:
+        public_port = port_allocator.allocate(stack_name, preferred=data.get('publicPort'))
+    except PortUnavailable as e:
+        return jsonify({'success': False, 'error': str(e)}), 409
+    if not data.get('publicPort'):
+        print(f"🔍 Porta pública disponível: {public_port}")
+    
+    complete_data = complete_stack_data(data, public_port)
     stack_file_path = os.path.join(STACKS_DIR, f'{stack_name}-stack.yaml')
     
     try:
-        with open(stack_file_path, 'w') as f:
-            f.write(stack_yaml)
+        stack_file_path = write_stack_file(complete_data)
+        stack_catalog.invalidate()
         
         # Automaticamente fazer deploy do stack criado
-        deploy_command = f'docker exec lab-swarm1 docker stack deploy -c /stacks/{stack_name}-stack.yaml {stack_name}'
-        deploy_result = run_bash_command(deploy_command)
+        deploy_result = run_swarm_command(['docker', 'stack', 'deploy', '-c', f'/stacks/{stack_name}-stack.yaml', stack_name])
+        swarm_status.refresh_now()
         
         # Atualizar HAProxy com a porta pública
         ports = [str(complete_data['publicPort'])]
@@ -755,341 +801,312 @@ def api_create_stack():
         
         return jsonify(response_data)
     except Exception as e:
+        if not os.path.exists(stack_file_path):
+            port_allocator.release(stack_name)
         return jsonify({
             'success': False,
             'error': f'Erro ao salvar arquivo: {str(e)}'
         }), 500
 
-def generate_stack_yaml(data):
-    """Gera o conteúdo YAML da stack baseado nos dados fornecidos"""
-    stack_name = data['name']
-    image = data['image']
-    container_port = data['containerPort']
-    public_port = data['publicPort']
-    replicas = data['replicas']
-    network = data.get('network', 'devops-network')
-    health_check = data.get('healthCheck')
-    env_vars = data.get('envVars', {})
-    use_traefik = data.get('useTraefik', False)
-    traefik_domain = data.get('traefikDomain')
-    include_database = data.get('includeDatabase', False)
-    database_config = data.get('database', {})
-    
-    # Se tiver banco de dados, adicionar variáveis de ambiente de conexão
-    if include_database and database_config:
-        db_type = database_config.get('type', 'mariadb')
-        db_name = database_config.get('name', stack_name)
-        db_user = database_config.get('user', stack_name)
-        db_password = database_config.get('password', 'password123')
-        
-        # Adicionar variáveis de ambiente conforme o tipo de banco
-        db_service_name = f"{stack_name}_database"
-        
-        if db_type in ['mariadb', 'mysql']:
-            env_vars.update({
-                'DB_HOST': db_service_name,
-                'DB_PORT': '3306',
-                'DB_NAME': db_name,
-                'DB_USER': db_user,
-                'DB_PASSWORD': db_password
-            })
-        elif db_type == 'postgres':
-            env_vars.update({
-                'POSTGRES_HOST': db_service_name,
-                'POSTGRES_PORT': '5432',
-                'POSTGRES_DB': db_name,
-                'POSTGRES_USER': db_user,
-                'POSTGRES_PASSWORD': db_password
-            })
-        elif db_type == 'mongodb':
-            env_vars.update({
-                'MONGO_HOST': db_service_name,
-                'MONGO_PORT': '27017',
-                'MONGO_DB': db_name,
-                'MONGO_USER': db_user,
-                'MONGO_PASSWORD': db_password
-            })
-    
-    # Construir seção de environment
-    env_section = ""
-    if env_vars:
-        env_section = "    environment:\n"
-        for key, value in env_vars.items():
-            env_section += f"      - {key}={value}\n"
-    
-    # Construir health check
-    health_section = ""
-    if health_check:
-        health_section = f"""    healthcheck:
-      test: ["CMD", "curl", "-f", "http://localhost:{container_port}{health_check}"]
-      interval: 30s
-      timeout: 10s
-      retries: 3
-      start_period: 40s
-"""
+@app.route('/api/stacks/bulk', methods=['POST'])
+def api_bulk_create_stacks():
+    """API: Cria e faz deploy de vários stacks de uma vez (job)
     
-    # Construir labels do Traefik
-    traefik_labels = ""
-    if use_traefik and traefik_domain:
-        traefik_labels = f"""        - "traefik.enable=true"
-        - "traefik.http.routers.{stack_name}.rule=Host(`{traefik_domain}`)"
-        - "traefik.http.routers.{stack_name}.entrypoints=web"
-        - "traefik.http.services.{stack_name}.loadbalancer.server.port={container_port}"
-"""
+    Corpo: {"stacks": [dados de /api/create-stack, ...]}. Portas reservadas
+    numa única transação e arquivos gravados numa passada; o job faz os
+    deploys em paralelo limitado e aplica todas as rotas num único reload.
+    """
+    specs = (request.json or {}).get('stacks') or []
+    if not specs or not isinstance(specs, list):
+        return jsonify({'success': False, 'error': 'Nenhum stack informado'}), 400
     
-    # Template YAML do serviço principal
-    yaml_content = f"""version: "3.9"
-
-services:
-  {stack_name}:
-    image: {image}
-    networks:
-      - {network}
-    ports:
-      - target: {container_port}
-        published: {public_port}
-        mode: host
-{env_section}{health_section}    deploy:
-      mode: replicated
-      replicas: {replicas}
-      placement:
-        constraints:
-          - node.role == worker
-      restart_policy:
-        condition: on-failure
-        delay: 5s
-        max_attempts: 3
-      update_config:
-        parallelism: 1
-        delay: 10s
-        failure_action: rollback
-      labels:
-{traefik_labels}        - "app={stack_name}"
-        - "environment=homologacao"
-"""
+    names = [spec.get('name') for spec in specs if isinstance(spec, dict) and spec.get('name')]
+    repeated = sorted({name for name in names if names.count(name) > 1})
+    if repeated:
+        return jsonify({'success': False, 'error': f"Stacks repetidos na requisição: {', '.join(repeated)}"}), 400
     
-    # Adicionar serviço de banco de dados se solicitado
-    if include_database and database_config:
-        db_type = database_config.get('type', 'mariadb')
-        db_name = database_config.get('name', stack_name)
-        db_user = database_config.get('user', stack_name)
-        db_password = database_config.get('password', 'password123')
-        db_service_name = f"{stack_name}_database"
-        
-        # Configuração específica por tipo de banco
-        if db_type == 'mariadb':
-            db_service = f"""
-  {db_service_name}:
-    image: mariadb:latest
-    networks:
-      - {network}
-    environment:
-      - MYSQL_ROOT_PASSWORD=root123
-      - MYSQL_DATABASE={db_name}
-      - MYSQL_USER={db_user}
-      - MYSQL_PASSWORD={db_password}
-    volumes:
-      - {stack_name}_db_data:/var/lib/mysql
-    deploy:
-      mode: replicated
-      replicas: 1
-      placement:
-        constraints:
-          - node.role == worker
-      restart_policy:
-        condition: on-failure
-"""
-        elif db_type == 'mysql':
-            db_service = f"""
-  {db_service_name}:
-    image: mysql:8
-    networks:
-      - {network}
-    environment:
-      - MYSQL_ROOT_PASSWORD=root123
-      - MYSQL_DATABASE={db_name}
-      - MYSQL_USER={db_user}
-      - MYSQL_PASSWORD={db_password}
-    volumes:
-      - {stack_name}_db_data:/var/lib/mysql
-    deploy:
-      mode: replicated
-      replicas: 1
-      placement:
-        constraints:
-          - node.role == worker
-      restart_policy:
-        condition: on-failure
-"""
-        elif db_type == 'postgres':
-            db_service = f"""
-  {db_service_name}:
-    image: postgres:15
-    networks:
-      - {network}
-    environment:
-      - POSTGRES_DB={db_name}
-      - POSTGRES_USER={db_user}
-      - POSTGRES_PASSWORD={db_password}
-    volumes:
-      - {stack_name}_db_data:/var/lib/postgresql/data
-    deploy:
-      mode: replicated
-      replicas: 1
-      placement:
-        constraints:
-          - node.role == worker
-      restart_policy:
-        condition: on-failure
-"""
-        elif db_type == 'mongodb':
-            db_service = f"""
-  {db_service_name}:
-    image: mongo:6
-    networks:
-      - {network}
-    environment:
-      - MONGO_INITDB_ROOT_USERNAME={db_user}
-      - MONGO_INITDB_ROOT_PASSWORD={db_password}
-      - MONGO_INITDB_DATABASE={db_name}
-    volumes:
-      - {stack_name}_db_data:/data/db
-    deploy:
-      mode: replicated
-      replicas: 1
-      placement:
-        constraints:
-          - node.role == worker
-      restart_policy:
-        condition: on-failure
-"""
+    results = {}
+    valid = []
+    for index, spec in enumerate(specs):
+        if not isinstance(spec, dict):
+            name = f'#{index}'
+            results[name] = {'stack': name, 'success': False, 'error': 'Dados do stack devem ser um objeto'}
+            continue
+        name = spec.get('name') or f'#{index}'
+        error = validate_stack_request(spec)
+        if error:
+            results[name] = {'stack': name, 'success': False, 'error': error}
         else:
-            db_service = ""
-        
-        yaml_content += db_service
-        
-        # Adicionar volumes e networks
-        yaml_content += f"""
-volumes:
-  {stack_name}_db_data:
-
-networks:
-  {network}:
-    external: true
-"""
-    else:
-        # Sem banco de dados, só adicionar networks
-        yaml_content += f"""
-networks:
-  {network}:
-    external: true
-"""
+            valid.append(spec)
     
-    return yaml_content
+    # Todas as portas numa transação só
+    ports = port_allocator.allocate_many([(spec['name'], spec.get('publicPort')) for spec in valid])
+    
+    created = []
+    pipelines = {}
+    for spec in valid:
+        name = spec['name']
+        if isinstance(ports[name], PortUnavailable):
+            results[name] = {'stack': name, 'success': False, 'error': str(ports[name])}
+            continue
+        complete_data = complete_stack_data(spec, ports[name])
+        try:
+            write_stack_file(complete_data)
+        except OSError as e:
+            port_allocator.release(name)
+            results[name] = {'stack': name, 'success': False, 'error': f'Erro ao salvar arquivo: {str(e)}'}
+            continue
+        created.append(name)
+        results[name] = {'stack': name, 'success': True, 'publicPort': ports[name]}
+        if complete_data['enableCICD'] and complete_data['cicd'].get('gitCloneUrl'):
+            pipelines[name] = complete_data['cicd']
+    stack_catalog.invalidate()
+    
+    # Uma chave por stack: não roda junto com deploy/update/remoção do mesmo stack
+    job = job_manager.submit('bulk-create', [f'stack:{name}' for name in created],
+                             lambda job: bulk_deploy_job(job, created, results, pipelines),
+                             params={'stacks': list(results)})
+    return job_response(job)
 
-@app.route('/api/security/sonarqube')
-def api_sonarqube_metrics():
-    """API: Métricas do SonarQube"""
-    try:
-        # Tentar conectar ao SonarQube
-        response = requests.get(
-            f"{SONARQUBE_URL}/api/measures/component",
-            params={
-                'component': 'default',
-                'metricKeys': 'bugs,vulnerabilities,code_smells,coverage,quality_gate_details'
-            },
-            timeout=5
+@app.route('/api/stacks/bulk/deploy', methods=['POST'])
+def api_bulk_deploy_stacks():
+    """API: Deploy de vários stacks existentes (job), com um único reload do HAProxy"""
+    names = (request.json or {}).get('stacks') or []
+    if not names or not isinstance(names, list) or not all(isinstance(name, str) for name in names):
+        return jsonify({'success': False, 'error': 'Informe uma lista de nomes de stacks'}), 400
+    
+    missing = [name for name in names if not stack_catalog.get(name)]
+    if missing:
+        return jsonify({'success': False, 'error': f"Stacks não encontrados: {', '.join(missing)}"}), 404
+    
+    names = list(dict.fromkeys(names))
+    job = job_manager.submit('bulk-deploy', [f'stack:{name}' for name in names],
+                             lambda job: bulk_deploy_job(job, names, {}),
+                             params={'stacks': names})
+    return job_response(job)
+
+def bulk_deploy_job(job, names, results, pipelines=None):
+    """Job: deploy dos stacks em paralelo, rotas do HAProxy num único reload e pipelines"""
+    started = time.monotonic()
+    job.log(f'Deploy de {len(names)} stacks ({BULK_DEPLOY_WORKERS} em paralelo)')
+    
+    def deploy_one(stack_name):
+        result = run_swarm_command(
+            ['docker', 'stack', 'deploy', '-c', f'/stacks/{stack_name}-stack.yaml', stack_name],
+            on_line=lambda stream, line: job.log(stream, f'[{stack_name}] {line}')
         )
-        
-        if response.status_code == 200:
-            data = response.json()
-            measures = data.get('component', {}).get('measures', [])
-            
-            metrics = {}
-            for measure in measures:
-                key = measure.get('metric')
-                value = measure.get('value', '0')
-                metrics[key] = value
-            
-            # Buscar projetos
-            projects_response = requests.get(
-                f"{SONARQUBE_URL}/api/projects/search",
-                timeout=5
-            )
-            projects = []
-            if projects_response.status_code == 200:
-                projects_data = projects_response.json()
-                projects = [p.get('name') for p in projects_data.get('components', [])]
-            
-            return jsonify({
-                'success': True,
-                'bugs': int(metrics.get('bugs', 0)),
-                'vulnerabilities': int(metrics.get('vulnerabilities', 0)),
-                'code_smells': int(metrics.get('code_smells', 0)),
-                'coverage': float(metrics.get('coverage', 0)),
-                'quality_gate': 'OK' if metrics.get('quality_gate_details') else 'N/A',
-                'projects': projects
-            })
-        else:
-            return jsonify({
-                'success': False,
-                'error': f'SonarQube retornou status {response.status_code}'
-            })
-            
-    except requests.exceptions.ConnectionError:
-        return jsonify({
-            'success': False,
-            'error': 'Não foi possível conectar ao SonarQube. Verifique se o serviço está rodando.'
-        })
-    except Exception as e:
-        return jsonify({
-            'success': False,
-            'error': str(e)
-        })
+        job.log(f"{'✓' if result['success'] else '✗'} {stack_name}")
+        return stack_name, result
+    
+    with ThreadPoolExecutor(max_workers=BULK_DEPLOY_WORKERS, thread_name_prefix='bulk-deploy') as pool:
+        deployed = list(pool.map(deploy_one, names))
+    swarm_status.refresh_now()
+    
+    routes = {}
+    for stack_name, result in deployed:
+        item = results.setdefault(stack_name, {'stack': stack_name})
+        item.update(success=result['success'], output=result['stdout'],
+                    error=None if result['success'] else result['stderr'].strip())
+        stack_info = stack_catalog.get(stack_name)
+        if result['success'] and stack_info and stack_info['ports']:
+            routes[stack_name] = stack_info['ports']
+    
+    haproxy_ok = True
+    if routes:
+        job.log(f'Aplicando rotas de {len(routes)} stacks no HAProxy')
+        haproxy_ok = update_haproxy_routes(routes)
+        if not haproxy_ok:
+            job.log('stderr', 'Falha ao atualizar o HAProxy')
+    
+    if pipelines:
+        for stack_name, cicd in pipelines.items():
+            pipeline_registry.set(stack_name, cicd)
+        for result in jenkins.provision_many(pipelines):
+            results[result['stack']]['jenkins'] = result
+    
+    items = list(results.values())
+    failed = [item['stack'] for item in items if not item.get('success')]
+    seconds = round(time.monotonic() - started, 1)
+    job.log(f'Concluído em {seconds}s: {len(items) - len(failed)} ok, {len(failed)} com erro')
+    return {
+        'success': not failed and haproxy_ok,
+        'seconds': seconds,
+        'haproxy': haproxy_ok,
+        'results': items,
+        'error': f"Falha em: {', '.join(failed)}" if failed else None
+    }
 
-@app.route('/api/security/trivy')
-def api_trivy_metrics():
-    """API: Métricas do Trivy"""
+def generate_stack_yaml(data):
+    """Gera o conteúdo YAML da stack baseado nos dados fornecidos"""
+    return dump_stack(StackSpec.from_request(data))
+
+def get_sonarqube_metrics():
+    """Métricas do SonarQube (totais + por projeto), servidas do cache"""
+    return sonarqube.metrics()
+
+def get_trivy_metrics():
+    """Métricas do Trivy"""
     try:
         # Verificar se Trivy está acessível
         response = requests.get(f"{TRIVY_URL}/healthz", timeout=5)
+        if response.status_code != 200:
+            return {
+                'success': False,
+                'error': f'Trivy retornou status {response.status_code}. Verifique se o serviço está rodando.'
+            }
         
-        # Dados simulados - Trivy geralmente não tem API REST para métricas
-        # Em produção, você precisaria ler os resultados de scans salvos
-        return jsonify({
-            'success': True,
-            'critical': 0,
-            'high': 0,
-            'medium': 0,
-            'low': 0,
-            'last_scan': datetime.now().isoformat(),
-            'message': 'Execute um scan para ver resultados'
-        })
+        # Totais reais: último scan salvo de cada imagem
+        totals = trivy_store.aggregate()
+        metrics = {'success': True, **totals}
+        if not totals['images']:
+            metrics['message'] = 'Execute um scan para ver resultados'
+        return metrics
             
     except requests.exceptions.ConnectionError:
-        return jsonify({
+        return {
             'success': False,
             'error': 'Não foi possível conectar ao Trivy. Verifique se o serviço está rodando.'
-        })
+        }
     except Exception as e:
-        return jsonify({
+        return {
             'success': False,
             'error': str(e)
-        })
+        }
+
+@app.route('/api/cicd/pipelines')
+def api_list_pipelines():
+    """API: Stacks com CI/CD configurado"""
+    return jsonify({
+        'success': True,
+        'pipelines': [{'stack': name, 'job_name': job_name(name), **cicd}
+                      for name, cicd in sorted(pipeline_registry.all().items())]
+    })
+
+@app.route('/api/cicd/webhook', methods=['POST'])
+def api_cicd_webhook():
+    """API: Recebe o webhook de push e dispara só as pipelines do repositório/branch
+    
+    Aceita GitHub, Gitea, GitLab ou {"repository": url, "branch": nome}.
+    """
+    if not CICD_WEBHOOK_SECRET:
+        return jsonify({'success': False, 'error': 'Webhook desativado: configure CICD_WEBHOOK_SECRET'}), 503
+    
+    if not verify_signature(CICD_WEBHOOK_SECRET, request.headers, request.get_data()):
+        return jsonify({'success': False, 'error': 'Assinatura do webhook inválida'}), 401
+    
+    if request.headers.get('X-GitHub-Event') == 'ping':
+        return jsonify({'success': True, 'message': 'pong'})
+    
+    push = parse_push(request.get_json(silent=True))
+    if not push:
+        return jsonify({'success': True, 'triggered': [], 'message': 'Evento ignorado (não é push de branch)'})
+    
+    stacks = pipeline_registry.matching(push['repositories'], push['branch'])
+    if not stacks:
+        return jsonify({'success': True, 'triggered': [], 'branch': push['branch'],
+                        'message': 'Nenhuma pipeline para este repositório/branch'})
+    
+    results = jenkins.build_many([job_name(name) for name in stacks])
+    failed = [r['job_name'] for r in results if not r['success']]
+    return jsonify({
+        'success': not failed,
+        'branch': push['branch'],
+        'commit': push['commit'],
+        'triggered': results,
+        'error': f"Falha ao disparar: {', '.join(failed)}" if failed else None
+    }), 502 if failed else 200
+
+@app.route('/api/cicd/pipelines/sync', methods=['POST'])
+def api_sync_pipelines():
+    """API: Cria ou atualiza as pipelines de vários stacks em paralelo (job)
+    
+    Corpo: {"pipelines": {stack: cicd}} registra/atualiza configurações;
+    {"stacks": [...]} limita a sincronização. Sem corpo, re-sincroniza todas
+    as pipelines registradas (ex.: depois de mudar o template).
+    """
+    data = request.json or {}
+    pipelines = data.get('pipelines') or {}
+    stacks = data.get('stacks')
+    
+    if not isinstance(pipelines, dict):
+        return jsonify({'success': False, 'error': 'pipelines deve ser um objeto {stack: cicd}'}), 400
+    if stacks is not None and not (isinstance(stacks, list) and all(isinstance(n, str) for n in stacks)):
+        return jsonify({'success': False, 'error': 'stacks deve ser uma lista de nomes'}), 400
+    not_objects = [name for name, cicd in pipelines.items() if not isinstance(cicd, dict)]
+    if not_objects:
+        return jsonify({'success': False, 'error': f"Configuração de CI/CD deve ser um objeto: {', '.join(not_objects)}"}), 400
+    
+    invalid = [name for name, cicd in pipelines.items() if not cicd.get('gitCloneUrl')]
+    if invalid:
+        return jsonify({'success': False, 'error': f"gitCloneUrl obrigatório: {', '.join(invalid)}"}), 400
+    if stacks:
+        unknown = [name for name in stacks if name not in pipelines and not pipeline_registry.get(name)]
+        if unknown:
+            return jsonify({'success': False, 'error': f"Stacks sem CI/CD configurado: {', '.join(unknown)}"}), 404
+    
+    job = job_manager.submit('jenkins-sync', 'jenkins:sync',
+                             lambda job: sync_pipelines_job(job, pipelines, stacks),
+                             params={'stacks': stacks or list(pipelines) or None})
+    return job_response(job)
+
+def sync_pipelines_job(job, pipelines, stacks):
+    """Job: registra as configurações novas e faz upsert das pipelines em paralelo"""
+    started = time.monotonic()
+    for name, cicd in pipelines.items():
+        pipeline_registry.set(name, cicd)
+    
+    registered = pipeline_registry.all()
+    if stacks:
+        targets = {name: registered[name] for name in stacks if name in registered}
+    elif pipelines:
+        targets = {name: registered[name] for name in pipelines}
+    else:
+        targets = registered
+    
+    if not targets:
+        return {'success': True, 'results': [], 'output': 'Nenhuma pipeline registrada'}
+    
+    job.log(f'Sincronizando {len(targets)} pipelines ({JENKINS_WORKERS} em paralelo)')
+    
+    def log_result(result):
+        if result['success']:
+            job.log(f"✓ {result['job_name']}: {result['action']}")
+        else:
+            job.log('stderr', f"✗ {result['job_name']}: {result['error']}")
+    
+    results = jenkins.provision_many(targets, on_result=log_result)
+    failed = [r['stack'] for r in results if not r['success']]
+    seconds = round(time.monotonic() - started, 1)
+    job.log(f'Concluído em {seconds}s: {len(results) - len(failed)} ok, {len(failed)} com erro')
+    return {
+        'success': not failed,
+        'seconds': seconds,
+        'results': results,
+        'error': f"Falha ao sincronizar: {', '.join(failed)}" if failed else None
+    }
+
+@app.route('/api/security/sonarqube')
+def api_sonarqube_metrics():
+    """API: Métricas do SonarQube"""
+    return jsonify(get_sonarqube_metrics())
+
+@app.route('/api/security/trivy')
+def api_trivy_metrics():
+    """API: Métricas do Trivy"""
+    return jsonify(get_trivy_metrics())
 
 @app.route('/api/security/trivy/scan', methods=['POST'])
 def api_trivy_scan():
     """API: Iniciar scan do Trivy"""
     try:
-        # Executar scan em background
         # Exemplo: escanear uma imagem
-        command = 'docker exec lab-swarm1 docker run --rm aquasec/trivy:latest image alpine:latest'
-        result = run_bash_command(command)
+        entry = trivy_scanner.scan('alpine:latest')
+        summary = entry['summary']
         
         return jsonify({
-            'success': result['success'],
-            'output': result['stdout'],
-            'error': result['stderr']
+            'success': True,
+            'output': ', '.join(f'{k}: {v}' for k, v in summary.items()),
+            'cached': entry['cached']
         })
     except Exception as e:
         return jsonify({
@@ -1097,6 +1114,87 @@ def api_trivy_scan():
             'error': str(e)
         })
 
+@app.route('/api/security/trivy/scan-all', methods=['POST'])
+def api_trivy_scan_all():
+    """API: Escaneia todas as imagens dos stacks e do Swarm (job)"""
+    data = request.json or {}
+    force = bool(data.get('force'))
+    
+    job = job_manager.submit('trivy-scan-all', 'trivy:scan-all',
+                             lambda job: trivy_scan_all_job(job, force),
+                             params={'force': force})
+    return job_response(job)
+
+def trivy_scan_all_job(job, force):
+    """Job: coleta as imagens, deduplica por digest e escaneia em paralelo nos nodes"""
+    started = time.monotonic()
+    
+    # Imagens referenciadas nos arquivos de stack
+    images = []
+    for stack in stack_catalog.list():
+        for image in stack.get('images', []):
+            if image not in images:
+                images.append(image)
+    
+    # Imagens realmente em execução no Swarm (inclui serviços criados fora dos arquivos)
+    running = run_swarm_command(['docker', 'service', 'ls', '--format', '{{.Image}}'], timeout=30)
+    if running['success']:
+        for image in running['stdout'].split():
+            if image not in images:
+                images.append(image)
+    else:
+        job.log('stderr', f"Não foi possível listar os serviços do Swarm: {running['stderr'].strip()}")
+    
+    if not images:
+        return {'success': True, 'images': [], 'output': 'Nenhuma imagem encontrada'}
+    
+    results = scan_images(trivy_scanner, images, SWARM_NODES, per_node=TRIVY_SCANS_PER_NODE,
+                          force=force, log=job.log)
+    pruned = trivy_store.prune()
+    if pruned:
+        job.log(f'{pruned} resultados antigos removidos')
+    
+    failed = [r['image'] for r in results if r['error']]
+    seconds = round(time.monotonic() - started, 1)
+    job.log(f'Scan concluído em {seconds}s: {len(results) - len(failed)} ok, {len(failed)} com erro')
+    return {
+        'success': not failed,
+        'seconds': seconds,
+        'images': results,
+        'totals': trivy_store.aggregate(),
+        'error': f"Falha no scan de: {', '.join(failed)}" if failed else None
+    }
+
+@app.route('/api/security/trivy/reevaluate', methods=['POST'])
+def api_trivy_reevaluate():
+    """API: Reavalia os SBOMs guardados contra o banco atual do Trivy (job)"""
+    data = request.json or {}
+    return job_response(submit_trivy_reevaluate(force=bool(data.get('force'))))
+
+def submit_trivy_reevaluate(force=False):
+    return job_manager.submit('trivy-reevaluate', 'trivy:scan-all',
+                              lambda job: trivy_reevaluate_job(job, force),
+                              params={'force': force})
+
+def trivy_reevaluate_job(job, force):
+    """Job: roda `trivy sbom` nos SBOMs guardados e lista as imagens com vulnerabilidades novas"""
+    started = time.monotonic()
+    results = trivy_scanner.reevaluate(force=force, log=job.log)
+    
+    affected = [r for r in results if not r['error'] and r['new']['total']]
+    failed = [r['image'] for r in results if r['error']]
+    seconds = round(time.monotonic() - started, 1)
+    job.log(f'Reavaliação concluída em {seconds}s: {len(results)} imagens, '
+            f'{len(affected)} com vulnerabilidades novas')
+    return {
+        'success': not failed,
+        'seconds': seconds,
+        'evaluated': len(results),
+        'affected': affected,
+        'totals': trivy_store.aggregate(),
+        'error': f"Falha ao reavaliar: {', '.join(failed)}" if failed else None
+    }
+
 @app.route('/api/security/trivy/scan-image', methods=['POST'])
 def api_trivy_scan_image():
     """API: Escanear imagem Docker específica com Trivy"""
@@ -1110,80 +1208,25 @@ def api_trivy_scan_image():
                 'error': 'Nome da imagem não fornecido'
             })
         
-        # Executar Trivy no formato JSON
-        command = f'docker exec lab-swarm1 docker run --rm aquasec/trivy:latest image --format json --severity CRITICAL,HIGH,MEDIUM,LOW {image_name}'
-        result = run_bash_command(command)
+        # Mesma imagem (digest) e mesmo banco do Trivy: resultado vem do cache
+        ttl = data.get('ttl')
+        entry = trivy_scanner.scan(image_name, force=bool(data.get('force')),
+                                   ttl=int(ttl) if ttl is not None else None)
+        page = trivy_store.query(entry['result_id'], limit=TRIVY_PAGE_SIZE)
         
-        if not result['success']:
-            return jsonify({
-                'success': False,
-                'error': result['stderr'] or 'Erro ao executar scan'
-            })
-        
-        # Parse do resultado JSON
-        try:
-            import json
-            scan_output = json.loads(result['stdout'])
-            
-            # Processar resultados
-            vulnerabilities = []
-            critical_count = 0
-            high_count = 0
-            medium_count = 0
-            low_count = 0
-            
-            # Trivy retorna uma lista de resultados (um para cada target)
-            if scan_output and 'Results' in scan_output:
-                for target in scan_output['Results']:
-                    if 'Vulnerabilities' in target and target['Vulnerabilities']:
-                        for vuln in target['Vulnerabilities']:
-                            severity = vuln.get('Severity', 'UNKNOWN')
-                            
-                            vulnerabilities.append({
-                                'id': vuln.get('VulnerabilityID', 'N/A'),
-                                'severity': severity,
-                                'title': vuln.get('Title', ''),
-                                'description': vuln.get('Description', '')[:200] if vuln.get('Description') else '',
-                                'package': vuln.get('PkgName', ''),
-                                'installed_version': vuln.get('InstalledVersion', ''),
-                                'fixed_version': vuln.get('FixedVersion', ''),
-                            })
-                            
-                            if severity == 'CRITICAL':
-                                critical_count += 1
-                            elif severity == 'HIGH':
-                                high_count += 1
-                            elif severity == 'MEDIUM':
-                                medium_count += 1
-                            elif severity == 'LOW':
-                                low_count += 1
-            
-            return jsonify({
-                'success': True,
-                'image': image_name,
-                'results': {
-                    'critical': critical_count,
-                    'high': high_count,
-                    'medium': medium_count,
-                    'low': low_count,
-                    'vulnerabilities': vulnerabilities
-                }
-            })
-            
-        except json.JSONDecodeError as e:
-            # Se não for JSON válido, retornar output raw
-            return jsonify({
-                'success': True,
-                'image': image_name,
-                'results': {
-                    'critical': 0,
-                    'high': 0,
-                    'medium': 0,
-                    'low': 0,
-                    'vulnerabilities': []
-                },
-                'raw_output': result['stdout']
-            })
+        return jsonify({
+            'success': True,
+            'image': image_name,
+            'digest': entry['digest'],
+            'db_version': entry['db_version'],
+            'scanned_at': entry['scanned_at'],
+            'cached': entry['cached'],
+            'mode': entry.get('mode'),
+            'result_id': entry['result_id'],
+            # Só a primeira página; o restante vem de /api/security/trivy/results/<id>/vulnerabilities
+            'results': dict(entry['summary'], total=page['total'], vulnerabilities=page['items'],
+                            next_cursor=page['next_cursor'])
+        })
         
     except Exception as e:
         return jsonify({
@@ -1191,26 +1234,72 @@ def api_trivy_scan_image():
             'error': str(e)
         })
 
+@app.route('/api/security/trivy/results/<result_id>/vulnerabilities')
+def api_trivy_vulnerabilities(result_id):
+    """API: Vulnerabilidades de um scan com filtro, ordenação e paginação por cursor
+    
+    Parâmetros: severity=CRITICAL,HIGH · package=openssl · fixed=1 ·
+    sort=severity|package|id · order=asc|desc · limit · cursor
+    """
+    severity = request.args.get('severity')
+    try:
+        page = trivy_store.query(
+            result_id,
+            severities=severity.split(',') if severity else None,
+            package=request.args.get('package'),
+            fixed_only=request.args.get('fixed') in ('1', 'true'),
+            sort=request.args.get('sort', 'severity'),
+            descending=request.args.get('order') == 'desc',
+            limit=min(int(request.args.get('limit', TRIVY_PAGE_SIZE)), 1000),
+            cursor=request.args.get('cursor')
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    return jsonify({'success': True, **page})
+
 @app.route('/api/security/history')
 def api_security_history():
-    """API: Histórico de scans"""
-    # Em produção, você salvaria isso em um banco de dados
-    scans = [
-        {
-            'type': 'trivy',
-            'timestamp': datetime.now().isoformat(),
-            'summary': 'Scan de imagens do sistema - 0 vulnerabilidades críticas'
-        },
-        {
-            'type': 'sonar',
-            'timestamp': datetime.now().isoformat(),
-            'summary': 'Análise de código - Quality Gate: PASSED'
-        }
-    ]
+    """API: Histórico de scans, mais recentes primeiro
+    
+    Parâmetros: type=trivy|sonar · target=<imagem ou projeto> · since/until
+    (timestamp Unix) · limit · cursor
+    """
+    try:
+        since = request.args.get('since')
+        until = request.args.get('until')
+        page = scan_history.query(
+            source=request.args.get('type'),
+            target=request.args.get('target'),
+            since=float(since) if since else None,
+            until=float(until) if until else None,
+            limit=min(int(request.args.get('limit', 50)), 500),
+            cursor=request.args.get('cursor')
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     
     return jsonify({
         'success': True,
-        'scans': scans
+        'scans': page['items'],
+        'total': page['total'],
+        'next_cursor': page['next_cursor']
+    })
+
+@app.route('/api/security/history/trends')
+def api_security_trends():
+    """API: Série diária das métricas (resumo pré-calculado)
+    
+    Parâmetros: type=trivy|sonar · target · since/until (AAAA-MM-DD)
+    """
+    return jsonify({
+        'success': True,
+        'days': scan_history.trends(
+            request.args.get('type', 'trivy'),
+            since_day=request.args.get('since'),
+            until_day=request.args.get('until'),
+            target=request.args.get('target')
+        )
     })
 
 @app.route('/api/terminal/execute', methods=['POST'])
@@ -1224,10 +1313,17 @@ def execute_terminal_command():
         if not command:
             return jsonify({'success': False, 'error': 'Comando vazio'})
         
-        # Executar localmente ou via docker exec
-        if server in ['lab-swarm1', 'lab-swarm2']:
+        # Executar via exec da Engine API ou localmente
+        if server in SWARM_NODES:
             # Executar comando dentro do container Docker (usar sh ao invés de bash)
-            full_command = f'docker exec {server} sh -c "{command}"'
+            result = docker_api.exec_run(server, ['sh', '-c', command], timeout=30)
+            output = result['stdout'] if result['stdout'] else result['stderr']
+            
+            return jsonify({
+                'success': result['success'],
+                'output': output,
+                'returncode': result['returncode']
+            })
         else:
             # Executar comando localmente (com cuidado!)
             # Validar comando para segurança
@@ -1256,7 +1352,7 @@ def execute_terminal_command():
             'returncode': result.returncode
         })
         
-    except subprocess.TimeoutExpired:
+    except (subprocess.TimeoutExpired, TimeoutError):
         return jsonify({
             'success': False,
             'error': '⏱️ Comando excedeu tempo limite de 30 segundos'
@@ -1278,12 +1374,14 @@ def ssh_connect():
         password = data.get('password', '')
         
         # Verificar se é um dos servidores Docker locais
-        if host in ['lab-swarm1', 'lab-swarm2']:
+        if host in SWARM_NODES:
             # Testar conexão com container
-            test_cmd = f'docker exec {host} echo "OK"'
-            result = subprocess.run(test_cmd, shell=True, capture_output=True, text=True)
+            try:
+                running = docker_api.inspect_container(host)['State']['Running']
+            except DockerAPIError:
+                running = False
             
-            if result.returncode == 0:
+            if running:
                 return jsonify({
                     'success': True,
                     'message': f'✅ Conectado ao {host}',
@@ -16,61 +16,23 @@ log_warning() { echo -e "${YELLOW}⚠${NC} $1"; }
 log_error()   { echo -e "${RED}✗${NC} $1"; }
 
 # ===============================
-# VERIFICA SE LAB EXISTE
+# TEARDOWN COM CONVERGÊNCIA
 # ===============================
-if ! docker ps -a | grep -q lab-swarm1; then
-    log_warning "Lab não está em execução. Nada para destruir."
-    exit 0
+# Descobre os stacks em execução, remove todos em paralelo, espera o Swarm
+# convergir (sem serviços, tasks e redes) e derruba a infraestrutura base.
+if ! command -v python3 >/dev/null 2>&1; then
+    log_error "Python 3 não encontrado"
+    exit 1
 fi
 
-# ===============================
-# REMOVER STACKS
-# ===============================
-log_info "Removendo stacks do Swarm..."
-
-STACKS=(traefik portainer jenkins sonarqube trivy)
-
-for stack in "${STACKS[@]}"; do
-    docker exec lab-swarm1 docker stack rm $stack 2>/dev/null || true
-done
-
-log_success "Stacks removidas"
-
-# ===============================
-# AGUARDAR REMOÇÃO DE SERVIÇOS
-# ===============================
-log_info "Aguardando limpeza de serviços..."
-sleep 10
-
-# ===============================
-# SAIR DO SWARM
-# ===============================
-log_info "Removendo nodes do Swarm..."
+log_info "Destruindo lab..."
 
-docker exec lab-swarm2 docker swarm leave --force 2>/dev/null || true
-docker exec lab-swarm1 docker swarm leave --force 2>/dev/null || true
+cd "$(dirname "$0")"
 
-log_success "Swarm removido"
-
-# ===============================
-# REMOVER REDES OVERLAY
-# ===============================
-log_info "Removendo redes overlay..."
-
-docker exec lab-swarm1 docker network rm traefik-public 2>/dev/null || true
-docker exec lab-swarm1 docker network rm devops-network 2>/dev/null || true
-
-log_success "Redes removidas"
-
-# ===============================
-# DERRUBAR DOCKER COMPOSE BASE
-# ===============================
-log_info "Parando infraestrutura base..."
-
-cd lab-devops
-docker compose down -v
-
-log_success "Infraestrutura base removida"
+if ! python3 -m stack_manager.teardown "$@"; then
+    log_error "Falha ao destruir o lab"
+    exit 1
+fi
 
 # ===============================
 # LIMPEZA FINAL
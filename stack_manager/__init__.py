@@ -0,0 +1,3 @@
+"""
+Stack Manager - Subsistemas internos usados pelo app Flask
+"""
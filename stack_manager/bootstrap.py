@@ -0,0 +1,237 @@
+"""
+Bootstrap do lab - etapas modeladas como DAG e executadas em paralelo
+
+Substitui o fluxo serial do subir_lab.sh: compose up, prontidão dos daemons
+dind, init/join do Swarm, redes overlay e deploy dos stacks. Etapas sem
+dependência entre si rodam ao mesmo tempo, esperas usam backoff exponencial
+em vez de sleeps fixos e cada etapa tem o tempo medido.
+
+Uso via CLI (na raiz do projeto):
+    python -m stack_manager.bootstrap [--stacks traefik,portainer]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from .docker_client import DEFAULT_SOCKET, DockerClient
+
+MANAGER = 'lab-swarm1'
+WORKER = 'lab-swarm2'
+MANAGER_ADDR = '172.31.0.11'
+COMPOSE_FILE = 'lab-devops/docker-compose.yaml'
+OVERLAY_NETWORKS = ['traefik-public', 'devops-network']
+DEFAULT_STACKS = ['traefik', 'portainer', 'jenkins', 'sonarqube', 'trivy']
+
+
+class BootstrapError(Exception):
+    """Falha de uma etapa do bootstrap"""
+
+
+class Step:
+    """Etapa do DAG: nome, função sem argumentos e nomes das dependências"""
+
+    def __init__(self, name, fn, deps=()):
+        self.name = name
+        self.fn = fn
+        self.deps = list(deps)
+
+
+def wait_until(check, timeout, description, initial=0.2, maximum=2.0):
+    """Repete `check()` com backoff exponencial até retornar verdadeiro ou estourar o prazo"""
+    deadline = time.monotonic() + timeout
+    delay = initial
+    while True:
+        try:
+            if check():
+                return
+        except Exception:
+            pass
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise BootstrapError(f'Tempo esgotado aguardando {description}')
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, maximum)
+
+
+def run_dag(steps, max_workers=8, log=print, stop_on_failure=True):
+    """Executa as etapas respeitando dependências; retorna o relatório por etapa
+
+    Com stop_on_failure=False as dependências só definem a ordem: etapas
+    seguem mesmo se uma anterior falhar (útil para teardown best-effort).
+    """
+    report = {s.name: {'name': s.name, 'status': 'pending', 'seconds': None, 'error': None} for s in steps}
+    started = time.monotonic()
+
+    def execute(step):
+        t0 = time.monotonic()
+        log(f'▶ {step.name}')
+        try:
+            step.fn()
+            report[step.name]['status'] = 'succeeded'
+            log(f'✓ {step.name} ({time.monotonic() - t0:.1f}s)')
+        except Exception as e:
+            report[step.name]['status'] = 'failed'
+            report[step.name]['error'] = str(e)
+            log(f'✗ {step.name}: {e}')
+        report[step.name]['seconds'] = round(time.monotonic() - t0, 2)
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='bootstrap') as pool:
+        running = {}
+        while True:
+            for step in steps:
+                if report[step.name]['status'] != 'pending':
+                    continue
+                dep_status = [report[d]['status'] for d in step.deps]
+                finished = ('succeeded',) if stop_on_failure else ('succeeded', 'failed', 'skipped')
+                if stop_on_failure and any(s in ('failed', 'skipped') for s in dep_status):
+                    report[step.name]['status'] = 'skipped'
+                    report[step.name]['error'] = 'dependência falhou'
+                elif all(s in finished for s in dep_status):
+                    report[step.name]['status'] = 'running'
+                    running[pool.submit(execute, step)] = step.name
+
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                del running[future]
+
+    steps_report = [report[s.name] for s in steps]
+    return {
+        'success': all(r['status'] == 'succeeded' for r in steps_report),
+        'seconds': round(time.monotonic() - started, 2),
+        'steps': steps_report
+    }
+
+
+class LabBootstrap:
+    """Monta e executa o DAG de inicialização do lab"""
+
+    def __init__(self, docker_api, base_dir='.', stacks=None, log=print, timeout=120):
+        self.docker = docker_api
+        self.base_dir = base_dir
+        self.stacks = stacks or DEFAULT_STACKS
+        self.log = log
+        self.timeout = timeout
+
+    # ----- helpers -----
+
+    def _exec(self, node, args, timeout=60):
+        return self.docker.exec_run(node, args, timeout=timeout)
+
+    def _check(self, node, args, error):
+        result = self._exec(node, args)
+        if not result['success']:
+            raise BootstrapError(f"{error}: {result['stderr'].strip() or result['stdout'].strip()}")
+        return result['stdout'].strip()
+
+    def _swarm_state(self, node):
+        result = self._exec(node, ['docker', 'info', '--format', '{{.Swarm.LocalNodeState}}'], timeout=10)
+        return result['stdout'].strip() if result['success'] else ''
+
+    # ----- etapas -----
+
+    def preflight(self):
+        required = [COMPOSE_FILE, 'lab-devops/haproxy/haproxy.cfg']
+        required += [f'stacks/{name}-stack.yaml' for name in self.stacks]
+        missing = [p for p in required if not os.path.exists(os.path.join(self.base_dir, p))]
+        if missing:
+            raise BootstrapError(f"Arquivos não encontrados: {', '.join(missing)}")
+
+    def compose_up(self):
+        process = subprocess.Popen(
+            ['docker', 'compose', '-f', COMPOSE_FILE, 'up', '-d'],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            cwd=self.base_dir
+        )
+        for line in process.stdout:
+            self.log(line.rstrip('\n'))
+        if process.wait() != 0:
+            raise BootstrapError('docker compose up falhou')
+
+    def wait_daemon(self, node):
+        def ready():
+            return self._exec(node, ['docker', 'version', '--format', '{{.Server.Version}}'], timeout=10)['success']
+        wait_until(ready, self.timeout, f'Docker interno de {node}')
+
+    def swarm_init(self):
+        if self._swarm_state(MANAGER) != 'active':
+            self._check(MANAGER, ['docker', 'swarm', 'init', '--advertise-addr', MANAGER_ADDR],
+                        'Falha no swarm init')
+        wait_until(lambda: self._swarm_state(MANAGER) == 'active', self.timeout, 'Swarm ativo')
+
+    def swarm_join(self):
+        if self._swarm_state(WORKER) == 'active':
+            return
+        token = self._check(MANAGER, ['docker', 'swarm', 'join-token', '-q', 'worker'],
+                            'Falha ao obter token do worker')
+        self._check(WORKER, ['docker', 'swarm', 'join', '--token', token, f'{MANAGER_ADDR}:2377'],
+                    'Falha no swarm join')
+
+    def create_network(self, name):
+        if self._exec(MANAGER, ['docker', 'network', 'inspect', name], timeout=10)['success']:
+            return
+        self._check(MANAGER, ['docker', 'network', 'create', '--driver', 'overlay', name],
+                    f'Falha ao criar rede {name}')
+
+    def deploy_stack(self, name):
+        self._check(MANAGER, ['docker', 'stack', 'deploy', '-c', f'/stacks/{name}-stack.yaml', name],
+                    f'Falha no deploy de {name}')
+
+    def steps(self):
+        """DAG: preflight → compose → daemons → swarm → redes → stacks"""
+        steps = [
+            Step('preflight', self.preflight),
+            Step('compose-up', self.compose_up, ['preflight']),
+            Step(f'daemon:{MANAGER}', lambda: self.wait_daemon(MANAGER), ['compose-up']),
+            Step(f'daemon:{WORKER}', lambda: self.wait_daemon(WORKER), ['compose-up']),
+            Step('swarm-init', self.swarm_init, [f'daemon:{MANAGER}']),
+            Step('swarm-join', self.swarm_join, ['swarm-init', f'daemon:{WORKER}']),
+        ]
+        for network in OVERLAY_NETWORKS:
+            steps.append(Step(f'network:{network}', lambda n=network: self.create_network(n), ['swarm-init']))
+        for name in self.stacks:
+            steps.append(Step(f'stack:{name}', lambda n=name: self.deploy_stack(n),
+                              [f'network:{n}' for n in OVERLAY_NETWORKS]))
+        return steps
+
+    def run(self):
+        return run_dag(self.steps(), log=self.log)
+
+
+def format_report(report):
+    """Resumo textual das etapas com os tempos"""
+    lines = [f"{'Etapa':<28} {'Status':<10} Tempo"]
+    for step in report['steps']:
+        seconds = f"{step['seconds']:.1f}s" if step['seconds'] is not None else '-'
+        lines.append(f"{step['name']:<28} {step['status']:<10} {seconds}")
+    lines.append(f"Total: {report['seconds']:.1f}s")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Inicializa o lab DevOps em paralelo')
+    parser.add_argument('--stacks', default=','.join(DEFAULT_STACKS),
+                        help='stacks para deploy, separados por vírgula')
+    parser.add_argument('--socket', default=os.getenv('DOCKER_SOCKET', DEFAULT_SOCKET))
+    parser.add_argument('--timeout', type=float, default=120,
+                        help='prazo em segundos para cada espera de prontidão')
+    args = parser.parse_args(argv)
+
+    bootstrap = LabBootstrap(
+        DockerClient(args.socket),
+        stacks=[s for s in args.stacks.split(',') if s],
+        timeout=args.timeout
+    )
+    report = bootstrap.run()
+    print(format_report(report))
+    return 0 if report['success'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
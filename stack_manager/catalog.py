@@ -0,0 +1,239 @@
+"""
+Catálogo de stacks - mantém os metadados dos arquivos YAML em memória
+
+Os arquivos de STACKS_DIR só são re-parseados quando mudam: cada entrada é
+indexada pelo caminho e validada por (mtime, tamanho) e, se o stat mudar,
+pelo hash do conteúdo. Consultas por nome, porta e serviço usam índices em
+dicionário, sem varrer a lista de stacks. Arquivos gerados pelo Stack Manager
+também são lidos de volta como StackSpec (`spec`).
+"""
+import hashlib
+import os
+import threading
+import time
+
+import yaml
+
+from .stack_spec import StackSpec
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+
+def stack_name_from_file(file):
+    """Deriva o nome do stack a partir do nome do arquivo"""
+    return file.replace('-stack.yaml', '').replace('.yaml', '')
+
+
+def _append_unique(values, value):
+    if value not in values:
+        values.append(value)
+
+
+def parse_stack_content(stack_name, content):
+    """Extrai serviços, imagens, portas publicadas e URLs do Traefik de um compose já carregado"""
+    info = {'services': [], 'images': [], 'ports': [], 'urls': []}
+
+    if not content or 'services' not in content:
+        return info
+
+    info['services'] = list(content['services'].keys())
+
+    for service_name, service_config in content['services'].items():
+        service_config = service_config or {}
+
+        if service_config.get('image'):
+            _append_unique(info['images'], service_config['image'])
+
+        # Extrair URLs dos labels do Traefik (exceto para Portainer que usa porta direta)
+        if 'deploy' in service_config and 'labels' in service_config['deploy'] and stack_name != 'portainer':
+            path_prefix = None
+            host_rule = None
+
+            for label in service_config['deploy']['labels']:
+                if 'traefik.http.routers.' in label and '.rule=' in label:
+                    rule_value = label.split('=', 1)[1] if '=' in label else ''
+
+                    # PathPrefix
+                    if 'PathPrefix(' in rule_value:
+                        path_prefix = rule_value.split('`')[1] if '`' in rule_value else None
+                    # Host
+                    elif 'Host(' in rule_value:
+                        host_rule = rule_value.split('`')[1] if '`' in rule_value else None
+
+            # Construir URL baseada nas regras do Traefik
+            if path_prefix:
+                _append_unique(info['urls'], f"http://localhost:8080{path_prefix}")
+            elif host_rule:
+                _append_unique(info['urls'], f"http://{host_rule}")
+
+        # Extrair portas publicadas
+        for port in service_config.get('ports', []):
+            # Novo formato: dict com target/published/mode
+            if isinstance(port, dict):
+                if 'published' in port:
+                    _append_unique(info['ports'], str(port['published']))
+            # Formato antigo: string "host:container"
+            elif isinstance(port, str) and ':' in port:
+                _append_unique(info['ports'], port.split(':')[0])
+            # Formato simples: apenas número
+            elif isinstance(port, (int, str)):
+                _append_unique(info['ports'], str(port))
+
+    return info
+
+
+class StackCatalog:
+    """Índice em memória dos stacks disponíveis, atualizado por varredura de stat"""
+
+    def __init__(self, stacks_dir, sweep_interval=1.0):
+        self.stacks_dir = stacks_dir
+        self.sweep_interval = sweep_interval
+        self.version = 0
+        self._lock = threading.RLock()
+        self._entries = {}
+        self._last_sweep = 0.0
+        self._sorted = []
+        self._by_name = {}
+        self._specs = {}
+        self._by_port = {}
+        self._by_service = {}
+
+    def _parse(self, path, stack_name, raw):
+        """Faz o parse de um arquivo; erros de YAML resultam em stack sem serviços
+
+        Retorna (info, spec); spec é None para stacks que não seguem o modelo.
+        """
+        info = {
+            'name': stack_name,
+            'file': os.path.basename(path),
+            'path': path,
+            'images': [],
+            'ports': [],
+            'urls': []
+        }
+        spec = None
+        try:
+            content = yaml.load(raw, Loader=SafeLoader)
+            info.update(parse_stack_content(stack_name, content))
+            spec = StackSpec.from_compose(stack_name, content)
+        except Exception:
+            info['services'] = []
+        return info, spec
+
+    def _sweep(self):
+        """Compara o diretório com o índice e re-parseia apenas o que mudou"""
+        changed = False
+        seen = set()
+
+        if os.path.exists(self.stacks_dir):
+            for dir_entry in os.scandir(self.stacks_dir):
+                file = dir_entry.name
+                if not (file.endswith('.yaml') or file.endswith('.yml')):
+                    continue
+
+                path = os.path.join(self.stacks_dir, file)
+                try:
+                    stat = dir_entry.stat()
+                except OSError:
+                    continue
+                seen.add(path)
+
+                key = (stat.st_mtime_ns, stat.st_size)
+                entry = self._entries.get(path)
+                if entry and entry['key'] == key:
+                    continue
+
+                try:
+                    with open(path, 'rb') as f:
+                        raw = f.read()
+                except OSError:
+                    seen.discard(path)
+                    continue
+
+                digest = hashlib.sha1(raw).hexdigest()
+                if entry and entry['hash'] == digest:
+                    # Apenas o stat mudou (touch, cópia); conteúdo idêntico
+                    entry['key'] = key
+                    continue
+
+                info, spec = self._parse(path, stack_name_from_file(file), raw)
+                self._entries[path] = {'key': key, 'hash': digest, 'info': info, 'spec': spec}
+                changed = True
+
+        for path in list(self._entries):
+            if path not in seen:
+                del self._entries[path]
+                changed = True
+
+        if changed:
+            self._rebuild_indexes()
+            self.version += 1
+
+        self._last_sweep = time.monotonic()
+        return changed
+
+    def _rebuild_indexes(self):
+        by_name = {}
+        by_port = {}
+        by_service = {}
+        specs = {}
+
+        for entry in self._entries.values():
+            info = entry['info']
+            by_name[info['name']] = info
+            specs[info['name']] = entry['spec']
+            for port in info['ports']:
+                by_port.setdefault(port, []).append(info['name'])
+            for service in info.get('services', []):
+                by_service.setdefault(service, []).append(info['name'])
+
+        self._by_name = by_name
+        self._specs = specs
+        self._by_port = by_port
+        self._by_service = by_service
+        self._sorted = sorted(by_name.values(), key=lambda x: x['name'])
+
+    def refresh(self, force=False):
+        """Executa a varredura se o intervalo mínimo já passou (ou se forçada)"""
+        with self._lock:
+            if force or time.monotonic() - self._last_sweep >= self.sweep_interval:
+                return self._sweep()
+            return False
+
+    def invalidate(self):
+        """Força nova varredura na próxima consulta (usar após escrever arquivos)"""
+        with self._lock:
+            self._last_sweep = 0.0
+
+    def list(self):
+        """Lista todos os stacks ordenados por nome"""
+        self.refresh()
+        return list(self._sorted)
+
+    def get(self, name):
+        """Retorna o stack pelo nome ou None"""
+        self.refresh()
+        return self._by_name.get(name)
+
+    def spec(self, name):
+        """StackSpec do stack (None se não existir ou não seguir o modelo)"""
+        self.refresh()
+        return self._specs.get(name)
+
+    def find_by_port(self, port):
+        """Nomes dos stacks que publicam a porta informada"""
+        self.refresh()
+        return list(self._by_port.get(str(port), []))
+
+    def find_by_service(self, service):
+        """Nomes dos stacks que definem o serviço informado"""
+        self.refresh()
+        return list(self._by_service.get(service, []))
+
+    def used_ports(self):
+        """Conjunto de portas publicadas por todos os stacks"""
+        self.refresh()
+        return {int(p) for p in self._by_port if str(p).isdigit()}
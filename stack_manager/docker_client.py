@@ -0,0 +1,279 @@
+"""
+Cliente da Docker Engine API via socket Unix
+
+Fala HTTP direto com /var/run/docker.sock usando conexões keep-alive
+reaproveitadas, sem criar processos do docker CLI. Comandos dentro dos nodes
+dind (lab-swarm1/lab-swarm2) rodam pelos endpoints /exec, com stdout e stderr
+separados a partir do stream multiplexado do Docker.
+"""
+import http.client
+import json
+import queue
+import socket
+import struct
+import time
+from urllib.parse import quote, urlencode
+
+DEFAULT_SOCKET = '/var/run/docker.sock'
+
+STREAM_NAMES = {1: 'stdout', 2: 'stderr'}
+EXIT_CODE_WAIT = 5
+
+
+def split_lines(frames):
+    """(stream, bytes) -> (stream, linha) completas, preservando a ordem de chegada
+
+    Uma linha pode vir dividida em vários frames; o resto sem quebra de linha
+    do fim de cada stream sai como última linha.
+    """
+    pending = {'stdout': b'', 'stderr': b''}
+    for stream, payload in frames:
+        pending[stream] += payload
+        *complete, pending[stream] = pending[stream].split(b'\n')
+        for line in complete:
+            yield stream, line.decode('utf-8', errors='replace')
+    for stream, rest in pending.items():
+        if rest:
+            yield stream, rest.decode('utf-8', errors='replace')
+
+
+class DockerAPIError(Exception):
+    """Erro retornado pela Docker Engine API"""
+
+    def __init__(self, status, message):
+        super().__init__(f'{status}: {message}')
+        self.status = status
+        self.message = message
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTPConnection que conecta num socket Unix em vez de TCP"""
+
+    def __init__(self, socket_path, timeout=None):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+
+class ExecStream:
+    """Saída de um exec em andamento, lida frame a frame do stream multiplexado"""
+
+    def __init__(self, client, exec_id, conn, response, deadline=None):
+        self.client = client
+        self.id = exec_id
+        self._conn = conn
+        self._response = response
+        self._deadline = deadline
+
+    def _read_exact(self, size):
+        data = b''
+        while len(data) < size:
+            if self._deadline and time.monotonic() > self._deadline:
+                raise TimeoutError('exec excedeu o tempo limite')
+            chunk = self._response.read(size - len(data))
+            if not chunk:
+                break
+            data += chunk
+        return data
+
+    def __iter__(self):
+        """Gera tuplas (stream, bytes) conforme o processo escreve"""
+        try:
+            while True:
+                header = self._read_exact(8)
+                if len(header) < 8:
+                    return
+                stream_type, size = struct.unpack('>BxxxL', header)
+                payload = self._read_exact(size)
+                yield STREAM_NAMES.get(stream_type, 'stdout'), payload
+        finally:
+            self.close()
+
+    def lines(self):
+        """Gera tuplas (stream, linha) completas, preservando a ordem de chegada"""
+        return split_lines(self)
+
+    def exit_code(self, wait=EXIT_CODE_WAIT):
+        """Código de saída do processo
+
+        O fim do stream pode chegar antes de o daemon registrar a saída do
+        processo, então consulta até `Running` ficar falso (por até `wait`
+        segundos). None se o processo continuar rodando.
+        """
+        deadline = time.monotonic() + wait
+        delay = 0.01
+        while True:
+            info = self.client.exec_inspect(self.id)
+            if not info.get('Running'):
+                return info.get('ExitCode')
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(delay)
+            delay = min(delay * 2, 0.2)
+
+    def close(self):
+        if self._conn:
+            self._conn.close()
+            self._conn = None
+
+
+class DockerClient:
+    """Cliente mínimo da Engine API com pool de conexões keep-alive"""
+
+    def __init__(self, socket_path=DEFAULT_SOCKET, timeout=30, pool_size=4):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+
+    # ----- conexões -----
+
+    def _acquire(self, timeout=None):
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            return UnixHTTPConnection(self.socket_path, timeout=timeout or self.timeout), False
+        conn.timeout = timeout or self.timeout
+        if conn.sock:
+            conn.sock.settimeout(conn.timeout)
+        return conn, True
+
+    def _release(self, conn):
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def _send(self, method, path, params=None, body=None, timeout=None):
+        """Envia a requisição; reabre a conexão se a reaproveitada tiver expirado"""
+        if params:
+            path = f'{path}?{urlencode(params)}'
+        headers = {'Host': 'docker'}
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode()
+            headers['Content-Type'] = 'application/json'
+
+        conn, reused = self._acquire(timeout)
+        try:
+            conn.request(method, path, body=payload, headers=headers)
+            return conn, conn.getresponse()
+        except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+            conn.close()
+            if not reused:
+                raise
+            conn = UnixHTTPConnection(self.socket_path, timeout=timeout or self.timeout)
+            conn.request(method, path, body=payload, headers=headers)
+            return conn, conn.getresponse()
+        except Exception:
+            conn.close()
+            raise
+
+    def request(self, method, path, params=None, body=None, timeout=None):
+        """Executa uma chamada e retorna o corpo decodificado (JSON quando houver)"""
+        conn, response = self._send(method, path, params, body, timeout)
+        try:
+            data = response.read()
+        except Exception:
+            conn.close()
+            raise
+
+        if response.will_close:
+            conn.close()
+        else:
+            self._release(conn)
+
+        if response.status >= 400:
+            try:
+                message = json.loads(data).get('message', '')
+            except ValueError:
+                message = data.decode('utf-8', errors='replace')
+            raise DockerAPIError(response.status, message)
+
+        if data and 'json' in (response.getheader('Content-Type') or ''):
+            return json.loads(data)
+        return data
+
+    # ----- endpoints -----
+
+    def ping(self):
+        """Retorna True se o daemon responde em /_ping"""
+        try:
+            return self.request('GET', '/_ping', timeout=5) == b'OK'
+        except (OSError, DockerAPIError, http.client.HTTPException):
+            return False
+
+    def inspect_container(self, name):
+        """Detalhes do container (GET /containers/{name}/json)"""
+        return self.request('GET', f'/containers/{quote(name)}/json')
+
+    def kill_container(self, name, signal='SIGKILL'):
+        """Envia um sinal ao processo principal do container"""
+        self.request('POST', f'/containers/{quote(name)}/kill', params={'signal': signal})
+
+    def exec_inspect(self, exec_id):
+        return self.request('GET', f'/exec/{exec_id}/json')
+
+    def exec_start(self, container, cmd, env=None, workdir=None, timeout=None):
+        """Cria e inicia um exec no container; retorna um ExecStream com a saída"""
+        config = {
+            'Cmd': cmd,
+            'AttachStdout': True,
+            'AttachStderr': True,
+            'Tty': False
+        }
+        if env:
+            config['Env'] = [f'{k}={v}' for k, v in env.items()]
+        if workdir:
+            config['WorkingDir'] = workdir
+
+        exec_id = self.request('POST', f'/containers/{quote(container)}/exec', body=config)['Id']
+
+        # O start sequestra a conexão até o processo terminar, então ela não volta ao pool
+        conn, response = self._send('POST', f'/exec/{exec_id}/start',
+                                    body={'Detach': False, 'Tty': False}, timeout=timeout)
+        if response.status >= 400:
+            data = response.read()
+            conn.close()
+            raise DockerAPIError(response.status, data.decode('utf-8', errors='replace'))
+
+        deadline = time.monotonic() + timeout if timeout else None
+        return ExecStream(self, exec_id, conn, response, deadline)
+
+    def exec_run(self, container, cmd, env=None, workdir=None, timeout=None, on_line=None):
+        """Executa um comando até o fim e retorna stdout, stderr e código de saída
+
+        Com `on_line`, cada linha é repassada como on_line(stream, linha) assim
+        que chega. O resultado traz a saída exatamente como foi escrita.
+        """
+        stream = self.exec_start(container, cmd, env=env, workdir=workdir, timeout=timeout)
+        output = {'stdout': [], 'stderr': []}
+
+        def frames():
+            for name, payload in stream:
+                output[name].append(payload)
+                yield name, payload
+
+        try:
+            if on_line:
+                for name, line in split_lines(frames()):
+                    on_line(name, line)
+            else:
+                for _ in frames():
+                    pass
+        except socket.timeout:
+            raise TimeoutError('exec excedeu o tempo limite')
+        stdout = b''.join(output['stdout']).decode('utf-8', errors='replace')
+        stderr = b''.join(output['stderr']).decode('utf-8', errors='replace')
+
+        returncode = stream.exit_code()
+        return {
+            'success': returncode == 0,
+            'stdout': stdout,
+            'stderr': stderr,
+            'returncode': returncode
+        }
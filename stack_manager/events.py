@@ -0,0 +1,105 @@
+"""
+Canal de eventos (Server-Sent Events) para o dashboard
+
+Os produtores (catálogo, coletor do Swarm, métricas de segurança) publicam o
+estado completo de cada tópico; o broker calcula o delta em relação ao
+estado anterior e só emite um evento quando algo mudou. Todos os clientes
+conectados leem do mesmo log em memória, então o custo no servidor não cresce
+com o número de dashboards abertos.
+"""
+import json
+import threading
+from collections import deque
+
+
+def diff_state(old, new, key='name'):
+    """Delta entre dois estados: listas são comparadas por `key`, dicts por chave"""
+    if isinstance(new, list):
+        old_items = {item[key]: item for item in (old or [])}
+        new_items = {item[key]: item for item in new}
+        upsert = [item for name, item in new_items.items() if old_items.get(name) != item]
+        remove = [name for name in old_items if name not in new_items]
+        if not upsert and not remove:
+            return None
+        return {'upsert': upsert, 'remove': remove}
+
+    old = old or {}
+    changed = {k: v for k, v in new.items() if old.get(k) != v}
+    removed = [k for k in old if k not in new]
+    if not changed and not removed:
+        return None
+    return {'changed': changed, 'removed': removed}
+
+
+def format_sse(event, data, event_id=None):
+    """Serializa um evento no formato text/event-stream"""
+    message = ''
+    if event_id is not None:
+        message += f'id: {event_id}\n'
+    message += f'event: {event}\n'
+    message += f'data: {json.dumps(data)}\n\n'
+    return message
+
+
+class EventBroker:
+    """Mantém o estado atual por tópico e um log curto de deltas para os clientes"""
+
+    def __init__(self, history=500):
+        self._cond = threading.Condition()
+        self._seq = 0
+        self._log = deque(maxlen=history)
+        self._state = {}
+
+    def set_state(self, topic, state):
+        """Atualiza o estado do tópico e publica o delta; retorna o id ou None"""
+        with self._cond:
+            delta = diff_state(self._state.get(topic), state)
+            if delta is None:
+                return None
+            self._state[topic] = state
+            self._seq += 1
+            self._log.append((self._seq, topic, delta))
+            self._cond.notify_all()
+            return self._seq
+
+    def snapshot(self):
+        """Retorna (último id, estado completo de todos os tópicos)"""
+        with self._cond:
+            return self._seq, dict(self._state)
+
+    def events_after(self, last_id, timeout=None):
+        """Eventos com id > last_id; None se o log não cobre mais esse ponto"""
+        with self._cond:
+            if last_id > self._seq:
+                # Id de outra execução do servidor
+                return None
+            if self._seq == last_id:
+                self._cond.wait(timeout)
+            if self._log and self._log[0][0] > last_id + 1:
+                return None
+            return [event for event in self._log if event[0] > last_id]
+
+    def stream(self, last_id=None, heartbeat=15):
+        """Gerador SSE: snapshot inicial (ou replay desde last_id) e depois deltas"""
+        events = self.events_after(last_id, 0) if last_id is not None else None
+        if events is None:
+            last_id, state = self.snapshot()
+            yield format_sse('snapshot', state, last_id)
+        else:
+            for event_id, topic, delta in events:
+                yield format_sse(topic, delta, event_id)
+                last_id = event_id
+
+        while True:
+            events = self.events_after(last_id, heartbeat)
+            if events is None:
+                # Cliente ficou para trás do log: reenviar o estado completo
+                last_id, state = self.snapshot()
+                yield format_sse('snapshot', state, last_id)
+                continue
+            if not events:
+                yield ': ping\n\n'
+                continue
+            for event_id, topic, delta in events:
+                yield format_sse(topic, delta, event_id)
+                last_id = event_id
@@ -0,0 +1,368 @@
+"""
+Controle do HAProxy sem derrubar conexões - Runtime API e reload gracioso
+
+O lab-haproxy roda em modo master-worker. Mudanças que só mexem em servidores
+de backends existentes (adicionar, remover, peso, endereço, ativar/colocar em
+manutenção) são aplicadas pela Runtime API, sem reload. Como as portas das
+faixas já têm backends com slots pré-alocados (ver haproxy_config), rotear ou
+remover um stack cai nesse caminho. Mudanças estruturais (frontends, backends, opções)
+usam reload gracioso: o master recebe SIGUSR2, sobe novos workers com a
+configuração nova e os antigos terminam as conexões em andamento (semântica
+do `-sf`). Nos dois caminhos a configuração candidata passa antes por
+`haproxy -c`, então um arquivo inválido nunca chega ao proxy em execução.
+
+Alterações são enfileiradas no ReloadQueue: tudo que chega dentro de uma
+janela curta é aplicado sobre o modelo do arquivo numa única escrita e num
+único reload, com o arquivo travado contra escritas concorrentes.
+"""
+import fcntl
+import os
+import socket
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+from .docker_client import DockerAPIError
+from .haproxy_config import HAProxyConfig
+
+
+class HAProxyError(Exception):
+    """Falha ao validar ou aplicar a configuração do HAProxy"""
+
+
+class HAProxyRuntime:
+    """Cliente da Runtime API (stats socket em modo admin)
+
+    `address` é 'host:porta' (TCP) ou o caminho de um socket Unix.
+    """
+
+    def __init__(self, address, timeout=5):
+        if '/' in address:
+            self.family, self.address = socket.AF_UNIX, address
+        else:
+            host, _, port = address.rpartition(':')
+            self.family, self.address = socket.AF_INET, (host, int(port))
+        self.timeout = timeout
+
+    def _connect(self):
+        if self.family == socket.AF_INET:
+            return socket.create_connection(self.address, timeout=self.timeout)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.address)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def execute(self, command):
+        """Envia um comando (ou vários separados por ';') e retorna a resposta"""
+        with self._connect() as sock:
+            sock.sendall(command.encode() + b'\n')
+            chunks = []
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+        return b''.join(chunks).decode('utf-8', errors='replace')
+
+    def available(self):
+        try:
+            return 'Pid:' in self.execute('show info')
+        except OSError:
+            return False
+
+    def pid(self):
+        for line in self.execute('show info').splitlines():
+            if line.startswith('Pid:'):
+                return line.split(':', 1)[1].strip()
+        return None
+
+
+def _is_server(line):
+    return line.startswith('server ') or line.startswith('server-template ')
+
+
+def _servers(body):
+    """Linhas 'server' e 'server-template' de um backend: {nome: (endereço, [parâmetros])}
+
+    `server-template slot 2 addr ...` equivale a slot1 e slot2 com o mesmo endereço.
+    """
+    servers = {}
+    for line in body:
+        parts = line.split()
+        if parts[0] == 'server' and len(parts) >= 3:
+            servers[parts[1]] = (parts[2], parts[3:])
+        elif parts[0] == 'server-template' and len(parts) >= 4:
+            first, _, last = parts[2].partition('-')
+            for n in range(int(first) if last else 1, int(last or first) + 1):
+                servers[f'{parts[1]}{n}'] = (parts[3], parts[4:])
+    return servers
+
+
+def _without(params, keyword):
+    """Remove `keyword <valor>` da lista de parâmetros"""
+    result = []
+    skip = False
+    for param in params:
+        if skip:
+            skip = False
+        elif param == keyword:
+            skip = True
+        else:
+            result.append(param)
+    return result
+
+
+def _value(params, keyword, default=None):
+    if keyword in params and params.index(keyword) + 1 < len(params):
+        return params[params.index(keyword) + 1]
+    return default
+
+
+def runtime_operations(old_text, new_text):
+    """Comandos da Runtime API que levam de `old_text` a `new_text`
+
+    Retorna None quando a mudança é estrutural e exige reload, ou a lista de
+    comandos (possivelmente vazia) quando só servidores mudaram.
+    """
+    old_sections = HAProxyConfig.parse(old_text).sections
+    new_sections = HAProxyConfig.parse(new_text).sections
+    if [s.header for s in old_sections] != [s.header for s in new_sections]:
+        return None
+
+    commands = []
+    for old_section, new_section in zip(old_sections, new_sections):
+        old_body, new_body = old_section.directives, new_section.directives
+        if old_body == new_body:
+            continue
+        if old_section.kind != 'backend':
+            return None
+        if [l for l in old_body if not _is_server(l)] != [l for l in new_body if not _is_server(l)]:
+            return None
+
+        backend = old_section.name
+        old_servers, new_servers = _servers(old_body), _servers(new_body)
+
+        for name in old_servers.keys() - new_servers.keys():
+            commands += [f'disable server {backend}/{name}', f'del server {backend}/{name}']
+
+        for name, (addr, params) in new_servers.items():
+            if name not in old_servers:
+                commands.append(f'add server {backend}/{name} {addr} {" ".join(params)}'.rstrip())
+                if 'check' in params:
+                    commands.append(f'enable health {backend}/{name}')
+                commands.append(f'enable server {backend}/{name}')
+                continue
+
+            old_addr, old_params = old_servers[name]
+            was_disabled, disabled = 'disabled' in old_params, 'disabled' in params
+            if ([p for p in _without(old_params, 'weight') if p != 'disabled'] !=
+                    [p for p in _without(params, 'weight') if p != 'disabled']):
+                return None
+            if disabled and not was_disabled:
+                # Slot liberado: sai do balanceamento; o endereço antigo não importa mais
+                commands.append(f'set server {backend}/{name} state maint')
+                continue
+            if old_addr != addr:
+                host, _, port = addr.rpartition(':')
+                commands.append(f'set server {backend}/{name} addr {host} port {port}')
+            if _value(old_params, 'weight', '1') != _value(params, 'weight', '1'):
+                commands.append(f'set server {backend}/{name} weight {_value(params, "weight", "1")}')
+            if was_disabled and not disabled:
+                commands.append(f'set server {backend}/{name} state ready')
+
+    return commands
+
+
+class HAProxyController:
+    """Valida e aplica configurações no container do HAProxy sem recriá-lo"""
+
+    def __init__(self, docker_api, container, cfg_path, container_cfg_path, runtime, reload_timeout=15):
+        self.docker = docker_api
+        self.container = container
+        self.cfg_path = cfg_path
+        self.container_cfg_path = container_cfg_path
+        self.runtime = runtime
+        self.reload_timeout = reload_timeout
+        self._lock = threading.RLock()
+        self._lock_depth = 0
+
+    @contextmanager
+    def locked(self):
+        """Trava o haproxy.cfg entre threads e entre processos (flock)"""
+        with self._lock:
+            # Reentrante: só a chamada mais externa segura o flock
+            if self._lock_depth:
+                self._lock_depth += 1
+                try:
+                    yield
+                finally:
+                    self._lock_depth -= 1
+                return
+            with open(f'{self.cfg_path}.lock', 'w') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                self._lock_depth = 1
+                try:
+                    yield
+                finally:
+                    self._lock_depth = 0
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def read(self):
+        with open(self.cfg_path, 'r') as f:
+            return f.read()
+
+    def validate(self, candidate_path):
+        """Roda `haproxy -c` no próprio container; retorna (ok, mensagem)"""
+        name = os.path.basename(candidate_path)
+        path = os.path.join(os.path.dirname(self.container_cfg_path), name)
+        try:
+            result = self.docker.exec_run(self.container, ['haproxy', '-c', '-f', path], timeout=30)
+        except (OSError, DockerAPIError) as e:
+            return False, str(e)
+        return result['success'], (result['stdout'] + result['stderr']).strip()
+
+    def reload(self):
+        """Reload gracioso: SIGUSR2 no master, que troca os workers sem derrubar conexões"""
+        try:
+            old_pid = self.runtime.pid()
+        except OSError:
+            old_pid = None
+
+        self.docker.kill_container(self.container, 'SIGUSR2')
+
+        deadline = time.monotonic() + self.reload_timeout
+        while time.monotonic() < deadline:
+            try:
+                pid = self.runtime.pid()
+                if pid and pid != old_pid:
+                    return
+            except OSError:
+                pass
+            time.sleep(0.2)
+        raise HAProxyError('HAProxy não confirmou o reload dentro do prazo')
+
+    def _apply_runtime(self, commands):
+        for command in commands:
+            response = self.runtime.execute(command).strip()
+            # A Runtime API responde vazio ou com mensagens informativas em caso de sucesso
+            if response and any(word in response.lower() for word in ('unknown', 'error', 'cannot', 'not found', 'require')):
+                raise HAProxyError(f'{command}: {response}')
+
+    def apply(self, new_text):
+        """Valida e aplica a nova configuração
+
+        Retorna {'success', 'method': 'none'|'runtime'|'reload', 'error'}.
+        """
+        with self.locked():
+            return self._apply(new_text)
+
+    def _apply(self, new_text):
+        current = self.read()
+        if new_text == current:
+            return {'success': True, 'method': 'none', 'error': None}
+
+        candidate = f'{self.cfg_path}.new'
+        with open(candidate, 'w') as f:
+            f.write(new_text)
+
+        valid, message = self.validate(candidate)
+        if not valid:
+            os.remove(candidate)
+            return {'success': False, 'method': 'none', 'error': f'Configuração inválida: {message}'}
+
+        os.replace(candidate, self.cfg_path)
+
+        commands = runtime_operations(current, new_text)
+        if commands is not None and self.runtime.available():
+            try:
+                self._apply_runtime(commands)
+                return {'success': True, 'method': 'runtime', 'error': None}
+            except (OSError, HAProxyError) as e:
+                print(f'Runtime API falhou, usando reload: {e}')
+
+        try:
+            self.reload()
+        except (OSError, DockerAPIError, HAProxyError) as e:
+            return {'success': False, 'method': 'reload', 'error': str(e)}
+        return {'success': True, 'method': 'reload', 'error': None}
+
+    def published_ports(self):
+        """Portas publicadas no host com o mesmo número dentro do container (ex.: 8084:8084)"""
+        info = self.docker.inspect_container(self.container)
+        bindings = info.get('HostConfig', {}).get('PortBindings') or {}
+        ports = set()
+        for container_port, mappings in bindings.items():
+            port = int(container_port.split('/')[0])
+            if any(m.get('HostPort') == str(port) for m in mappings or []):
+                ports.add(port)
+        return ports
+
+
+class ReloadQueue:
+    """Fila de alterações com debounce: várias mudanças, uma escrita e um reload
+
+    `submit(mutate)` agenda `mutate(config)` sobre o HAProxyConfig do arquivo
+    e retorna um Future com o resultado do apply do lote em que entrou.
+    """
+
+    def __init__(self, controller, debounce=0.5, max_delay=5.0):
+        self.controller = controller
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self._cond = threading.Condition()
+        self._pending = []
+        self._last_submit = 0.0
+        self._thread = None
+
+    def submit(self, mutate):
+        future = Future()
+        with self._cond:
+            self._pending.append((mutate, future))
+            self._last_submit = time.monotonic()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='haproxy-reload', daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+        return future
+
+    def _take_batch(self):
+        """Espera a janela ficar quieta por `debounce` (ou `max_delay` desde o primeiro)"""
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+            first = time.monotonic()
+            while True:
+                now = time.monotonic()
+                quiet_until = self._last_submit + self.debounce
+                if now >= quiet_until or now - first >= self.max_delay:
+                    break
+                self._cond.wait(min(quiet_until, first + self.max_delay) - now)
+            batch, self._pending = self._pending, []
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            result = None
+            applied = []
+            try:
+                with self.controller.locked():
+                    config = HAProxyConfig.parse(self.controller.read())
+                    for mutate, future in batch:
+                        try:
+                            mutate(config)
+                            applied.append(future)
+                        except Exception as e:
+                            future.set_exception(e)
+                    result = self.controller.apply(config.render()) if applied else None
+            except Exception as e:
+                result = {'success': False, 'method': 'none', 'error': str(e)}
+
+            for _, future in batch:
+                if not future.done():
+                    future.set_result(result)
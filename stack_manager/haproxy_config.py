@@ -0,0 +1,234 @@
+"""
+Modelo estruturado do haproxy.cfg
+
+Lê a configuração em seções (global, defaults, frontend, backend...) com as
+diretivas de cada uma, permite alterar as rotas de um stack por nome exato de
+seção e renderiza o arquivo inteiro de volta.
+
+As portas das faixas publicadas têm estrutura fixa (`ensure_port_slots`): um
+único frontend escuta as faixas inteiras e encaminha pela porta de destino
+para o backend `port_<porta>`, que já existe com slots de servidores
+(`server-template`) em manutenção. Rotear um stack só troca endereço e estado
+desses slots, o que a Runtime API aplica sem reload; o stack dono da porta
+fica num comentário `# stack <nome>` no backend. Portas fora das faixas
+seguem a convenção antiga `frontend <stack>_<porta>` + `backend
+<stack>_<porta>_backend`.
+"""
+import re
+
+SECTION_KEYWORDS = ('global', 'defaults', 'frontend', 'backend', 'listen', 'resolvers', 'peers', 'userlist')
+SLOTS_FRONTEND = 'stack_ports'
+SLOT_PREFIX = 'slot'
+OWNER_COMMENT = '# stack '
+
+
+def slot_backend(port):
+    return f'port_{port}'
+
+
+def slot_lines(port, servers, stack_name=None):
+    """Corpo do backend de uma porta: slots em manutenção ou apontando para os `servers` [(nome, ip)]"""
+    if stack_name is None:
+        return ['balance roundrobin', f'server-template {SLOT_PREFIX} {len(servers)} 0.0.0.0:{port} check disabled']
+    return ['balance roundrobin', f'{OWNER_COMMENT}{stack_name}'] + [
+        f'server {SLOT_PREFIX}{i} {ip}:{port} check' for i, (_, ip) in enumerate(servers, 1)
+    ]
+
+
+class Section:
+    """Seção do haproxy.cfg: tipo, nome (opcional) e linhas do corpo"""
+
+    __slots__ = ('kind', 'name', 'lines')
+
+    def __init__(self, kind, name=None, lines=None):
+        self.kind = kind
+        self.name = name
+        self.lines = list(lines or [])
+
+    @property
+    def header(self):
+        return f'{self.kind} {self.name}' if self.name else self.kind
+
+    @property
+    def directives(self):
+        """Linhas sem comentários, para comparação"""
+        return [l for l in self.lines if not l.startswith('#')]
+
+    def values(self, keyword):
+        """Argumentos das diretivas `keyword` (ex.: 'bind', 'server')"""
+        return [l.split()[1:] for l in self.directives if l.split()[0] == keyword]
+
+    def bound_ports(self):
+        ports = set()
+        for args in self.values('bind'):
+            port = args[0].rpartition(':')[2] if args else ''
+            start, _, end = port.partition('-')
+            if start.isdigit() and (end or start).isdigit():
+                ports.update(range(int(start), int(end or start) + 1))
+        return ports
+
+    def owner(self):
+        """Stack dono de um backend de slots (None se livre)"""
+        for line in self.lines:
+            if line.startswith(OWNER_COMMENT):
+                return line[len(OWNER_COMMENT):].strip()
+        return None
+
+
+class HAProxyConfig:
+    """Configuração do HAProxy como lista ordenada de seções"""
+
+    def __init__(self, sections=None, preamble=None):
+        self.sections = list(sections or [])
+        self.preamble = list(preamble or [])
+
+    @classmethod
+    def parse(cls, text):
+        config = cls()
+        current = None
+        for raw in text.splitlines():
+            line = raw.strip()
+            if not line:
+                continue
+            words = line.split()
+            if words[0] in SECTION_KEYWORDS and not raw[:1].isspace():
+                current = Section(words[0], ' '.join(words[1:]) or None)
+                config.sections.append(current)
+            elif current is None:
+                config.preamble.append(line)
+            else:
+                current.lines.append(line)
+        return config
+
+    def render(self):
+        blocks = []
+        if self.preamble:
+            blocks.append('\n'.join(self.preamble))
+        for section in self.sections:
+            blocks.append('\n'.join([section.header] + [f'    {l}' for l in section.lines]))
+        return '\n\n'.join(blocks) + '\n'
+
+    # ----- consulta -----
+
+    def get(self, kind, name):
+        for section in self.sections:
+            if section.kind == kind and section.name == name:
+                return section
+        return None
+
+    def bound_ports(self):
+        """{porta: nome do frontend} de todos os binds"""
+        ports = {}
+        for section in self.sections:
+            if section.kind in ('frontend', 'listen'):
+                for port in section.bound_ports():
+                    ports[port] = section.name
+        return ports
+
+    def stack_ports(self, stack_name):
+        """Portas roteadas para o stack (casamento exato do nome, sem prefixos)"""
+        pattern = re.compile(rf'^{re.escape(stack_name)}_(\d+)$')
+        slot = re.compile(r'^port_(\d+)$')
+        ports = []
+        for section in self.sections:
+            match = section.kind == 'frontend' and pattern.match(section.name or '')
+            if match:
+                ports.append(int(match.group(1)))
+            match = section.kind == 'backend' and slot.match(section.name or '')
+            if match and section.owner() == stack_name:
+                ports.append(int(match.group(1)))
+        return ports
+
+    # ----- alteração -----
+
+    def remove(self, kind, name):
+        self.sections = [s for s in self.sections if not (s.kind == kind and s.name == name)]
+
+    def add_route(self, stack_name, port, servers):
+        """Frontend + backend de uma porta do stack; `servers` é [(nome, ip)]"""
+        frontend_name = f'{stack_name}_{port}'
+        backend_name = f'{stack_name}_{port}_backend'
+        self.remove('frontend', frontend_name)
+        self.remove('backend', backend_name)
+
+        frontend = Section('frontend', frontend_name, [f'bind *:{port}', f'default_backend {backend_name}'])
+        backend = Section('backend', backend_name, ['balance roundrobin'] +
+                          [f'server {name} {ip}:{port} check' for name, ip in servers])
+
+        # Frontends ficam depois do último frontend; backends no final
+        last_frontend = max((i for i, s in enumerate(self.sections) if s.kind == 'frontend'), default=-1)
+        self.sections.insert(last_frontend + 1, frontend)
+        self.sections.append(backend)
+
+    def remove_route(self, stack_name, port):
+        slot = self.get('backend', slot_backend(port))
+        if slot and slot.owner() == stack_name:
+            count = sum(1 for l in slot.lines if l.startswith('server '))
+            slot.lines = slot_lines(port, [None] * count)
+            return
+        self.remove('frontend', f'{stack_name}_{port}')
+        self.remove('backend', f'{stack_name}_{port}_backend')
+
+    def set_stack_routes(self, stack_name, ports, servers):
+        """Deixa o stack roteado exatamente nas `ports`
+
+        Portas com slots são ativadas se estiverem livres; as demais ganham
+        frontend/backend próprios. Portas já usadas por outro stack são
+        ignoradas, como antes.
+        """
+        wanted = {int(p) for p in ports}
+        for port in self.stack_ports(stack_name):
+            if port not in wanted:
+                self.remove_route(stack_name, port)
+
+        bound = self.bound_ports()
+        for port in sorted(wanted):
+            slot = self.get('backend', slot_backend(port))
+            if slot:
+                if slot.owner() in (None, stack_name):
+                    slot.lines = slot_lines(port, servers, stack_name)
+            elif port not in bound:
+                self.add_route(stack_name, port, servers)
+
+    def ensure_port_slots(self, ranges, servers):
+        """Estrutura fixa das faixas: frontend único + backend com slots por porta (idempotente)
+
+        Rotas no formato antigo dentro das faixas são convertidas em slots
+        ativos do mesmo stack. Depois da primeira vez não muda nada, e rotear
+        stacks passa a mexer só nos servidores dos backends.
+        """
+        ports = {p for start, end in ranges for p in range(start, end + 1)}
+
+        legacy = []
+        pattern = re.compile(r'^(.+)_(\d+)$')
+        for section in list(self.sections):
+            match = section.kind == 'frontend' and pattern.match(section.name or '')
+            if match and int(match.group(2)) in ports and self.get('backend', f'{section.name}_backend'):
+                legacy.append((match.group(1), int(match.group(2))))
+                self.remove('frontend', section.name)
+                self.remove('backend', f'{section.name}_backend')
+
+        lines = [f'bind *:{start}-{end}' if end != start else f'bind *:{start}' for start, end in ranges]
+        lines.append('use_backend port_%[dst_port]')
+        frontend = self.get('frontend', SLOTS_FRONTEND)
+        if frontend:
+            frontend.lines = lines
+        else:
+            last_frontend = max((i for i, s in enumerate(self.sections) if s.kind == 'frontend'), default=-1)
+            self.sections.insert(last_frontend + 1, Section('frontend', SLOTS_FRONTEND, lines))
+
+        slot = re.compile(r'^port_(\d+)$')
+        self.sections = [s for s in self.sections
+                         if not (s.kind == 'backend' and slot.match(s.name or '') and
+                                 int(slot.match(s.name).group(1)) not in ports)]
+        existing = {s.name for s in self.sections if s.kind == 'backend'}
+        for port in sorted(ports):
+            if slot_backend(port) not in existing:
+                self.sections.append(Section('backend', slot_backend(port), slot_lines(port, servers)))
+
+        for stack_name, port in legacy:
+            self.get('backend', slot_backend(port)).lines = slot_lines(port, servers, stack_name)
+
+    def remove_stack_routes(self, stack_name):
+        for port in self.stack_ports(stack_name):
+            self.remove_route(stack_name, port)
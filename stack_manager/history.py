@@ -0,0 +1,227 @@
+"""
+Histórico de scans de segurança (SQLite, somente inserção)
+
+Cada resultado do Trivy (por imagem) e do SonarQube (por projeto) vira uma
+linha na tabela `scans`, com as métricas em JSON e um resumo legível. As
+gravações entram numa fila e uma thread grava em lotes, numa transação por
+lote, para que um scan de toda a frota não espere um fsync por imagem.
+
+Na mesma transação é mantido o resumo diário (`daily_rollups`): para cada
+dia, origem, alvo e métrica fica o último valor do dia e quantos scans
+houve. As tendências de meses saem dessa tabela, sem varrer `scans`.
+"""
+import base64
+import json
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+BATCH_SIZE = 200
+FLUSH_INTERVAL = 1.0
+
+
+def _encode_cursor(ts, scan_id):
+    return base64.urlsafe_b64encode(json.dumps([ts, scan_id]).encode()).decode()
+
+
+def _decode_cursor(cursor):
+    try:
+        ts, scan_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(ts), int(scan_id)
+    except (ValueError, TypeError):
+        raise ValueError('Cursor inválido')
+
+
+class ScanHistory:
+    """Histórico persistente com gravação em lote e resumo diário por métrica"""
+
+    def __init__(self, db_path, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._local = threading.local()
+        self._queue = queue.Queue()
+        self._last = {}
+        self._last_lock = threading.Lock()
+        self._init_schema()
+        self._writer = threading.Thread(target=self._write_loop, name='scan-history', daemon=True)
+        self._writer.start()
+
+    # ----- banco -----
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            # Com WAL, NORMAL só sincroniza no checkpoint: um fsync por lote no máximo
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        self._conn().executescript('''
+            CREATE TABLE IF NOT EXISTS scans (
+                id INTEGER PRIMARY KEY,
+                source TEXT NOT NULL,
+                target TEXT NOT NULL,
+                ts REAL NOT NULL,
+                metrics TEXT NOT NULL,
+                summary TEXT NOT NULL,
+                details TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS scans_ts ON scans (ts, id);
+            CREATE INDEX IF NOT EXISTS scans_source ON scans (source, ts, id);
+            CREATE INDEX IF NOT EXISTS scans_target ON scans (target, ts, id);
+            CREATE TABLE IF NOT EXISTS daily_rollups (
+                day TEXT NOT NULL,
+                source TEXT NOT NULL,
+                target TEXT NOT NULL,
+                metric TEXT NOT NULL,
+                value REAL NOT NULL,
+                ts REAL NOT NULL,
+                scans INTEGER NOT NULL,
+                PRIMARY KEY (source, day, target, metric)
+            ) WITHOUT ROWID;
+        ''')
+
+    # ----- gravação -----
+
+    def record(self, source, target, metrics, summary='', details=None, ts=None, min_interval=None):
+        """Enfileira um resultado; `metrics` é {nome: número}
+
+        Com `min_interval`, um resultado idêntico ao último gravado para o
+        mesmo alvo há menos de `min_interval` segundos é descartado (coletas
+        periódicas que não mudaram nada).
+        """
+        ts = time.time() if ts is None else ts
+        metrics = {k: v for k, v in metrics.items() if isinstance(v, (int, float)) and not isinstance(v, bool)}
+        if min_interval is not None:
+            with self._last_lock:
+                last = self._last.get((source, target))
+                if last and last[1] == metrics and ts - last[0] < min_interval:
+                    return False
+                self._last[(source, target)] = (ts, metrics)
+        self._queue.put((source, target, ts, metrics, summary, details or {}))
+        return True
+
+    def _write_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except Exception as e:
+                print(f'Erro ao gravar histórico de scans: {e}')
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, batch):
+        rows, rollups = [], []
+        for source, target, ts, metrics, summary, details in batch:
+            rows.append((source, target, ts, json.dumps(metrics), summary, json.dumps(details)))
+            day = datetime.fromtimestamp(ts).date().isoformat()
+            rollups += [(day, source, target, metric, value, ts) for metric, value in metrics.items()]
+
+        conn = self._conn()
+        with conn:
+            conn.executemany('INSERT INTO scans (source, target, ts, metrics, summary, details) '
+                             'VALUES (?, ?, ?, ?, ?, ?)', rows)
+            conn.executemany('''
+                INSERT INTO daily_rollups (day, source, target, metric, value, ts, scans)
+                VALUES (?, ?, ?, ?, ?, ?, 1)
+                ON CONFLICT (source, day, target, metric) DO UPDATE SET
+                    value = CASE WHEN excluded.ts >= daily_rollups.ts THEN excluded.value ELSE daily_rollups.value END,
+                    ts = MAX(daily_rollups.ts, excluded.ts),
+                    scans = daily_rollups.scans + 1
+            ''', rollups)
+
+    def flush(self):
+        """Espera a fila ser gravada"""
+        self._queue.join()
+
+    # ----- consulta -----
+
+    def query(self, source=None, target=None, since=None, until=None, limit=50, cursor=None):
+        """Página de scans, mais recentes primeiro; cursor = posição após o último item"""
+        where, params = [], []
+        if source:
+            where.append('source = ?')
+            params.append(source)
+        if target:
+            where.append('target = ?')
+            params.append(target)
+        if since is not None:
+            where.append('ts >= ?')
+            params.append(since)
+        if until is not None:
+            where.append('ts < ?')
+            params.append(until)
+
+        conn = self._conn()
+        clause = f"WHERE {' AND '.join(where)}" if where else ''
+        total = conn.execute(f'SELECT COUNT(*) FROM scans {clause}', params).fetchone()[0]
+
+        if cursor:
+            where.append('(ts, id) < (?, ?)')
+            params += list(_decode_cursor(cursor))
+            clause = f"WHERE {' AND '.join(where)}"
+
+        rows = conn.execute(
+            f'SELECT id, source, target, ts, metrics, summary, details FROM scans {clause} '
+            f'ORDER BY ts DESC, id DESC LIMIT ?', params + [limit + 1]
+        ).fetchall()
+
+        items = [{
+            'id': scan_id,
+            'type': src,
+            'target': tgt,
+            'timestamp': datetime.fromtimestamp(ts).isoformat(),
+            'metrics': json.loads(metrics),
+            'summary': summary,
+            'details': json.loads(details)
+        } for scan_id, src, tgt, ts, metrics, summary, details in rows[:limit]]
+
+        next_cursor = None
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            next_cursor = _encode_cursor(last[3], last[0])
+        return {'total': total, 'items': items, 'next_cursor': next_cursor}
+
+    def trends(self, source, since_day=None, until_day=None, target=None):
+        """Série diária {dia: {métrica: soma do último valor do dia de cada alvo}}"""
+        where, params = ['source = ?'], [source]
+        if target:
+            where.append('target = ?')
+            params.append(target)
+        if since_day:
+            where.append('day >= ?')
+            params.append(since_day)
+        if until_day:
+            where.append('day <= ?')
+            params.append(until_day)
+
+        rows = self._conn().execute(
+            f"SELECT day, metric, SUM(value), COUNT(DISTINCT target), SUM(scans) FROM daily_rollups "
+            f"WHERE {' AND '.join(where)} GROUP BY day, metric ORDER BY day",
+            params
+        ).fetchall()
+
+        days = {}
+        for day, metric, value, targets, scans in rows:
+            entry = days.setdefault(day, {'day': day, 'targets': 0, 'scans': 0, 'metrics': {}})
+            entry['metrics'][metric] = value
+            entry['targets'] = max(entry['targets'], targets)
+            entry['scans'] = max(entry['scans'], scans)
+        return list(days.values())
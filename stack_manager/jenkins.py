@@ -0,0 +1,365 @@
+"""
+Cliente do Jenkins - pipelines dos stacks com crumb em cache e upsert
+
+Uma `requests.Session` com pool de conexões guarda o cookie de sessão e o
+crumb (proteção CSRF) é buscado uma vez e reaproveitado; se o Jenkins o
+recusar (reinício, sessão expirada), é renovado e a chamada repetida.
+`upsert_job` atualiza o config.xml de um job existente ou cria o job, então
+reaplicar o template a todas as pipelines é só chamar `provision` com elas,
+em paralelo limitado.
+
+Os builds são disparados pelo webhook de push (`build`); o polling do SCM
+só entra no config.xml quando um `poll_spec` é configurado, como fallback.
+
+As configurações de CI/CD de cada stack ficam no PipelineRegistry (JSON em
+disco), que é a fonte para re-sincronizar as pipelines.
+"""
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from xml.sax.saxutils import escape
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .webhooks import normalize_repo_url
+
+
+class JenkinsError(Exception):
+    """Jenkins inacessível ou resposta inesperada"""
+
+
+def job_name(stack_name):
+    return f'{stack_name}-pipeline'
+
+
+def image_name(stack_name, cicd):
+    registry = cicd.get('dockerRegistry', '')
+    return f'{registry}/{stack_name}:latest' if registry else f'{stack_name}:latest'
+
+
+def render_jenkinsfile(stack_name, cicd, trivy_url=None, sonarqube_url=None):
+    """Script da pipeline (Groovy) a partir da configuração de CI/CD do stack
+
+    O build usa BuildKit com cache de camadas: no registry (`:buildcache`,
+    mode=max) quando há registry, senão cache inline da última imagem local.
+    Testes (`buildCommand`), SonarQube e build + scan do Trivy rodam em
+    paralelo; o deploy usa o digest publicado no registry (ou a tag do commit,
+    sem registry), nunca `:latest`.
+    """
+    git_url = cicd.get('gitCloneUrl')
+    git_branch = cicd.get('gitBranch', 'main')
+    build_command = cicd.get('buildCommand', '')
+    dockerfile_path = cicd.get('dockerfilePath', 'Dockerfile')
+    docker_registry = cicd.get('dockerRegistry', '')
+    image_repo = image_name(stack_name, cicd).rsplit(':', 1)[0]
+
+    if docker_registry:
+        build_steps = f"""script {{
+                                    docker.withRegistry('https://index.docker.io/v1/', 'docker-credentials') {{
+                                        sh '''
+                                            docker buildx inspect stack-manager >/dev/null 2>&1 || \\
+                                                docker buildx create --name stack-manager --driver docker-container
+                                            docker buildx build --builder stack-manager \\
+                                                --cache-from type=registry,ref=${{IMAGE_REPO}}:buildcache \\
+                                                --cache-to type=registry,ref=${{IMAGE_REPO}}:buildcache,mode=max \\
+                                                -f {dockerfile_path} -t ${{IMAGE_REF}} -t ${{IMAGE_REPO}}:latest --push .
+                                        '''
+                                        env.IMAGE_DIGEST = sh(returnStdout: true,
+                                            script: 'docker buildx imagetools inspect ${{IMAGE_REF}} --format "{{{{.Manifest.Digest}}}}"').trim()
+                                        env.IMAGE_REF = "${{env.IMAGE_REPO}}@${{env.IMAGE_DIGEST}}"
+                                    }}
+                                }}"""
+    else:
+        build_steps = f"""sh '''
+                                    docker build --build-arg BUILDKIT_INLINE_CACHE=1 \\
+                                        --cache-from ${{IMAGE_REPO}}:latest \\
+                                        -f {dockerfile_path} -t ${{IMAGE_REF}} -t ${{IMAGE_REPO}}:latest .
+                                '''"""
+
+    trivy_stage = f"""
+                        stage('Trivy Scan') {{
+                            steps {{
+                                sh '''
+                                    docker run --rm -v /var/run/docker.sock:/var/run/docker.sock -v trivy-cache:/root/.cache/ \\
+                                        aquasec/trivy:latest image --server {trivy_url} \\
+                                        --severity HIGH,CRITICAL --exit-code 0 ${{IMAGE_REF}}
+                                '''
+                            }}
+                        }}""" if trivy_url else ''
+
+    test_stage = f"""
+                stage('Unit Tests') {{
+                    steps {{
+                        sh '{build_command}'
+                    }}
+                }}""" if build_command else ''
+
+    sonar_stage = f"""
+                stage('SonarQube Analysis') {{
+                    steps {{
+                        catchError(buildResult: 'UNSTABLE', stageResult: 'UNSTABLE') {{
+                            withCredentials([string(credentialsId: 'sonar-token', variable: 'SONAR_TOKEN')]) {{
+                                sh '''
+                                    docker run --rm -e SONAR_HOST_URL={sonarqube_url} -e SONAR_TOKEN \\
+                                        -v "$WORKSPACE:/usr/src" sonarsource/sonar-scanner-cli \\
+                                        -Dsonar.projectKey=${{STACK_NAME}}
+                                '''
+                            }}
+                        }}
+                    }}
+                }}""" if sonarqube_url else ''
+
+    return f"""
+pipeline {{
+    agent any
+
+    environment {{
+        STACK_NAME = '{stack_name}'
+        IMAGE_REPO = '{image_repo}'
+        DOCKER_REGISTRY = '{docker_registry}'
+        DOCKER_BUILDKIT = '1'
+    }}
+
+    stages {{
+        stage('Clone Repository') {{
+            steps {{
+                git branch: '{git_branch}', url: '{git_url}'
+                script {{
+                    env.IMAGE_TAG = sh(returnStdout: true, script: 'git rev-parse --short=12 HEAD').trim()
+                    env.IMAGE_REF = "${{env.IMAGE_REPO}}:${{env.IMAGE_TAG}}"
+                }}
+            }}
+        }}
+
+        stage('Build & Checks') {{
+            parallel {{
+                stage('Image') {{
+                    stages {{
+                        stage('Build Docker Image') {{
+                            steps {{
+                                {build_steps}
+                            }}
+                        }}{trivy_stage}
+                    }}
+                }}{test_stage}{sonar_stage}
+            }}
+        }}
+
+        stage('Deploy to Swarm') {{
+            steps {{
+                sh '''
+                    docker exec lab-swarm1 docker service update --with-registry-auth --image ${{IMAGE_REF}} ${{STACK_NAME}}_${{STACK_NAME}} || \\
+                    docker exec lab-swarm1 docker stack deploy -c /stacks/${{STACK_NAME}}-stack.yaml ${{STACK_NAME}}
+                '''
+            }}
+        }}
+    }}
+
+    post {{
+        success {{
+            echo "✅ Deploy realizado com sucesso: ${{env.IMAGE_REF}}"
+        }}
+        failure {{
+            echo '❌ Falha no deploy!'
+        }}
+    }}
+}}
+"""
+
+
+def render_job_config(stack_name, cicd, poll_spec=None, trivy_url=None, sonarqube_url=None):
+    """config.xml do job de pipeline (o script vai escapado para XML)
+
+    Sem `poll_spec` o job não faz polling: os builds vêm do webhook.
+    """
+    triggers = f"""
+    <org.jenkinsci.plugins.workflow.job.properties.PipelineTriggersJobProperty>
+      <triggers>
+        <hudson.triggers.SCMTrigger>
+          <spec>{escape(poll_spec)}</spec>
+          <ignorePostCommitHooks>true</ignorePostCommitHooks>
+        </hudson.triggers.SCMTrigger>
+      </triggers>
+    </org.jenkinsci.plugins.workflow.job.properties.PipelineTriggersJobProperty>
+  """ if poll_spec else ''
+    return f"""<?xml version='1.1' encoding='UTF-8'?>
+<flow-definition plugin="workflow-job">
+  <description>Pipeline CI/CD para {escape(stack_name)}</description>
+  <keepDependencies>false</keepDependencies>
+  <properties>{triggers}</properties>
+  <definition class="org.jenkinsci.plugins.workflow.cps.CpsFlowDefinition" plugin="workflow-cps">
+    <script>{escape(render_jenkinsfile(stack_name, cicd, trivy_url, sonarqube_url))}</script>
+    <sandbox>true</sandbox>
+  </definition>
+  <triggers/>
+  <disabled>false</disabled>
+</flow-definition>"""
+
+
+class JenkinsClient:
+    """API REST do Jenkins com sessão keep-alive e crumb reaproveitado"""
+
+    def __init__(self, base_url, user=None, token=None, workers=8, timeout=10, poll_spec=None,
+                 trivy_url=None, sonarqube_url=None):
+        self.base_url = base_url.rstrip('/')
+        self.workers = workers
+        self.timeout = timeout
+        self.poll_spec = poll_spec
+        # Serviços usados pelos estágios de análise das pipelines geradas
+        self.trivy_url = trivy_url
+        self.sonarqube_url = sonarqube_url
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        if token:
+            self.session.auth = (user, token)
+
+        self._crumb_lock = threading.Lock()
+        self._crumb = None
+        self._crumb_loaded = False
+
+    def _request(self, method, path, **kwargs):
+        try:
+            return self.session.request(method, f'{self.base_url}{path}', timeout=self.timeout, **kwargs)
+        except requests.RequestException as e:
+            raise JenkinsError(f'Não foi possível conectar ao Jenkins: {e}')
+
+    def crumb(self, refresh=False):
+        """{campo: crumb} para requisições POST; vazio se o CSRF estiver desativado"""
+        with self._crumb_lock:
+            if refresh or not self._crumb_loaded:
+                response = self._request('GET', '/crumbIssuer/api/json')
+                if response.status_code == 200:
+                    data = response.json()
+                    self._crumb = {data['crumbRequestField']: data['crumb']}
+                elif response.status_code == 404:
+                    self._crumb = {}
+                else:
+                    raise JenkinsError(f'Erro ao obter crumb do Jenkins: {response.status_code}')
+                self._crumb_loaded = True
+            return dict(self._crumb)
+
+    def post(self, path, **kwargs):
+        """POST com crumb; um 403 renova o crumb e repete uma vez"""
+        headers = dict(kwargs.pop('headers', {}))
+        response = self._request('POST', path, headers={**headers, **self.crumb()}, **kwargs)
+        if response.status_code == 403:
+            response = self._request('POST', path, headers={**headers, **self.crumb(refresh=True)}, **kwargs)
+        return response
+
+    def upsert_job(self, name, config_xml):
+        """Atualiza o config.xml do job ou cria o job; retorna 'updated' ou 'created'"""
+        headers = {'Content-Type': 'application/xml'}
+        body = config_xml.encode('utf-8')
+
+        response = self.post(f'/job/{name}/config.xml', headers=headers, data=body)
+        if response.status_code == 200:
+            return 'updated'
+        if response.status_code != 404:
+            raise JenkinsError(f'Erro ao atualizar job no Jenkins: {response.status_code} - {response.text[:200]}')
+
+        response = self.post('/createItem', params={'name': name}, headers=headers, data=body)
+        if response.status_code in (200, 201):
+            return 'created'
+        raise JenkinsError(f'Erro ao criar job no Jenkins: {response.status_code} - {response.text[:200]}')
+
+    def job_url(self, name):
+        return f'{self.base_url}/job/{name}'
+
+    def build(self, name):
+        """Enfileira um build do job; retorna a URL do item na fila do Jenkins"""
+        response = self.post(f'/job/{name}/build')
+        if response.status_code not in (200, 201):
+            raise JenkinsError(f'Erro ao disparar build de {name}: {response.status_code} - {response.text[:200]}')
+        return response.headers.get('Location')
+
+    def build_many(self, names):
+        """Dispara os builds em paralelo; retorna [{'job_name', 'success', 'queue_url'|'error'}]"""
+        def build_one(name):
+            try:
+                return {'job_name': name, 'success': True, 'queue_url': self.build(name)}
+            except JenkinsError as e:
+                return {'job_name': name, 'success': False, 'error': str(e)}
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='jenkins') as pool:
+            return list(pool.map(build_one, names))
+
+    def provision(self, stack_name, cicd):
+        """Cria ou atualiza a pipeline do stack; retorna o dict padrão"""
+        name = job_name(stack_name)
+        try:
+            config = render_job_config(stack_name, cicd, self.poll_spec, self.trivy_url, self.sonarqube_url)
+            action = self.upsert_job(name, config)
+        except JenkinsError as e:
+            return {'success': False, 'stack': stack_name, 'job_name': name, 'error': str(e)}
+        verb = 'criada' if action == 'created' else 'atualizada'
+        return {
+            'success': True,
+            'stack': stack_name,
+            'job_name': name,
+            'job_url': self.job_url(name),
+            'action': action,
+            'message': f'Pipeline {name} {verb} com sucesso no Jenkins'
+        }
+
+    def provision_many(self, pipelines, on_result=None):
+        """Provisiona {stack: cicd} em paralelo (no máximo `workers` de uma vez)"""
+        def provision_one(item):
+            result = self.provision(*item)
+            if on_result:
+                on_result(result)
+            return result
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='jenkins') as pool:
+            return list(pool.map(provision_one, pipelines.items()))
+
+
+class PipelineRegistry:
+    """Configuração de CI/CD de cada stack, persistida em JSON"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path) as f:
+                self._pipelines = json.load(f)
+        except (OSError, ValueError):
+            self._pipelines = {}
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp = f'{self.path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self._pipelines, f, indent=2)
+        os.replace(tmp, self.path)
+
+    def get(self, stack_name):
+        with self._lock:
+            return self._pipelines.get(stack_name)
+
+    def set(self, stack_name, cicd):
+        with self._lock:
+            self._pipelines[stack_name] = dict(cicd)
+            self._save()
+
+    def remove(self, stack_name):
+        with self._lock:
+            if self._pipelines.pop(stack_name, None) is not None:
+                self._save()
+
+    def all(self):
+        with self._lock:
+            return {name: dict(cicd) for name, cicd in self._pipelines.items()}
+
+    def matching(self, repositories, branch):
+        """Stacks cujo gitCloneUrl (normalizado) está em `repositories` no `branch`"""
+        with self._lock:
+            return sorted(
+                name for name, cicd in self._pipelines.items()
+                if normalize_repo_url(cicd.get('gitCloneUrl')) in repositories
+                and cicd.get('gitBranch', 'main') == branch
+            )
@@ -0,0 +1,262 @@
+"""
+Motor de jobs assíncronos - deploy, remoção, update e ciclo de vida do lab
+
+Cada operação longa vira um job: a chamada HTTP recebe o id na hora e o
+trabalho roda num pool limitado de workers. Jobs com a mesma chave (ex.: o
+mesmo stack) são serializados em ordem de chegada; um job pode ter várias
+chaves (ex.: deploy em lote) e só começa quando todas estão livres. A saída
+é registrada linha a linha, pode ser acompanhada enquanto é produzida e fica
+gravada em disco junto com o estado do job, sobrevivendo a reinícios do app.
+"""
+import json
+import os
+import threading
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+FINISHED = ('succeeded', 'failed')
+
+
+def job_keys(key):
+    """Chaves de serialização de um job: uma chave ou lista de chaves"""
+    return list(key) if isinstance(key, (list, tuple)) else [key]
+
+
+class Job:
+    """Estado e log de uma operação"""
+
+    def __init__(self, manager, kind, key, params=None, job_id=None):
+        self.manager = manager
+        self.id = job_id or uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.key = key
+        self.params = params or {}
+        self.status = 'queued'
+        self.created_at = datetime.now().isoformat()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.lines = []
+        self._fn = None
+
+    @property
+    def finished(self):
+        return self.status in FINISHED
+
+    def log(self, stream, line=None):
+        """Registra uma linha de saída; aceita log(linha) ou log(stream, linha)"""
+        if line is None:
+            stream, line = 'stdout', stream
+        self.manager._append_line(self, {'stream': stream, 'line': line})
+
+    def to_dict(self, include_log=False):
+        data = {
+            'id': self.id,
+            'kind': self.kind,
+            'key': self.key,
+            'params': self.params,
+            'status': self.status,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'result': self.result,
+            'error': self.error,
+            'log_lines': len(self.lines)
+        }
+        if include_log:
+            data['log'] = list(self.lines)
+        return data
+
+
+class JobManager:
+    """Pool limitado de workers com serialização por chave e histórico em disco"""
+
+    def __init__(self, store_dir, max_workers=4, history=500):
+        self.store_dir = store_dir
+        self.history = history
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._cond = threading.Condition()
+        self._jobs = {}
+        self._order = deque()
+        self._active_keys = set()
+        self._pending = deque()
+        os.makedirs(store_dir, exist_ok=True)
+        self._load()
+
+    # ----- persistência -----
+
+    def _meta_path(self, job_id):
+        return os.path.join(self.store_dir, f'{job_id}.json')
+
+    def _log_path(self, job_id):
+        return os.path.join(self.store_dir, f'{job_id}.log')
+
+    def _save(self, job):
+        tmp = self._meta_path(job.id) + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(job.to_dict(), f)
+        os.replace(tmp, self._meta_path(job.id))
+
+    def _load(self):
+        """Recarrega o histórico; jobs interrompidos por reinício viram falha"""
+        loaded = []
+        for file in os.listdir(self.store_dir):
+            if not file.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.store_dir, file)) as f:
+                    loaded.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+
+        loaded.sort(key=lambda d: d.get('created_at') or '')
+        for data in loaded[-self.history:]:
+            job = Job(self, data['kind'], data['key'], data.get('params'), job_id=data['id'])
+            for field in ('status', 'created_at', 'started_at', 'finished_at', 'result', 'error'):
+                setattr(job, field, data.get(field))
+            job.lines = self._read_log(job.id)
+
+            if not job.finished:
+                job.status = 'failed'
+                job.error = 'Job interrompido pelo reinício do Stack Manager'
+                job.finished_at = datetime.now().isoformat()
+                self._save(job)
+
+            self._jobs[job.id] = job
+            self._order.append(job.id)
+
+        for data in loaded[:-self.history]:
+            self._delete_files(data['id'])
+
+    def _read_log(self, job_id):
+        lines = []
+        try:
+            with open(self._log_path(job_id)) as f:
+                for raw in f:
+                    try:
+                        lines.append(json.loads(raw))
+                    except ValueError:
+                        continue
+        except OSError:
+            pass
+        return lines
+
+    def _delete_files(self, job_id):
+        for path in (self._meta_path(job_id), self._log_path(job_id)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _append_line(self, job, entry):
+        with self._cond:
+            # Numerada sob a trava: jobs com etapas paralelas registram de várias threads
+            entry = {'n': len(job.lines), **entry}
+            job.lines.append(entry)
+            with open(self._log_path(job.id), 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+            self._cond.notify_all()
+
+    # ----- execução -----
+
+    def submit(self, kind, key, fn, params=None):
+        """Enfileira `fn(job)`; retorna o Job imediatamente"""
+        job = Job(self, kind, key, params)
+        job._fn = fn
+
+        with self._cond:
+            self._jobs[job.id] = job
+            self._order.append(job.id)
+            while len(self._order) > self.history:
+                old_id = self._order[0]
+                old = self._jobs.get(old_id)
+                if old and not old.finished:
+                    break
+                self._order.popleft()
+                self._jobs.pop(old_id, None)
+                self._delete_files(old_id)
+            self._save(job)
+
+            self._pending.append(job)
+            self._start_ready()
+        return job
+
+    def _start_ready(self):
+        """Inicia os jobs pendentes cujas chaves estão livres, sem furar a fila
+
+        Um job não passa à frente de outro mais antigo que espera por alguma
+        das mesmas chaves. Chamado com `_cond` adquirido.
+        """
+        blocked = set()
+        for job in list(self._pending):
+            keys = set(job_keys(job.key))
+            if keys & (self._active_keys | blocked):
+                blocked |= keys
+                continue
+            self._pending.remove(job)
+            self._active_keys |= keys
+            self._executor.submit(self._run, job)
+
+    def _run(self, job):
+        with self._cond:
+            job.status = 'running'
+            job.started_at = datetime.now().isoformat()
+            self._save(job)
+            self._cond.notify_all()
+
+        try:
+            result = job._fn(job)
+            success = bool(result.get('success')) if isinstance(result, dict) else True
+            status, error = ('succeeded' if success else 'failed'), None
+            if not success and isinstance(result, dict):
+                error = result.get('error') or result.get('stderr') or None
+        except Exception as e:
+            result, status, error = None, 'failed', str(e)
+            job.log('stderr', f'Erro: {e}')
+
+        with self._cond:
+            job.result = result
+            job.error = error
+            job.status = status
+            job.finished_at = datetime.now().isoformat()
+            job._fn = None
+            self._save(job)
+
+            # Liberar as chaves e iniciar os próximos jobs que esperavam por elas
+            self._active_keys -= set(job_keys(job.key))
+            self._start_ready()
+            self._cond.notify_all()
+
+    # ----- consulta -----
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def list(self, limit=50):
+        """Jobs mais recentes primeiro"""
+        with self._cond:
+            ids = list(self._order)[-limit:]
+        return [self._jobs[i] for i in reversed(ids) if i in self._jobs]
+
+    def follow(self, job_id, offset=0, heartbeat=15):
+        """Gera linhas de log a partir de `offset` conforme são produzidas; None = heartbeat"""
+        job = self._jobs.get(job_id)
+        if not job:
+            return
+        while True:
+            timed_out = False
+            with self._cond:
+                if offset >= len(job.lines) and not job.finished:
+                    timed_out = not self._cond.wait(heartbeat)
+                new_lines = job.lines[offset:]
+                finished = job.finished
+            for entry in new_lines:
+                yield entry
+            offset += len(new_lines)
+            if finished and offset >= len(job.lines):
+                return
+            if not new_lines and timed_out:
+                yield None
@@ -0,0 +1,249 @@
+"""
+Alocador de portas públicas persistente (SQLite)
+
+Mantém em disco as portas livres das faixas configuradas e quem ocupa cada
+porta. A próxima porta livre sai do índice da tabela (sem varrer a faixa) e a
+reserva acontece na mesma transação, então duas criações simultâneas nunca
+recebem a mesma porta. Reservas ficam ligadas ao ciclo de vida do stack:
+reservada na criação, confirmada quando o arquivo é gravado, liberada na
+remoção. Na inicialização o índice é reconstruído a partir dos arquivos de
+stack.
+"""
+import sqlite3
+import threading
+import time
+
+RESERVATION_TTL = 600
+
+
+class PortUnavailable(Exception):
+    """Porta pedida já pertence a outro stack ou não há portas livres na faixa"""
+
+
+def parse_ranges(value):
+    """'8084-8299,9100-9199' -> [(8084, 8299), (9100, 9199)]"""
+    ranges = []
+    for part in value.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        start, _, end = part.partition('-')
+        ranges.append((int(start), int(end or start)))
+    return ranges
+
+
+class PortAllocator:
+    """Índice de portas: tabela de livres (ordenada pela PK) + tabela de alocações"""
+
+    def __init__(self, db_path, ranges, reservation_ttl=RESERVATION_TTL):
+        self.db_path = db_path
+        self.ranges = ranges
+        self.reservation_ttl = reservation_ttl
+        self._local = threading.local()
+        self._init_schema()
+        self._sync_ranges()
+
+    # ----- banco -----
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self):
+        """BEGIN IMMEDIATE: trava de escrita desde o início, também entre processos"""
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        return conn
+
+    def _init_schema(self):
+        self._conn().executescript('''
+            CREATE TABLE IF NOT EXISTS free_ports (port INTEGER PRIMARY KEY);
+            CREATE TABLE IF NOT EXISTS allocations (
+                port INTEGER PRIMARY KEY,
+                owner TEXT NOT NULL,
+                state TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS allocations_owner ON allocations (owner);
+        ''')
+
+    def in_range(self, port):
+        """Porta pertence a alguma das faixas configuradas"""
+        return any(start <= port <= end for start, end in self.ranges)
+
+    def _sync_ranges(self):
+        """Ajusta a tabela de livres às faixas configuradas"""
+        conn = self._transaction()
+        try:
+            conn.execute('CREATE TEMP TABLE IF NOT EXISTS wanted (port INTEGER PRIMARY KEY)')
+            conn.execute('DELETE FROM wanted')
+            for start, end in self.ranges:
+                conn.executemany('INSERT OR IGNORE INTO wanted VALUES (?)', ((p,) for p in range(start, end + 1)))
+            conn.execute('DELETE FROM free_ports WHERE port NOT IN (SELECT port FROM wanted)')
+            conn.execute('''
+                INSERT OR IGNORE INTO free_ports
+                SELECT port FROM wanted WHERE port NOT IN (SELECT port FROM allocations)
+            ''')
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _free(self, conn, ports):
+        conn.executemany('DELETE FROM allocations WHERE port = ?', ((p,) for p in ports))
+        conn.executemany('INSERT OR IGNORE INTO free_ports VALUES (?)',
+                         ((p,) for p in ports if self.in_range(p)))
+
+    def _expire(self, conn):
+        """Devolve reservas que nunca foram confirmadas (criação abortada)"""
+        rows = conn.execute("SELECT port FROM allocations WHERE state = 'reserved' AND updated_at < ?",
+                            (time.time() - self.reservation_ttl,)).fetchall()
+        self._free(conn, [r[0] for r in rows])
+
+    # ----- operações -----
+
+    def _allocate(self, conn, owner, preferred):
+        """Reserva a porta do stack; recriar um stack reaproveita a porta que ele já tem
+
+        Sem porta pedida, devolve a menor porta já alocada ao `owner`. Com porta
+        pedida, as outras portas do `owner` são liberadas (o arquivo do stack é
+        regravado com a porta nova).
+        """
+        owned = [r[0] for r in conn.execute('SELECT port FROM allocations WHERE owner = ? ORDER BY port',
+                                            (owner,))]
+        if preferred:
+            try:
+                port = int(preferred)
+            except (TypeError, ValueError):
+                raise PortUnavailable(f'Porta inválida: {preferred}')
+            if not self.in_range(port):
+                raise PortUnavailable(f'Porta {port} fora das faixas configuradas')
+            row = conn.execute('SELECT owner FROM allocations WHERE port = ?', (port,)).fetchone()
+            if row and row[0] != owner:
+                raise PortUnavailable(f'Porta {port} já está em uso pelo stack {row[0]}')
+        elif owned:
+            port = owned[0]
+        else:
+            row = conn.execute('SELECT MIN(port) FROM free_ports').fetchone()
+            if row[0] is None:
+                raise PortUnavailable('Nenhuma porta livre nas faixas configuradas')
+            port = row[0]
+
+        self._free(conn, [p for p in owned if p != port])
+        if port in owned:
+            # Porta já confirmada continua confirmada: uma recriação abortada não a libera
+            conn.execute('UPDATE allocations SET updated_at = ? WHERE port = ?', (time.time(), port))
+            return port
+        conn.execute('DELETE FROM free_ports WHERE port = ?', (port,))
+        conn.execute("INSERT OR REPLACE INTO allocations VALUES (?, ?, 'reserved', ?)",
+                     (port, owner, time.time()))
+        return port
+
+    def allocate(self, owner, preferred=None):
+        """Reserva uma porta para `owner`: a pedida ou a menor livre da faixa"""
+        conn = self._transaction()
+        try:
+            self._expire(conn)
+            port = self._allocate(conn, owner, preferred)
+            conn.execute('COMMIT')
+            return port
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def allocate_many(self, requests):
+        """Reserva portas para vários stacks numa única transação
+
+        `requests` é [(owner, preferida ou None)]. Retorna {owner: porta ou
+        PortUnavailable}; uma porta indisponível não impede as demais.
+        Portas pedidas explicitamente são reservadas antes das automáticas.
+        """
+        results = {}
+        conn = self._transaction()
+        try:
+            self._expire(conn)
+            for owner, preferred in sorted(requests, key=lambda r: not r[1]):
+                try:
+                    results[owner] = self._allocate(conn, owner, preferred)
+                except PortUnavailable as e:
+                    results[owner] = e
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return results
+
+    def confirm(self, owner):
+        """Marca as reservas do stack como definitivas (arquivo gravado)"""
+        self._conn().execute("UPDATE allocations SET state = 'bound', updated_at = ? WHERE owner = ?",
+                             (time.time(), owner))
+
+    def release(self, owner):
+        """Devolve todas as portas do stack para a faixa"""
+        conn = self._transaction()
+        try:
+            rows = conn.execute('SELECT port FROM allocations WHERE owner = ?', (owner,)).fetchall()
+            self._free(conn, [r[0] for r in rows])
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def assign(self, owner, ports):
+        """Define as portas publicadas pelo stack; retorna as que pertencem a outro stack"""
+        return self.rebuild({owner: ports}, prune=False)[owner]
+
+    def rebuild(self, stacks, prune=True):
+        """Reconstrói o índice a partir de {stack: [portas]} lidos dos arquivos
+
+        Com prune=True, alocações confirmadas de stacks que não existem mais são
+        liberadas (reservas em andamento são mantidas até expirarem). Retorna
+        {stack: [portas em conflito]}.
+        """
+        conflicts = {}
+        conn = self._transaction()
+        try:
+            if prune:
+                rows = conn.execute("SELECT port, owner FROM allocations WHERE state = 'bound'").fetchall()
+                self._free(conn, [port for port, owner in rows if owner not in stacks])
+
+            for owner, ports in stacks.items():
+                wanted = {int(p) for p in ports if str(p).isdigit()}
+                current = {r[0] for r in conn.execute('SELECT port FROM allocations WHERE owner = ?', (owner,))}
+                self._free(conn, current - wanted)
+                conflicts[owner] = []
+                for port in sorted(wanted):
+                    row = conn.execute('SELECT owner FROM allocations WHERE port = ?', (port,)).fetchone()
+                    if row and row[0] != owner:
+                        conflicts[owner].append(port)
+                        continue
+                    conn.execute('DELETE FROM free_ports WHERE port = ?', (port,))
+                    conn.execute("INSERT OR REPLACE INTO allocations VALUES (?, ?, 'bound', ?)",
+                                 (port, owner, time.time()))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return conflicts
+
+    # ----- consulta -----
+
+    def owner_of(self, port):
+        row = self._conn().execute('SELECT owner FROM allocations WHERE port = ?', (int(port),)).fetchone()
+        return row[0] if row else None
+
+    def ports_of(self, owner):
+        return [r[0] for r in self._conn().execute(
+            'SELECT port FROM allocations WHERE owner = ? ORDER BY port', (owner,))]
+
+    def next_free(self):
+        """Próxima porta livre sem reservar (None se a faixa estiver esgotada)"""
+        return self._conn().execute('SELECT MIN(port) FROM free_ports').fetchone()[0]
+
+    def list(self):
+        rows = self._conn().execute('SELECT port, owner, state, updated_at FROM allocations ORDER BY port')
+        return [{'port': p, 'owner': o, 'state': s, 'updated_at': u} for p, o, s, u in rows]
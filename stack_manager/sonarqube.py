@@ -0,0 +1,177 @@
+"""
+Cliente do SonarQube com pool de conexões, coleta paralela e cache
+
+Uma única `requests.Session` (conexões keep-alive reaproveitadas) lista os
+projetos página a página e busca as métricas de todos eles em paralelo. O
+resultado fica em cache por `ttl` segundos; depois disso, até `stale_ttl`, o
+valor antigo continua sendo servido enquanto uma atualização roda em segundo
+plano (stale-while-revalidate). Com o SonarQube lento ou reiniciando, a API
+continua respondendo com o último resultado bom, marcado como `stale`.
+"""
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+METRIC_KEYS = ('bugs', 'vulnerabilities', 'code_smells', 'coverage', 'alert_status')
+PAGE_SIZE = 500
+
+
+class SonarQubeError(Exception):
+    """Resposta inesperada ou SonarQube inacessível"""
+
+
+class SonarQubeClient:
+    """Métricas de todos os projetos do SonarQube, com cache stale-while-revalidate
+
+    `on_refresh(data)` é chamado a cada coleta completa bem-sucedida.
+    """
+
+    def __init__(self, base_url, token=None, timeout=5, workers=8, ttl=60, stale_ttl=3600, on_refresh=None):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.workers = workers
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.on_refresh = on_refresh
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        if token:
+            # Token de usuário vai como login, senha vazia
+            self.session.auth = (token, '')
+
+        self._lock = threading.Lock()
+        self._cache = None
+        self._refreshing = None
+
+    # ----- API do SonarQube -----
+
+    def _get(self, path, **params):
+        try:
+            response = self.session.get(f'{self.base_url}{path}', params=params, timeout=self.timeout)
+        except requests.exceptions.ConnectionError:
+            raise SonarQubeError('Não foi possível conectar ao SonarQube. Verifique se o serviço está rodando.')
+        except requests.RequestException as e:
+            raise SonarQubeError(str(e))
+        if response.status_code != 200:
+            raise SonarQubeError(f'SonarQube retornou status {response.status_code} em {path}')
+        try:
+            return response.json()
+        except ValueError:
+            # Página HTML enquanto o SonarQube inicia ou reinicia
+            raise SonarQubeError(f'SonarQube retornou uma resposta inválida em {path}')
+
+    def projects(self):
+        """Todos os projetos [{'key', 'name'}], seguindo a paginação"""
+        projects = []
+        page = 1
+        while True:
+            try:
+                data = self._get('/api/projects/search', p=page, ps=PAGE_SIZE)
+            except SonarQubeError:
+                # /api/projects/search exige permissão de admin; components/search não
+                data = self._get('/api/components/search', qualifiers='TRK', p=page, ps=PAGE_SIZE)
+            components = data.get('components', [])
+            projects += [{'key': c.get('key'), 'name': c.get('name') or c.get('key')} for c in components]
+
+            total = data.get('paging', {}).get('total', len(projects))
+            if not components or len(projects) >= total:
+                return projects
+            page += 1
+
+    def project_metrics(self, project):
+        """Métricas de um projeto; erro no próprio item em vez de exceção"""
+        item = {'key': project['key'], 'name': project['name'], 'error': None}
+        try:
+            data = self._get('/api/measures/component', component=project['key'], metricKeys=','.join(METRIC_KEYS))
+        except SonarQubeError as e:
+            return dict(item, error=str(e))
+
+        measures = {m.get('metric'): m.get('value') for m in data.get('component', {}).get('measures', [])}
+        item.update({
+            'bugs': int(measures.get('bugs') or 0),
+            'vulnerabilities': int(measures.get('vulnerabilities') or 0),
+            'code_smells': int(measures.get('code_smells') or 0),
+            'coverage': float(measures['coverage']) if measures.get('coverage') else None,
+            'quality_gate': measures.get('alert_status') or 'N/A'
+        })
+        return item
+
+    def fetch(self):
+        """Coleta completa: projetos + métricas de cada um em paralelo, com totais"""
+        projects = self.projects()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='sonarqube') as pool:
+            items = list(pool.map(self.project_metrics, projects))
+
+        ok = [p for p in items if not p['error']]
+        coverages = [p['coverage'] for p in ok if p['coverage'] is not None]
+        gates = {p['quality_gate'] for p in ok} - {'N/A'}
+        return {
+            'success': True,
+            'bugs': sum(p['bugs'] for p in ok),
+            'vulnerabilities': sum(p['vulnerabilities'] for p in ok),
+            'code_smells': sum(p['code_smells'] for p in ok),
+            'coverage': round(sum(coverages) / len(coverages), 1) if coverages else 0,
+            'quality_gate': ('OK' if gates == {'OK'} else 'ERROR') if gates else 'N/A',
+            'projects': items,
+            'fetched_at': time.time()
+        }
+
+    # ----- cache -----
+
+    def _refresh(self, future):
+        try:
+            data = self.fetch()
+            with self._lock:
+                self._cache = (data, time.monotonic())
+            if self.on_refresh:
+                try:
+                    self.on_refresh(data)
+                except Exception as e:
+                    print(f'Erro ao processar métricas do SonarQube: {e}')
+            future.set_result(data)
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                self._refreshing = None
+
+    def refresh(self):
+        """Inicia (ou reaproveita) a coleta em andamento; retorna o Future"""
+        with self._lock:
+            if self._refreshing is None:
+                self._refreshing = Future()
+                threading.Thread(target=self._refresh, args=(self._refreshing,),
+                                 name='sonarqube-refresh', daemon=True).start()
+            return self._refreshing
+
+    def metrics(self, wait=None):
+        """Métricas do cache, atualizando conforme a idade
+
+        Até `ttl`: cache. Até `stale_ttl`: cache marcado `stale` + atualização
+        em segundo plano. Sem cache utilizável: espera a coleta (até `wait`
+        segundos) e, se ela falhar, devolve o último resultado conhecido.
+        """
+        with self._lock:
+            cached = self._cache
+        age = time.monotonic() - cached[1] if cached else None
+
+        if cached and age < self.ttl:
+            return dict(cached[0], stale=False)
+
+        future = self.refresh()
+        if cached and age < self.stale_ttl:
+            return dict(cached[0], stale=True)
+
+        try:
+            return dict(future.result(timeout=wait or self.timeout * 3), stale=False)
+        except Exception as e:
+            error = str(e) or 'SonarQube não respondeu a tempo'
+            if cached:
+                return dict(cached[0], stale=True, error=error)
+            return {'success': False, 'error': error}
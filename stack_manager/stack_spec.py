@@ -0,0 +1,339 @@
+"""
+Modelo tipado dos stacks criados pelo Stack Manager
+
+`StackSpec` descreve um stack (serviço principal + banco opcional) e é
+imutável e hashable. `render_stack` transforma o spec num dict de compose sem
+efeitos colaterais, e `dump_stack` serializa esse dict com o dumper em C do
+PyYAML, memoizado pelo próprio spec: o mesmo spec gera sempre os mesmos
+bytes, o que permite detectar gravações e deploys sem mudança. O mesmo
+modelo lê de volta os arquivos gerados (`StackSpec.from_compose`).
+
+Opcionalmente o banco ganha um pool de conexões na frente (PgBouncer para
+postgres, ProxySQL para mariadb/mysql) no serviço <stack>_pooler; a aplicação
+passa a apontar para ele e o banco recebe só as conexões do pool.
+"""
+from dataclasses import dataclass, field
+from functools import lru_cache
+
+import yaml
+
+try:
+    from yaml import CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeDumper
+
+DEFAULT_NETWORK = 'devops-network'
+DEFAULT_DB_PASSWORD = 'password123'
+ROOT_PASSWORD = 'root123'
+
+# Por tipo de banco: imagem, porta, diretório de dados, variáveis do próprio
+# banco e variáveis de conexão injetadas no serviço principal
+DATABASES = {
+    'mariadb': {
+        'image': 'mariadb:latest',
+        'port': '3306',
+        'data': '/var/lib/mysql',
+        'server_env': (('MYSQL_ROOT_PASSWORD', ROOT_PASSWORD), ('MYSQL_DATABASE', '{name}'),
+                       ('MYSQL_USER', '{user}'), ('MYSQL_PASSWORD', '{password}')),
+        'client_env': (('DB_HOST', '{host}'), ('DB_PORT', '{port}'), ('DB_NAME', '{name}'),
+                       ('DB_USER', '{user}'), ('DB_PASSWORD', '{password}'))
+    },
+    'mysql': {
+        'image': 'mysql:8',
+        'port': '3306',
+        'data': '/var/lib/mysql',
+        'server_env': (('MYSQL_ROOT_PASSWORD', ROOT_PASSWORD), ('MYSQL_DATABASE', '{name}'),
+                       ('MYSQL_USER', '{user}'), ('MYSQL_PASSWORD', '{password}')),
+        'client_env': (('DB_HOST', '{host}'), ('DB_PORT', '{port}'), ('DB_NAME', '{name}'),
+                       ('DB_USER', '{user}'), ('DB_PASSWORD', '{password}'))
+    },
+    'postgres': {
+        'image': 'postgres:15',
+        'port': '5432',
+        'data': '/var/lib/postgresql/data',
+        'server_env': (('POSTGRES_DB', '{name}'), ('POSTGRES_USER', '{user}'), ('POSTGRES_PASSWORD', '{password}')),
+        'client_env': (('POSTGRES_HOST', '{host}'), ('POSTGRES_PORT', '{port}'), ('POSTGRES_DB', '{name}'),
+                       ('POSTGRES_USER', '{user}'), ('POSTGRES_PASSWORD', '{password}'))
+    },
+    'mongodb': {
+        'image': 'mongo:6',
+        'port': '27017',
+        'data': '/data/db',
+        'server_env': (('MONGO_INITDB_ROOT_USERNAME', '{user}'), ('MONGO_INITDB_ROOT_PASSWORD', '{password}'),
+                       ('MONGO_INITDB_DATABASE', '{name}')),
+        'client_env': (('MONGO_HOST', '{host}'), ('MONGO_PORT', '{port}'), ('MONGO_DB', '{name}'),
+                       ('MONGO_USER', '{user}'), ('MONGO_PASSWORD', '{password}'))
+    }
+}
+
+# Pools de conexão por tipo de banco: imagem e modos aceitos. No ProxySQL,
+# 'transaction' liga o multiplexing (conexões do banco devolvidas ao pool ao
+# fim de cada transação) e 'session' prende uma conexão por cliente.
+POOLERS = {
+    'postgres': {'image': 'edoburu/pgbouncer:latest', 'modes': ('transaction', 'session', 'statement')},
+    'mariadb': {'image': 'proxysql/proxysql:latest', 'modes': ('transaction', 'session')},
+    'mysql': {'image': 'proxysql/proxysql:latest', 'modes': ('transaction', 'session')}
+}
+DEFAULT_POOL_MODE = 'transaction'
+DEFAULT_POOL_SIZE = 20
+MAX_CLIENT_CONNECTIONS = 1000
+
+# Grava a configuração recebida por variável de ambiente e sobe o ProxySQL
+# com ela ($$ escapa a interpolação do docker stack deploy)
+PROXYSQL_ENTRYPOINT = ('printf \'%s\\n\' "$$PROXYSQL_CNF" > /etc/proxysql.cnf && '
+                       'exec proxysql -f --idle-threads --initial -c /etc/proxysql.cnf -D /var/lib/proxysql')
+
+
+def _env_pairs(value):
+    """environment em lista "K=V" ou dict -> tupla ordenada de pares (cópia, sem alterar a origem)"""
+    if isinstance(value, dict):
+        return tuple((str(k), '' if v is None else str(v)) for k, v in value.items())
+    pairs = []
+    for item in value or []:
+        key, _, val = str(item).partition('=')
+        pairs.append((key, val))
+    return tuple(pairs)
+
+
+def _cnf_string(value):
+    return '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+@dataclass(frozen=True, slots=True)
+class PoolerSpec:
+    """Pool de conexões na frente do banco (serviço <stack>_pooler)"""
+
+    mode: str = DEFAULT_POOL_MODE
+    size: int = DEFAULT_POOL_SIZE
+
+
+@dataclass(frozen=True, slots=True)
+class DatabaseSpec:
+    """Banco de dados do stack (serviço <stack>_database)"""
+
+    type: str
+    name: str
+    user: str
+    password: str = DEFAULT_DB_PASSWORD
+    pooler: PoolerSpec = None
+
+    def values(self, stack_name):
+        host = f'{stack_name}_pooler' if self.pooler else f'{stack_name}_database'
+        return {'host': host, 'port': DATABASES[self.type]['port'],
+                'name': self.name, 'user': self.user, 'password': self.password}
+
+    def client_env(self, stack_name):
+        values = self.values(stack_name)
+        return tuple((key, template.format(**values)) for key, template in DATABASES[self.type]['client_env'])
+
+    def server_env(self, stack_name):
+        values = self.values(stack_name)
+        return tuple((key, template.format(**values)) for key, template in DATABASES[self.type]['server_env'])
+
+    def pooler_env(self, stack_name):
+        """Variáveis do serviço <stack>_pooler"""
+        port = DATABASES[self.type]['port']
+        env = (('POOL_MODE', self.pooler.mode), ('DEFAULT_POOL_SIZE', str(self.pooler.size)))
+        if self.type == 'postgres':
+            return env + (
+                ('DB_HOST', f'{stack_name}_database'), ('DB_PORT', port), ('DB_NAME', self.name),
+                ('DB_USER', self.user), ('DB_PASSWORD', self.password), ('LISTEN_PORT', port),
+                ('AUTH_TYPE', 'scram-sha-256'), ('MAX_CLIENT_CONN', str(MAX_CLIENT_CONNECTIONS))
+            )
+        user, password = _cnf_string(self.user), _cnf_string(self.password)
+        cnf = '\n'.join([
+            'datadir="/var/lib/proxysql"',
+            'admin_variables={ mysql_ifaces="127.0.0.1:6032" }',
+            f'mysql_variables={{ interfaces="0.0.0.0:{port}" max_connections={MAX_CLIENT_CONNECTIONS} '
+            f'multiplexing={str(self.pooler.mode == "transaction").lower()} '
+            f'monitor_username={user} monitor_password={password} }}',
+            f'mysql_servers=({{ address="{stack_name}_database" port={port} hostgroup=0 '
+            f'max_connections={self.pooler.size} }})',
+            f'mysql_users=({{ username={user} password={password} default_hostgroup=0 '
+            f'transaction_persistent=1 }})'
+        ])
+        return env + (('PROXYSQL_CNF', cnf),)
+
+
+@dataclass(frozen=True, slots=True)
+class StackSpec:
+    """Stack gerado pelo formulário: serviço principal, rede, Traefik e banco opcional"""
+
+    name: str
+    image: str
+    container_port: int
+    public_port: int
+    replicas: int = 1
+    network: str = DEFAULT_NETWORK
+    health_check: str = None
+    env: tuple = field(default=())
+    traefik_domain: str = None
+    database: DatabaseSpec = None
+
+    @classmethod
+    def from_request(cls, data):
+        """Spec a partir dos dados de criação (camelCase, como em /api/create-stack)"""
+        name = data['name']
+        database = None
+        config = data.get('database') or {}
+        if data.get('includeDatabase') and config:
+            db_type = config.get('type', 'mariadb')
+            if db_type in DATABASES:
+                pooler = None
+                if config.get('pooler') and db_type in POOLERS:
+                    pooler = PoolerSpec(
+                        mode=config['pooler'].get('mode') or DEFAULT_POOL_MODE,
+                        size=int(config['pooler'].get('poolSize') or DEFAULT_POOL_SIZE)
+                    )
+                database = DatabaseSpec(
+                    type=db_type,
+                    name=config.get('name', name),
+                    user=config.get('user', name),
+                    password=config.get('password', DEFAULT_DB_PASSWORD),
+                    pooler=pooler
+                )
+        return cls(
+            name=name,
+            image=data['image'],
+            container_port=int(data['containerPort']),
+            public_port=int(data['publicPort']),
+            replicas=int(data.get('replicas', 1)),
+            network=data.get('network') or DEFAULT_NETWORK,
+            health_check=data.get('healthCheck') or None,
+            env=_env_pairs(data.get('envVars')),
+            traefik_domain=(data.get('traefikDomain') or None) if data.get('useTraefik') else None,
+            database=database
+        )
+
+    @classmethod
+    def from_compose(cls, stack_name, content):
+        """Spec de um arquivo gerado pelo Stack Manager; None para stacks escritos à mão"""
+        try:
+            services = content['services']
+            service = services[stack_name]
+            port = service['ports'][0]
+            deploy = service.get('deploy') or {}
+
+            database = None
+            db_service = services.get(f'{stack_name}_database')
+            if db_service:
+                db_type = next(t for t, d in DATABASES.items() if db_service['image'] == d['image'])
+                server = dict(_env_pairs(db_service.get('environment')))
+                fields = {template: key for key, template in DATABASES[db_type]['server_env']}
+                pooler = None
+                pooler_service = services.get(f'{stack_name}_pooler')
+                if pooler_service:
+                    pool = dict(_env_pairs(pooler_service.get('environment')))
+                    pooler = PoolerSpec(mode=pool['POOL_MODE'], size=int(pool['DEFAULT_POOL_SIZE']))
+                database = DatabaseSpec(type=db_type, name=server[fields['{name}']],
+                                        user=server[fields['{user}']], password=server[fields['{password}']],
+                                        pooler=pooler)
+
+            env = _env_pairs(service.get('environment'))
+            if database:
+                injected = dict(database.client_env(stack_name))
+                env = tuple((k, v) for k, v in env if injected.get(k) != v)
+
+            health_check = None
+            if service.get('healthcheck'):
+                url = service['healthcheck']['test'][-1]
+                health_check = url.split(f":{port['target']}", 1)[1] or None
+
+            traefik_domain = None
+            for label in deploy.get('labels') or []:
+                if label.startswith(f'traefik.http.routers.{stack_name}.rule=Host(`'):
+                    traefik_domain = label.split('`')[1]
+
+            return cls(
+                name=stack_name,
+                image=service['image'],
+                container_port=int(port['target']),
+                public_port=int(port['published']),
+                replicas=int(deploy.get('replicas', 1)),
+                network=(service.get('networks') or [DEFAULT_NETWORK])[0],
+                health_check=health_check,
+                env=env,
+                traefik_domain=traefik_domain,
+                database=database
+            )
+        except (KeyError, IndexError, TypeError, ValueError, AttributeError, StopIteration):
+            return None
+
+
+def _service_deploy(replicas, labels=None):
+    """Bloco deploy; objetos novos a cada chamada (objetos compartilhados viram âncoras no YAML)"""
+    deploy = {'mode': 'replicated', 'replicas': replicas, 'placement': {'constraints': ['node.role == worker']}}
+    if labels is None:
+        deploy['restart_policy'] = {'condition': 'on-failure'}
+        return deploy
+    deploy['restart_policy'] = {'condition': 'on-failure', 'delay': '5s', 'max_attempts': 3}
+    deploy['update_config'] = {'parallelism': 1, 'delay': '10s', 'failure_action': 'rollback'}
+    deploy['labels'] = labels
+    return deploy
+
+
+def render_stack(spec):
+    """Compose (dict) do stack; função pura do spec"""
+    env = dict(spec.env)
+    if spec.database:
+        env.update(spec.database.client_env(spec.name))
+
+    service = {
+        'image': spec.image,
+        'networks': [spec.network],
+        'ports': [{'target': spec.container_port, 'published': spec.public_port, 'mode': 'host'}]
+    }
+    if env:
+        service['environment'] = [f'{k}={v}' for k, v in env.items()]
+    if spec.health_check:
+        service['healthcheck'] = {
+            'test': ['CMD', 'curl', '-f', f'http://localhost:{spec.container_port}{spec.health_check}'],
+            'interval': '30s',
+            'timeout': '10s',
+            'retries': 3,
+            'start_period': '40s'
+        }
+
+    labels = []
+    if spec.traefik_domain:
+        labels += [
+            'traefik.enable=true',
+            f'traefik.http.routers.{spec.name}.rule=Host(`{spec.traefik_domain}`)',
+            f'traefik.http.routers.{spec.name}.entrypoints=web',
+            f'traefik.http.services.{spec.name}.loadbalancer.server.port={spec.container_port}'
+        ]
+    labels += [f'app={spec.name}', 'environment=homologacao']
+    service['deploy'] = _service_deploy(spec.replicas, labels)
+
+    compose = {'version': '3.9', 'services': {spec.name: service}}
+
+    if spec.database:
+        definition = DATABASES[spec.database.type]
+        volume = f'{spec.name}_db_data'
+        compose['services'][f'{spec.name}_database'] = {
+            'image': definition['image'],
+            'networks': [spec.network],
+            'environment': [f'{k}={v}' for k, v in spec.database.server_env(spec.name)],
+            'volumes': [f"{volume}:{definition['data']}"],
+            'deploy': _service_deploy(1)
+        }
+        compose['volumes'] = {volume: None}
+
+        if spec.database.pooler:
+            pooler = {'image': POOLERS[spec.database.type]['image']}
+            if spec.database.type != 'postgres':
+                pooler['entrypoint'] = ['sh', '-c', PROXYSQL_ENTRYPOINT]
+            pooler['networks'] = [spec.network]
+            pooler['environment'] = [f'{k}={v}' for k, v in spec.database.pooler_env(spec.name)]
+            pooler['deploy'] = _service_deploy(1)
+            compose['services'][f'{spec.name}_pooler'] = pooler
+
+    compose['networks'] = {spec.network: {'external': True}}
+    return compose
+
+
+@lru_cache(maxsize=4096)
+def dump_stack(spec):
+    """YAML do stack, estável byte a byte para o mesmo spec (memoizado pelo hash do spec)"""
+    return yaml.dump(render_stack(spec), Dumper=SafeDumper, sort_keys=False,
+                     default_flow_style=False, allow_unicode=True, width=4096)
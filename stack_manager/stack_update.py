@@ -0,0 +1,144 @@
+"""
+Atualização in-place de stacks - diff do compose e rolling update
+
+Compara o compose novo com o que está em disco (última versão deployada) e
+com os serviços realmente em execução, classificando cada serviço como
+adicionado, removido, alterado ou inalterado. Sem mudanças o deploy é
+pulado; com mudanças o `docker stack deploy` é aplicado sem remover a stack,
+de modo que o Swarm só atualiza os serviços alterados, respeitando o
+update_config de cada um.
+"""
+import time
+
+TOP_LEVEL_KEYS = ('networks', 'volumes', 'configs', 'secrets')
+FINAL_UPDATE_STATES = ('completed', 'rollback_completed', 'paused', 'rollback_paused')
+
+
+def _as_mapping(value):
+    """environment/labels aceitam lista "K=V" ou dict; normaliza para dict de strings"""
+    if isinstance(value, list):
+        result = {}
+        for item in value:
+            key, _, val = str(item).partition('=')
+            result[key] = val
+        return result
+    if isinstance(value, dict):
+        return {str(k): '' if v is None else str(v) for k, v in value.items()}
+    return value
+
+
+def normalize_service(spec):
+    """Normaliza um serviço do compose para comparação estável"""
+    spec = dict(spec or {})
+    if 'environment' in spec:
+        spec['environment'] = _as_mapping(spec['environment'])
+    if 'labels' in spec:
+        spec['labels'] = _as_mapping(spec['labels'])
+    deploy = spec.get('deploy')
+    if isinstance(deploy, dict) and 'labels' in deploy:
+        spec['deploy'] = dict(deploy, labels=_as_mapping(deploy['labels']))
+    return spec
+
+
+def plan_stack_update(old_compose, new_compose, running_services):
+    """Plano de atualização por serviço
+
+    `running_services` são os nomes curtos (sem o prefixo "<stack>_") dos
+    serviços em execução. Retorna {'services': {nome: {'action', 'fields'}},
+    'top_level': [...], 'needs_deploy': bool}.
+    """
+    old_services = (old_compose or {}).get('services') or {}
+    new_services = (new_compose or {}).get('services') or {}
+    running = set(running_services)
+    services = {}
+
+    for name, spec in new_services.items():
+        if name not in running:
+            services[name] = {'action': 'added', 'fields': []}
+            continue
+        old = normalize_service(old_services.get(name))
+        new = normalize_service(spec)
+        fields = sorted(k for k in set(old) | set(new) if old.get(k) != new.get(k))
+        services[name] = {'action': 'changed' if fields else 'unchanged', 'fields': fields}
+
+    for name in sorted(running - set(new_services)):
+        services[name] = {'action': 'removed', 'fields': []}
+
+    top_level = [k for k in TOP_LEVEL_KEYS
+                 if (old_compose or {}).get(k) != (new_compose or {}).get(k)]
+
+    needs_deploy = bool(top_level) or any(s['action'] != 'unchanged' for s in services.values())
+    return {'services': services, 'top_level': top_level, 'needs_deploy': needs_deploy}
+
+
+def format_plan(stack_name, plan):
+    """Linhas legíveis com o resumo do plano"""
+    icons = {'added': '+', 'removed': '-', 'changed': '~', 'unchanged': '='}
+    lines = [f'Plano de atualização de {stack_name}:']
+    for name, change in sorted(plan['services'].items()):
+        fields = f" ({', '.join(change['fields'])})" if change['fields'] else ''
+        lines.append(f"  {icons[change['action']]} {name}: {change['action']}{fields}")
+    if plan['top_level']:
+        lines.append(f"  ~ top-level: {', '.join(plan['top_level'])}")
+    return lines
+
+
+def snapshot_updates(run, stack_name, services):
+    """{serviço: (Version.Index, UpdateStatus.State, UpdateStatus.StartedAt)} num único inspect"""
+    full_names = {f'{stack_name}_{name}': name for name in services}
+    result = run(['docker', 'service', 'inspect', '--format',
+                  '{{.Spec.Name}} {{.Version.Index}} '
+                  '{{if .UpdateStatus}}{{.UpdateStatus.State}} {{.UpdateStatus.StartedAt}}{{end}}',
+                  *full_names])
+    updates = {}
+    for line in result['stdout'].splitlines():
+        parts = line.split(None, 3)
+        if len(parts) >= 2 and parts[0] in full_names:
+            state = parts[2] if len(parts) > 2 else ''
+            started_at = parts[3].strip() if len(parts) > 3 else ''
+            updates[full_names[parts[0]]] = (int(parts[1]), state, started_at)
+    return updates
+
+
+def wait_for_rollout(run, stack_name, services, before=None, timeout=180, interval=2.0, start_grace=20):
+    """Acompanha o UpdateStatus dos serviços alterados até um estado final
+
+    `run(args)` executa um comando docker no manager e retorna o dict padrão
+    (success/stdout/stderr). `before` é o `snapshot_updates` tirado antes do
+    deploy: só vale um estado final de um update iniciado depois dele (o
+    UpdateStatus de um update anterior fica no serviço até o próximo começar).
+    Se a spec mudou mas nenhum update começou em `start_grace` segundos
+    (mudança que não recria tasks), o serviço fica como 'completed'; se nem a
+    versão mudou, como 'unchanged'. Retorna {serviço: estado}.
+    """
+    before = before or {}
+    pending = set(services)
+    states = {}
+    started = time.monotonic()
+    deadline = started + timeout
+
+    while pending:
+        updates = snapshot_updates(run, stack_name, pending)
+        waited = time.monotonic() - started
+        for name in list(pending):
+            if name not in updates:
+                continue
+            index, state, started_at = updates[name]
+            old_index, _, old_started_at = before.get(name, (None, '', ''))
+            new_update = bool(state) and started_at != old_started_at
+            if new_update and state in FINAL_UPDATE_STATES:
+                states[name] = state
+                pending.discard(name)
+            elif not new_update and waited >= start_grace:
+                states[name] = 'completed' if index != old_index else 'unchanged'
+                pending.discard(name)
+
+        if not pending:
+            break
+        if time.monotonic() >= deadline:
+            for name in pending:
+                states[name] = 'timeout'
+            break
+        time.sleep(interval)
+
+    return states
@@ -0,0 +1,182 @@
+"""
+Coletor de status do Swarm - uma única consulta em lote por intervalo
+
+Uma thread em background consulta stacks e serviços (com réplicas) numa só
+chamada em formato JSON e publica um snapshot versionado em memória. Os
+endpoints apenas leem o snapshot, então N dashboards abertos custam uma
+consulta por intervalo e não N.
+"""
+import json
+import threading
+import time
+from datetime import datetime
+
+SEPARATOR = '---services---'
+
+# Stacks e serviços numa só execução dentro do manager do Swarm
+BATCH_SCRIPT = (
+    "docker stack ls --format '{{json .}}' && "
+    f"echo '{SEPARATOR}' && "
+    "docker service ls --format '{{json .}}'"
+)
+
+
+def run_batch_query(docker_api, node='lab-swarm1', timeout=10):
+    """Executa a consulta em lote via exec da Engine API e retorna (ok, stdout, stderr)"""
+    result = docker_api.exec_run(node, ['sh', '-c', BATCH_SCRIPT], timeout=timeout)
+    return result['success'], result['stdout'], result['stderr']
+
+
+def _json_lines(text):
+    items = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            items.append(json.loads(line))
+        except ValueError:
+            continue
+    return items
+
+
+def parse_replicas(value):
+    """Converte '2/3' ou '1/1 (max 1 per node)' em (running, desired)"""
+    try:
+        running, desired = (value or '').split()[0].split('/')
+        return int(running), int(desired)
+    except (ValueError, IndexError):
+        return 0, 0
+
+
+def parse_batch_output(stdout):
+    """Monta a lista de stacks com os serviços e réplicas de cada um"""
+    stacks_part, _, services_part = stdout.partition(SEPARATOR)
+
+    stacks = {}
+    for item in _json_lines(stacks_part):
+        name = item.get('Name')
+        if name:
+            stacks[name] = {
+                'name': name,
+                'services': item.get('Services', 'N/A'),
+                'replicas': [],
+                'running': 0,
+                'desired': 0
+            }
+
+    # Serviços de stacks seguem o padrão <stack>_<serviço>; o prefixo mais longo vence
+    names_by_length = sorted(stacks, key=len, reverse=True)
+    for item in _json_lines(services_part):
+        service_name = item.get('Name', '')
+        stack_name = next((s for s in names_by_length if service_name.startswith(f'{s}_')), None)
+        if not stack_name:
+            continue
+
+        running, desired = parse_replicas(item.get('Replicas'))
+        stack = stacks[stack_name]
+        stack['replicas'].append({
+            'service': service_name,
+            'image': item.get('Image', ''),
+            'mode': item.get('Mode', ''),
+            'running': running,
+            'desired': desired
+        })
+        stack['running'] += running
+        stack['desired'] += desired
+
+    for stack in stacks.values():
+        stack['replicas'].sort(key=lambda r: r['service'])
+
+    return [stacks[name] for name in sorted(stacks)]
+
+
+class SwarmStatusCollector:
+    """Dono do estado do Swarm: coleta periodicamente e serve snapshots versionados"""
+
+    def __init__(self, query, catalog=None, interval=5.0):
+        self.catalog = catalog
+        self.query = query
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._listeners = []
+        self._snapshot = {
+            'version': 0,
+            'running_stacks': [],
+            'timestamp': None,
+            'error': None
+        }
+
+    def start(self):
+        """Inicia a thread de coleta (idempotente)"""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='swarm-status', daemon=True)
+            self._thread.start()
+
+    def refresh_now(self):
+        """Antecipa a próxima coleta (ex.: logo após um deploy ou remoção)"""
+        self._wakeup.set()
+
+    def add_listener(self, callback):
+        """Registra callback chamado com o snapshot sempre que a versão muda"""
+        self._listeners.append(callback)
+
+    def snapshot(self, wait=2.0):
+        """Retorna o snapshot atual, aguardando a primeira coleta se necessário"""
+        self.start()
+        self._ready.wait(wait)
+        with self._lock:
+            return dict(self._snapshot)
+
+    def collect_once(self):
+        """Executa uma coleta e atualiza o snapshot se algo mudou"""
+        try:
+            ok, stdout, stderr = self.query()
+            if ok:
+                stacks, error = parse_batch_output(stdout), None
+            else:
+                stacks, error = [], stderr.strip() or 'Falha ao consultar o Swarm'
+        except Exception as e:
+            stacks, error = [], str(e)
+
+        # Anexar portas e URLs do catálogo (consulta indexada por nome)
+        for stack in stacks:
+            stack_info = self.catalog.get(stack['name']) if self.catalog else None
+            stack['ports'] = stack_info.get('ports', []) if stack_info else []
+            stack['urls'] = stack_info.get('urls', []) if stack_info else []
+
+        with self._lock:
+            changed = (stacks != self._snapshot['running_stacks']
+                       or error != self._snapshot['error'])
+            if changed:
+                self._snapshot = {
+                    'version': self._snapshot['version'] + 1,
+                    'running_stacks': stacks,
+                    'timestamp': datetime.now().isoformat(),
+                    'error': error
+                }
+            else:
+                self._snapshot['timestamp'] = datetime.now().isoformat()
+            snapshot = dict(self._snapshot)
+        self._ready.set()
+
+        if changed:
+            for callback in list(self._listeners):
+                try:
+                    callback(snapshot)
+                except Exception as e:
+                    print(f"Erro em listener do status do Swarm: {e}")
+        return snapshot
+
+    def _run(self):
+        while True:
+            started = time.monotonic()
+            self.collect_once()
+            remaining = self.interval - (time.monotonic() - started)
+            self._wakeup.wait(max(remaining, 0))
+            self._wakeup.clear()
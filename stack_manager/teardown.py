@@ -0,0 +1,156 @@
+"""
+Teardown do lab - remoção concorrente dos stacks com espera por convergência
+
+Descobre todos os stacks realmente em execução (inclusive os criados pela
+API), remove todos ao mesmo tempo e espera o Swarm convergir de verdade (sem
+serviços, containers de tasks ou redes de stack) dentro de um prazo, em vez
+de sleeps fixos. Depois sai do Swarm e derruba a infraestrutura do compose,
+medindo o tempo de cada fase.
+
+Uso via CLI (na raiz do projeto):
+    python -m stack_manager.teardown
+"""
+import argparse
+import os
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from .bootstrap import (COMPOSE_FILE, MANAGER, OVERLAY_NETWORKS, WORKER, BootstrapError, Step,
+                        format_report, run_dag, wait_until)
+from .docker_client import DEFAULT_SOCKET, DockerAPIError, DockerClient
+
+STACK_LABEL = 'label=com.docker.stack.namespace'
+
+
+class LabTeardown:
+    """Monta e executa as fases de destruição do lab"""
+
+    def __init__(self, docker_api, base_dir='.', log=print, timeout=90, max_workers=8):
+        self.docker = docker_api
+        self.base_dir = base_dir
+        self.log = log
+        self.timeout = timeout
+        self.max_workers = max_workers
+        self.lab_running = True
+        self.stacks = []
+
+    def _exec(self, node, args, timeout=60):
+        return self.docker.exec_run(node, args, timeout=timeout)
+
+    def _ids(self, node, args):
+        result = self._exec(node, args, timeout=15)
+        if not result['success']:
+            raise BootstrapError(result['stderr'].strip())
+        return result['stdout'].split()
+
+    # ----- fases -----
+
+    def discover(self):
+        try:
+            self.lab_running = self.docker.inspect_container(MANAGER)['State']['Running']
+        except DockerAPIError:
+            self.lab_running = False
+
+        if not self.lab_running:
+            self.log('Lab não está em execução. Nada para destruir.')
+            return
+
+        result = self._exec(MANAGER, ['docker', 'stack', 'ls', '--format', '{{.Name}}'], timeout=15)
+        # Fora do modo Swarm não há stacks para remover
+        self.stacks = result['stdout'].split() if result['success'] else []
+        self.log(f"Stacks em execução: {', '.join(self.stacks) or 'nenhum'}")
+
+    def remove_stacks(self):
+        if not self.stacks:
+            return
+
+        def remove(name):
+            result = self._exec(MANAGER, ['docker', 'stack', 'rm', name])
+            if not result['success']:
+                raise BootstrapError(f"{name}: {result['stderr'].strip()}")
+            self.log(f'Stack {name} removida')
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='teardown') as pool:
+            errors = [f.exception() for f in [pool.submit(remove, n) for n in self.stacks]]
+        errors = [str(e) for e in errors if e]
+        if errors:
+            raise BootstrapError('; '.join(errors))
+
+    def converged(self):
+        """Sem serviços de stack, containers de tasks nem redes de stack nos nodes"""
+        if self._ids(MANAGER, ['docker', 'service', 'ls', '-q', '--filter', STACK_LABEL]):
+            return False
+        if self._ids(MANAGER, ['docker', 'network', 'ls', '-q', '--filter', STACK_LABEL]):
+            return False
+        for node in (MANAGER, WORKER):
+            if self._ids(node, ['docker', 'ps', '-q', '--filter', STACK_LABEL]):
+                return False
+        return True
+
+    def wait_convergence(self):
+        if not self.stacks:
+            return
+        wait_until(self.converged, self.timeout, 'remoção de serviços, tasks e redes', maximum=1.0)
+
+    def remove_networks(self):
+        if not self.lab_running:
+            return
+        for network in OVERLAY_NETWORKS:
+            self._exec(MANAGER, ['docker', 'network', 'rm', network], timeout=15)
+
+    def leave_swarm(self):
+        if not self.lab_running:
+            return
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            for node in (WORKER, MANAGER):
+                pool.submit(self._exec, node, ['docker', 'swarm', 'leave', '--force'], 30)
+
+    def compose_down(self):
+        if not self.lab_running:
+            return
+        process = subprocess.Popen(
+            ['docker', 'compose', '-f', COMPOSE_FILE, 'down', '-v'],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            cwd=self.base_dir
+        )
+        for line in process.stdout:
+            self.log(line.rstrip('\n'))
+        if process.wait() != 0:
+            raise BootstrapError('docker compose down falhou')
+
+    def steps(self):
+        """Fases em sequência; falhas não interrompem a destruição (best-effort)"""
+        phases = [
+            ('discover', self.discover),
+            ('remove-stacks', self.remove_stacks),
+            ('converge', self.wait_convergence),
+            ('remove-networks', self.remove_networks),
+            ('swarm-leave', self.leave_swarm),
+            ('compose-down', self.compose_down),
+        ]
+        steps = []
+        for i, (name, fn) in enumerate(phases):
+            steps.append(Step(name, fn, [phases[i - 1][0]] if i else []))
+        return steps
+
+    def run(self):
+        return run_dag(self.steps(), log=self.log, stop_on_failure=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Destrói o lab DevOps')
+    parser.add_argument('--socket', default=os.getenv('DOCKER_SOCKET', DEFAULT_SOCKET))
+    parser.add_argument('--timeout', type=float, default=90,
+                        help='prazo em segundos para a convergência após remover os stacks')
+    args = parser.parse_args(argv)
+
+    report = LabTeardown(DockerClient(args.socket), timeout=args.timeout).run()
+    print(format_report(report))
+    return 0 if report['success'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
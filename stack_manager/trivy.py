@@ -0,0 +1,718 @@
+"""
+Scans do Trivy com cache de resultados em disco
+
+Cada resultado é gravado pela chave (digest da imagem, versão do banco de
+vulnerabilidades do Trivy): reescanear uma imagem que não mudou, com o mesmo
+banco, devolve o resultado salvo sem rodar o Trivy. `force` ignora o cache e
+`ttl` define a idade máxima aceita. O store também mantém o último resultado
+de cada imagem para os totais exibidos no dashboard.
+
+Os scans usam o modo cliente/servidor do Trivy: o stack `trivy` mantém o
+banco carregado e aquecido, e o cliente (`--server`) só analisa as camadas da
+imagem. Se o servidor não responder, o scan cai para o container local.
+
+A saída do Trivy é lida linha a linha enquanto o processo roda (um template
+emite uma vulnerabilidade por linha) e gravada em lotes numa tabela SQLite
+indexada, sem montar o relatório inteiro em memória. A API consulta essa
+tabela com filtros, ordenação e paginação por cursor.
+
+A imagem só é lida uma vez por digest: o primeiro scan gera um SBOM
+(CycloneDX) guardado num volume do node, e as vulnerabilidades saem de
+`trivy sbom` sobre esse arquivo. Quando o banco do Trivy é atualizado,
+`reevaluate` reavalia apenas os SBOMs guardados, sem baixar nem descompactar
+imagens, e reporta as imagens que passaram a ter vulnerabilidades novas.
+
+Cada versão nova do banco gera um resultado novo por digest; `prune` mantém
+só os `KEEP_RESULTS` mais recentes de cada digest (o atual e o anterior, usado
+para apontar as vulnerabilidades novas) e descarta os digests que deixaram de
+ser o último scan de alguma imagem.
+"""
+import base64
+import hashlib
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+
+from .docker_client import DockerAPIError
+
+SEVERITIES = ('CRITICAL', 'HIGH', 'MEDIUM', 'LOW')
+SEVERITY_RANK = {name: rank for rank, name in enumerate(SEVERITIES + ('UNKNOWN',))}
+TRIVY_IMAGE = 'aquasec/trivy:latest'
+CACHE_VOLUME = 'trivy-cache'
+SBOM_VOLUME = 'trivy-sbom'
+SBOM_DIR = '/sbom'
+SERVER_SERVICE = 'trivy_trivy'
+
+# Uma vulnerabilidade por linha (JSON), com o alvo (camada/arquivo) em que foi encontrada
+LINE_TEMPLATE = (
+    '{{- range .Results }}{{- $target := .Target }}{{- range .Vulnerabilities }}'
+    '{"target":{{ toJson $target }},"vuln":{{ toJson . }}}\n{{ end }}{{- end }}'
+)
+SORT_COLUMNS = {'severity': 'severity', 'package': 'package', 'id': 'vuln_id'}
+WRITE_BATCH = 500
+KEEP_RESULTS = 2
+SUPERSEDED_TTL = 7 * 86400
+
+
+class TrivyError(Exception):
+    """Falha ao resolver a imagem ou executar o scan"""
+
+
+def vulnerability_row(target, vuln):
+    """Linha compacta da tabela a partir de um objeto Vulnerability do Trivy"""
+    description = vuln.get('Description') or ''
+    return (
+        vuln.get('VulnerabilityID', 'N/A'),
+        SEVERITY_RANK.get(vuln.get('Severity', 'UNKNOWN'), SEVERITY_RANK['UNKNOWN']),
+        vuln.get('PkgName', ''),
+        vuln.get('InstalledVersion', ''),
+        vuln.get('FixedVersion', ''),
+        vuln.get('Title', ''),
+        description[:200],
+        target or ''
+    )
+
+
+def _encode_cursor(value, idx):
+    return base64.urlsafe_b64encode(json.dumps([value, idx]).encode()).decode()
+
+
+def _decode_cursor(cursor):
+    try:
+        value, idx = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return value, int(idx)
+    except (ValueError, TypeError):
+        raise ValueError('Cursor inválido')
+
+
+class VulnerabilityWriter:
+    """Grava as vulnerabilidades de um scan em lotes, sob um id temporário até o commit"""
+
+    def __init__(self, store):
+        self.store = store
+        self.temp_id = f'tmp-{uuid.uuid4().hex}'
+        self.summary = {s.lower(): 0 for s in SEVERITIES}
+        self.count = 0
+        self._batch = []
+
+    def add(self, target, vuln):
+        row = vulnerability_row(target, vuln)
+        if row[1] < len(SEVERITIES):
+            self.summary[SEVERITIES[row[1]].lower()] += 1
+        self._batch.append((self.temp_id, self.count) + row)
+        self.count += 1
+        if len(self._batch) >= WRITE_BATCH:
+            self.flush()
+
+    def flush(self):
+        if self._batch:
+            conn = self.store._conn()
+            with conn:
+                conn.executemany('INSERT INTO vulnerabilities VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', self._batch)
+            self._batch = []
+
+    def commit(self, result_id):
+        """Publica as linhas sob o id definitivo, substituindo um resultado anterior"""
+        self.flush()
+        conn = self.store._conn()
+        with conn:
+            conn.execute('DELETE FROM vulnerabilities WHERE result = ?', (result_id,))
+            conn.execute('UPDATE vulnerabilities SET result = ? WHERE result = ?', (result_id, self.temp_id))
+
+    def abort(self):
+        self._batch = []
+        conn = self.store._conn()
+        with conn:
+            conn.execute('DELETE FROM vulnerabilities WHERE result = ?', (self.temp_id,))
+
+
+class TrivyResultStore:
+    """Resultados em disco por (digest, versão do banco) + índice do último scan por imagem
+
+    O resumo de cada scan fica num JSON pequeno; as vulnerabilidades ficam na
+    tabela `vulnerabilities` (vulns.db), indexada por severidade, pacote e id.
+    """
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        self.db_path = os.path.join(store_dir, 'vulns.db')
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._latest = {}
+        # digest -> {db_version: (scanned_at, result_id)}
+        self._results = {}
+        os.makedirs(store_dir, exist_ok=True)
+        self._init_schema()
+        self._load_index()
+        self._drop_orphans()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        conn = self._conn()
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS vulnerabilities (
+                result TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                vuln_id TEXT NOT NULL,
+                severity INTEGER NOT NULL,
+                package TEXT NOT NULL,
+                installed TEXT NOT NULL,
+                fixed TEXT NOT NULL,
+                title TEXT NOT NULL,
+                description TEXT NOT NULL,
+                target TEXT NOT NULL,
+                PRIMARY KEY (result, idx)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS vulnerabilities_severity ON vulnerabilities (result, severity, idx);
+            CREATE INDEX IF NOT EXISTS vulnerabilities_package ON vulnerabilities (result, package, idx);
+            CREATE INDEX IF NOT EXISTS vulnerabilities_id ON vulnerabilities (result, vuln_id, idx);
+            CREATE TABLE IF NOT EXISTS sboms (
+                digest TEXT PRIMARY KEY,
+                image TEXT NOT NULL,
+                node TEXT NOT NULL,
+                path TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+        ''')
+        # Sobras de scans interrompidos
+        with conn:
+            conn.execute("DELETE FROM vulnerabilities WHERE result LIKE 'tmp-%'")
+
+    @staticmethod
+    def key(digest, db_version):
+        return hashlib.sha256(f'{digest}|{db_version}'.encode()).hexdigest()
+
+    def _path(self, digest, db_version):
+        return os.path.join(self.store_dir, f'{self.key(digest, db_version)}.json')
+
+    def _load_index(self):
+        for file in os.listdir(self.store_dir):
+            if not file.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.store_dir, file)) as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                continue
+            self._index(entry)
+
+    def _index(self, entry):
+        result_id = entry.get('result_id') or self.key(entry['digest'], entry['db_version'])
+        self._results.setdefault(entry['digest'], {})[entry['db_version']] = (entry['scanned_at'], result_id)
+        current = self._latest.get(entry['image'])
+        if not current or entry['scanned_at'] >= current['scanned_at']:
+            self._latest[entry['image']] = {k: entry.get(k) for k in ('image', 'digest', 'db_version', 'result_id',
+                                                                      'scanned_at', 'summary')}
+
+    def get(self, digest, db_version):
+        try:
+            with open(self._path(digest, db_version)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, entry):
+        path = self._path(entry['digest'], entry['db_version'])
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(entry, f)
+        os.replace(tmp, path)
+        with self._lock:
+            self._index(entry)
+
+    def writer(self):
+        return VulnerabilityWriter(self)
+
+    def prune(self, keep=KEEP_RESULTS, superseded_ttl=SUPERSEDED_TTL):
+        """Remove resultados substituídos (JSON + vulnerabilidades); retorna quantos
+
+        Mantém os `keep` resultados mais recentes de cada digest. Digests que não
+        são mais o último scan de nenhuma imagem são removidos por inteiro depois
+        de `superseded_ttl` segundos.
+        """
+        cutoff = datetime.fromtimestamp(time.time() - superseded_ttl).isoformat()
+        with self._lock:
+            current = {e['digest'] for e in self._latest.values()}
+            in_use = {e['result_id'] for e in self._latest.values()}
+            doomed = []
+            for digest, results in self._results.items():
+                ordered = sorted(results.items(), key=lambda item: item[1][0], reverse=True)
+                drop = ordered[keep:]
+                if digest not in current and ordered[0][1][0] < cutoff:
+                    drop = ordered
+                doomed += [(digest, version, result_id) for version, (_, result_id) in drop
+                           if result_id not in in_use]
+
+            # JSON primeiro: sem ele o resultado não é mais servido do cache
+            for digest, version, _ in doomed:
+                try:
+                    os.remove(self._path(digest, version))
+                except FileNotFoundError:
+                    pass
+                del self._results[digest][version]
+                if not self._results[digest]:
+                    del self._results[digest]
+            gone = {digest for digest, _, _ in doomed} - set(self._results)
+
+        conn = self._conn()
+        with conn:
+            conn.executemany('DELETE FROM vulnerabilities WHERE result = ?', ((r,) for _, _, r in doomed))
+            conn.executemany('DELETE FROM sboms WHERE digest = ?', ((d,) for d in gone))
+        return len(doomed)
+
+    def _drop_orphans(self):
+        """Apaga vulnerabilidades de resultados sem JSON (limpeza interrompida)"""
+        known = {result_id for results in self._results.values() for _, result_id in results.values()}
+        conn = self._conn()
+        with conn:
+            stored = [row[0] for row in conn.execute('SELECT DISTINCT result FROM vulnerabilities')]
+            conn.executemany('DELETE FROM vulnerabilities WHERE result = ?',
+                             ((r,) for r in stored if r not in known))
+
+    # ----- SBOMs -----
+
+    def sbom(self, digest):
+        """SBOM guardado para o digest: {'digest', 'image', 'node', 'path', 'created_at'} ou None"""
+        row = self._conn().execute('SELECT digest, image, node, path, created_at FROM sboms WHERE digest = ?',
+                                   (digest,)).fetchone()
+        if not row:
+            return None
+        return {'digest': row[0], 'image': row[1], 'node': row[2] or None, 'path': row[3], 'created_at': row[4]}
+
+    def put_sbom(self, digest, image, node, path):
+        conn = self._conn()
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO sboms VALUES (?, ?, ?, ?, ?)',
+                         (digest, image, node or '', path, time.time()))
+
+    def forget_sbom(self, digest):
+        conn = self._conn()
+        with conn:
+            conn.execute('DELETE FROM sboms WHERE digest = ?', (digest,))
+
+    def new_findings(self, result_id, previous_id, limit=50):
+        """(vulnerabilidade, pacote) presentes em `result_id` e ausentes em `previous_id`"""
+        rows = self._conn().execute('''
+            SELECT vuln_id, package, MIN(severity) FROM vulnerabilities
+            WHERE result = ? AND (vuln_id, package) NOT IN (
+                SELECT vuln_id, package FROM vulnerabilities WHERE result = ?)
+            GROUP BY vuln_id, package
+            ORDER BY MIN(severity), vuln_id
+        ''', (result_id, previous_id)).fetchall()
+        findings = [{'id': vuln_id, 'package': pkg, 'severity': (SEVERITIES + ('UNKNOWN',))[severity]}
+                    for vuln_id, pkg, severity in rows]
+        return {'total': len(findings), 'items': findings[:limit]}
+
+    def query(self, result_id, severities=None, package=None, fixed_only=False,
+              sort='severity', descending=False, limit=100, cursor=None):
+        """Página de vulnerabilidades filtradas e ordenadas; cursor = posição após o último item"""
+        column = SORT_COLUMNS.get(sort)
+        if not column:
+            raise ValueError(f'Ordenação inválida: {sort}')
+
+        where, params = ['result = ?'], [result_id]
+        if severities:
+            ranks = [SEVERITY_RANK[s.upper()] for s in severities if s.upper() in SEVERITY_RANK]
+            where.append(f"severity IN ({','.join('?' * len(ranks))})")
+            params += ranks
+        if package:
+            where.append('package LIKE ?')
+            params.append(f'%{package}%')
+        if fixed_only:
+            where.append("fixed != ''")
+
+        conn = self._conn()
+        total = conn.execute(f"SELECT COUNT(*) FROM vulnerabilities WHERE {' AND '.join(where)}", params).fetchone()[0]
+
+        if cursor:
+            value, idx = _decode_cursor(cursor)
+            where.append(f"({column}, idx) {'<' if descending else '>'} (?, ?)")
+            params += [value, idx]
+
+        order = 'DESC' if descending else 'ASC'
+        rows = conn.execute(
+            f"SELECT idx, vuln_id, severity, package, installed, fixed, title, description, target "
+            f"FROM vulnerabilities WHERE {' AND '.join(where)} "
+            f"ORDER BY {column} {order}, idx {order} LIMIT ?",
+            params + [limit + 1]
+        ).fetchall()
+
+        items = [{
+            'id': vuln_id,
+            'severity': (SEVERITIES + ('UNKNOWN',))[severity],
+            'package': pkg,
+            'installed_version': installed,
+            'fixed_version': fixed,
+            'title': title,
+            'description': description,
+            'target': target
+        } for _, vuln_id, severity, pkg, installed, fixed, title, description, target in rows[:limit]]
+
+        next_cursor = None
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            sort_value = {'severity': last[2], 'package': last[3], 'vuln_id': last[1]}[column]
+            next_cursor = _encode_cursor(sort_value, last[0])
+        return {'total': total, 'items': items, 'next_cursor': next_cursor}
+
+    def latest(self):
+        """Último resultado (resumo) de cada imagem escaneada"""
+        with self._lock:
+            return sorted(self._latest.values(), key=lambda e: e['image'])
+
+    def aggregate(self):
+        """Totais por severidade somando o último scan de cada imagem"""
+        latest = self.latest()
+        totals = {s.lower(): sum(e['summary'].get(s.lower(), 0) for e in latest) for s in SEVERITIES}
+        totals['images'] = len(latest)
+        totals['last_scan'] = max((e['scanned_at'] for e in latest), default=None)
+        return totals
+
+
+class TrivyScanner:
+    """Executa o Trivy no manager do Swarm consultando o cache antes
+
+    `run(args, timeout, node=None)` executa um comando num node do Swarm (o
+    manager por padrão) e retorna o dict padrão (success/stdout/stderr);
+    `stream(args, timeout, node=None)` inicia o comando e retorna um
+    ExecStream, usado para ler a saída do scan linha a linha. Com
+    `server_url`, o cliente consulta o servidor do Trivy; o container local
+    (com o banco num volume do node) é só o fallback. `on_result(entry)` é
+    chamado a cada resultado novo (não para os que vêm do cache).
+    """
+
+    def __init__(self, run, stream, store, server_url=None, ttl=86400, digest_ttl=60, db_ttl=300, health_ttl=30,
+                 on_result=None):
+        self.run = run
+        self.stream = stream
+        self.store = store
+        self.on_result = on_result
+        self.server_url = server_url
+        self.ttl = ttl
+        self.digest_ttl = digest_ttl
+        self.db_ttl = db_ttl
+        self.health_ttl = health_ttl
+        self._digests = {}
+        self._db_versions = {}
+        self._server_ok = (False, 0.0)
+
+    def _trivy(self, *args):
+        # O socket do Docker do node deixa o Trivy ler a imagem local em vez de baixá-la de novo
+        return ['docker', 'run', '--rm', '-v', f'{CACHE_VOLUME}:/root/.cache/',
+                '-v', f'{SBOM_VOLUME}:{SBOM_DIR}',
+                '-v', '/var/run/docker.sock:/var/run/docker.sock', TRIVY_IMAGE, *args]
+
+    def server_available(self, refresh=False):
+        """Servidor do Trivy respondendo em /healthz (resultado guardado por alguns segundos)"""
+        if not self.server_url:
+            return False
+        ok, checked = self._server_ok
+        if not refresh and time.monotonic() - checked < self.health_ttl:
+            return ok
+        try:
+            ok = requests.get(f'{self.server_url}/healthz', timeout=3).status_code == 200
+        except requests.RequestException:
+            ok = False
+        self._server_ok = (ok, time.monotonic())
+        return ok
+
+    def _server_container(self):
+        result = self.run(['docker', 'ps', '-q', '--filter',
+                           f'label=com.docker.swarm.service.name={SERVER_SERVICE}'], timeout=15)
+        ids = result['stdout'].split() if result['success'] else []
+        return ids[0] if ids else None
+
+    def resolve_digest(self, image, refresh=False):
+        """ID (sha256) da imagem no node; baixa a imagem se ainda não existir"""
+        cached = self._digests.get(image)
+        if cached and not refresh and time.monotonic() - cached[1] < self.digest_ttl:
+            return cached[0]
+
+        inspect = ['docker', 'image', 'inspect', '--format', '{{.Id}}', image]
+        result = self.run(inspect, timeout=30)
+        if not result['success']:
+            pull = self.run(['docker', 'pull', '-q', image], timeout=600)
+            if not pull['success']:
+                raise TrivyError(pull['stderr'].strip() or f'Não foi possível baixar {image}')
+            result = self.run(inspect, timeout=30)
+            if not result['success']:
+                raise TrivyError(result['stderr'].strip())
+
+        digest = result['stdout'].strip()
+        self._digests[image] = (digest, time.monotonic())
+        return digest
+
+    def db_version(self, refresh=False, node=None):
+        """Versão (UpdatedAt) do banco de vulnerabilidades em uso; '' antes do primeiro download
+
+        No modo servidor vale o banco do container do servidor; no fallback,
+        o do volume local do node que executa o scan. Se o container do
+        servidor não estiver no manager, a versão dele não pode ser lida: o
+        modo servidor é tratado como indisponível até a próxima verificação e
+        vale a versão local.
+        """
+        server = self.server_available()
+        key = 'server' if server else (node or 'manager')
+        version, checked = self._db_versions.get(key, (None, 0.0))
+        if version is not None and not refresh and time.monotonic() - checked < self.db_ttl:
+            return version
+
+        container = self._server_container() if server else None
+        if server and not container:
+            self._server_ok = (False, time.monotonic())
+            return self.db_version(refresh, node)
+        if container:
+            result = self.run(['docker', 'exec', container, 'trivy', 'version', '--format', 'json'], timeout=30)
+        else:
+            result = self.run(self._trivy('version', '--format', 'json'), timeout=60, node=node)
+        version = ''
+        if result['success']:
+            try:
+                db = json.loads(result['stdout']).get('VulnerabilityDB') or {}
+                version = db.get('UpdatedAt') or db.get('Version') or ''
+            except ValueError:
+                pass
+        self._db_versions[key] = (str(version), time.monotonic())
+        return str(version)
+
+    def cached(self, image, ttl=None, node=None):
+        """Resultado salvo ainda válido para a imagem, sem executar o Trivy"""
+        digest = self.resolve_digest(image)
+        entry = self.store.get(digest, self.db_version(node=node))
+        ttl = self.ttl if ttl is None else ttl
+        # Resultados antigos sem a tabela de vulnerabilidades (result_id) são reescaneados
+        if entry and entry.get('result_id') and time.time() - entry['scanned_ts'] < ttl:
+            return dict(entry, cached=True)
+        return None
+
+    def _stream_scan(self, args, timeout, node):
+        """Roda o scan lendo uma vulnerabilidade por linha; retorna (writer, erro)"""
+        writer = self.store.writer()
+        stderr = deque(maxlen=20)
+        try:
+            stream = self.stream(args, timeout, node)
+            for name, line in stream.lines():
+                if name == 'stderr':
+                    stderr.append(line)
+                elif line.strip():
+                    item = json.loads(line)
+                    writer.add(item.get('target'), item.get('vuln') or {})
+            code = stream.exit_code()
+        except (OSError, TimeoutError, ValueError, DockerAPIError) as e:
+            writer.abort()
+            return None, f'Erro ao executar scan: {e}'
+        except Exception:
+            writer.abort()
+            raise
+
+        if code != 0:
+            writer.abort()
+            return None, '\n'.join(stderr).strip() or 'Erro ao executar scan'
+        return writer, None
+
+    def ensure_sbom(self, image, digest, node=None, refresh=False):
+        """SBOM do digest, gerado no `node` na primeira vez (única leitura da imagem)"""
+        sbom = None if refresh else self.store.sbom(digest)
+        if sbom:
+            return sbom
+
+        path = f"{SBOM_DIR}/{digest.replace(':', '-')}.cdx.json"
+        # Só o inventário de pacotes: gerar o SBOM não consulta o banco de vulnerabilidades
+        result = self.run(self._trivy('image', '--format', 'cyclonedx', '--output', path, image),
+                          timeout=1800, node=node)
+        if not result['success']:
+            raise TrivyError(result['stderr'].strip() or f'Não foi possível gerar o SBOM de {image}')
+        self.store.put_sbom(digest, image, node, path)
+        return self.store.sbom(digest)
+
+    def _scan_sbom(self, sbom):
+        """Vulnerabilidades do SBOM (servidor com fallback local); retorna (modo, writer)"""
+        scan_args = ['--format', 'template', '--template', LINE_TEMPLATE,
+                     '--severity', ','.join(SEVERITIES), sbom['path']]
+        node = sbom['node']
+
+        # Só usa o servidor se a versão do banco dele puder ser lida (ver db_version)
+        if self.server_available():
+            self.db_version(node=node)
+        mode = 'server' if self.server_available() else 'local'
+        if mode == 'server':
+            writer, error = self._stream_scan(self._trivy('sbom', '--server', self.server_url, *scan_args),
+                                              600, node)
+            if error:
+                # Servidor caiu no meio do caminho: refazer com o banco local
+                self._server_ok = (False, time.monotonic())
+                mode = 'local'
+        if mode == 'local':
+            writer, error = self._stream_scan(self._trivy('sbom', *scan_args), 1800, node)
+        if error:
+            # Arquivo pode ter sumido do volume (node recriado): gerar de novo no próximo scan
+            self.store.forget_sbom(sbom['digest'])
+            raise TrivyError(error)
+        return mode, writer
+
+    def _record(self, image, digest, mode, writer, node=None):
+        # Um scan local pode ter baixado um banco novo: gravar com a versão atual
+        db_version = self.db_version(refresh=mode == 'local', node=node)
+        result_id = self.store.key(digest, db_version)
+        writer.commit(result_id)
+        entry = {
+            'image': image,
+            'digest': digest,
+            'db_version': db_version,
+            'result_id': result_id,
+            'scanned_at': datetime.now().isoformat(),
+            'scanned_ts': time.time(),
+            'mode': mode,
+            'summary': writer.summary,
+            'total': writer.count
+        }
+        self.store.put(entry)
+        if self.on_result:
+            self.on_result(entry)
+        return entry
+
+    def scan(self, image, force=False, ttl=None, node=None):
+        """Resultado do scan: do cache quando possível, senão roda o Trivy (no `node`) e salva"""
+        if not force:
+            entry = self.cached(image, ttl, node)
+            if entry:
+                return entry
+
+        digest = self.resolve_digest(image, refresh=force)
+        sbom = self.ensure_sbom(image, digest, node, refresh=force)
+        mode, writer = self._scan_sbom(sbom)
+        return dict(self._record(image, digest, mode, writer, sbom['node']), cached=False)
+
+    def reevaluate(self, force=False, workers=4, log=print):
+        """Reavalia os SBOMs guardados contra o banco atual, sem ler as imagens
+
+        Considera o digest atual de cada imagem já escaneada. Digests que já
+        têm resultado com a versão atual do banco são pulados (a menos que
+        `force`). Retorna a lista por imagem com as vulnerabilidades que não
+        apareciam no resultado anterior.
+        """
+        self.db_version(refresh=True)
+        targets = []
+        for latest in self.store.latest():
+            sbom = self.store.sbom(latest['digest'])
+            if not sbom:
+                continue
+            if not force and latest['db_version'] == self.db_version(node=sbom['node']):
+                continue
+            targets.append((latest, sbom))
+        log(f'{len(targets)} SBOMs para reavaliar')
+
+        def evaluate(latest, sbom):
+            image = latest['image']
+            try:
+                mode, writer = self._scan_sbom(sbom)
+                entry = self._record(image, latest['digest'], mode, writer, sbom['node'])
+            except Exception as e:
+                log(f'✗ {image}: {e}')
+                return {'image': image, 'digest': latest['digest'], 'error': str(e)}
+
+            item = {'image': image, 'digest': latest['digest'], 'db_version': entry['db_version'],
+                    'previous_db_version': latest['db_version'], 'summary': entry['summary'],
+                    'new': {'total': 0, 'items': []}, 'error': None}
+            if latest.get('result_id') and latest['result_id'] != entry['result_id']:
+                item['new'] = self.store.new_findings(entry['result_id'], latest['result_id'])
+            if item['new']['total']:
+                log(f"! {image}: {item['new']['total']} vulnerabilidades novas")
+            else:
+                log(f'✓ {image}: sem vulnerabilidades novas')
+            return item
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='trivy-sbom') as pool:
+            futures = [pool.submit(evaluate, latest, sbom) for latest, sbom in targets]
+            results = [f.result() for f in futures]
+
+        pruned = self.store.prune()
+        if pruned:
+            log(f'{pruned} resultados antigos removidos')
+        return results
+
+
+def _safe(fn):
+    """Envolve `fn` para devolver (resultado, erro) em vez de levantar exceção"""
+    def wrapper(*args):
+        try:
+            return fn(*args), None
+        except Exception as e:
+            return None, str(e)
+    return wrapper
+
+
+def scan_images(scanner, images, nodes, per_node=2, force=False, log=print):
+    """Escaneia várias imagens em paralelo, deduplicadas por digest
+
+    Cada node recebe até `per_node` scans simultâneos; o próximo scan vai para
+    o primeiro node com vaga livre. Retorna a lista de resultados por digest.
+    """
+    with ThreadPoolExecutor(max_workers=8, thread_name_prefix='trivy-resolve') as pool:
+        resolved = dict(zip(images, pool.map(_safe(scanner.resolve_digest), images)))
+
+    by_digest = {}
+    results = []
+    for image, (digest, error) in resolved.items():
+        if error:
+            log(f'✗ {image}: {error}')
+            results.append({'image': image, 'refs': [image], 'digest': None, 'error': error})
+        else:
+            by_digest.setdefault(digest, []).append(image)
+    log(f'{len(images)} imagens, {len(by_digest)} digests distintos')
+
+    slots = queue.Queue()
+    for _ in range(per_node):
+        for node in nodes:
+            slots.put(node)
+
+    total = len(by_digest)
+    done = [0]
+    done_lock = threading.Lock()
+
+    def scan_one(digest, refs):
+        node = slots.get()
+        started = time.monotonic()
+        try:
+            entry = scanner.scan(refs[0], force=force, node=node)
+            item = {'image': refs[0], 'refs': refs, 'digest': digest, 'node': node,
+                    'cached': entry['cached'], 'mode': entry.get('mode'), 'summary': entry['summary'],
+                    'error': None}
+        except Exception as e:
+            item = {'image': refs[0], 'refs': refs, 'digest': digest, 'node': node, 'error': str(e)}
+        finally:
+            slots.put(node)
+
+        with done_lock:
+            done[0] += 1
+            position = done[0]
+        seconds = time.monotonic() - started
+        if item['error']:
+            log(f"[{position}/{total}] ✗ {refs[0]} ({node}): {item['error']}")
+        else:
+            counts = ' '.join(f'{k}={v}' for k, v in item['summary'].items())
+            origin = 'cache' if item['cached'] else item['mode']
+            log(f'[{position}/{total}] ✓ {refs[0]} ({node}, {origin}, {seconds:.1f}s) {counts}')
+        return item
+
+    with ThreadPoolExecutor(max_workers=per_node * len(nodes), thread_name_prefix='trivy-scan') as pool:
+        futures = [pool.submit(scan_one, digest, refs) for digest, refs in by_digest.items()]
+        results += [f.result() for f in futures]
+    return results
+
@@ -0,0 +1,79 @@
+"""
+Webhooks de push (GitHub, Gitea, GitLab ou genérico) para disparar builds
+
+Extrai do payload os endereços do repositório e o branch do push,
+normalizados para comparar com o `gitCloneUrl` das pipelines (HTTPS e SSH do
+mesmo repositório casam). Sem segredo configurado nenhuma requisição é aceita.
+"""
+import hashlib
+import hmac
+import re
+
+ZERO_SHA = '0' * 40
+
+
+def normalize_repo_url(url):
+    """'https://user@Host/org/repo.git', 'git@host:org/repo' -> 'host/org/repo'"""
+    url = (url or '').strip()
+    ssh = re.match(r'^[\w.-]+@([^:/]+):(.+)$', url)
+    if ssh:
+        host, path = ssh.groups()
+    else:
+        url = re.sub(r'^[a-z+]+://', '', url, flags=re.I)
+        url = url.rpartition('@')[2] if '@' in url.split('/', 1)[0] else url
+        host, _, path = url.partition('/')
+        host = host.split(':')[0]
+    path = path.strip('/')
+    if path.endswith('.git'):
+        path = path[:-4]
+    return f'{host.lower()}/{path.lower()}' if host and path else ''
+
+
+def verify_signature(secret, headers, body):
+    """Confere o segredo pelo cabeçalho de cada provedor; sem segredo, recusa"""
+    if not secret:
+        return False
+    expected = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+    github = headers.get('X-Hub-Signature-256', '')
+    if github.startswith('sha256='):
+        return hmac.compare_digest(github[7:], expected)
+    gitea = headers.get('X-Gitea-Signature') or headers.get('X-Gogs-Signature')
+    if gitea:
+        return hmac.compare_digest(gitea, expected)
+    gitlab = headers.get('X-Gitlab-Token')
+    if gitlab:
+        return hmac.compare_digest(gitlab, secret)
+    return hmac.compare_digest(headers.get('X-Webhook-Token', ''), secret)
+
+
+def parse_push(payload):
+    """{'repositories': {url normalizada}, 'branch', 'commit'} de um push; None se não for push de branch
+
+    Aceita o formato do GitHub/Gitea (`repository.clone_url`...), do GitLab
+    (`project.git_http_url`...) e um genérico {"repository": url, "branch": nome}.
+    """
+    payload = payload or {}
+    repository = payload.get('repository')
+
+    if isinstance(repository, str):
+        branch = payload.get('branch') or ''
+        urls = [repository]
+    else:
+        ref = payload.get('ref') or ''
+        if not ref.startswith('refs/heads/') or payload.get('deleted') or payload.get('after') == ZERO_SHA:
+            return None
+        branch = ref[len('refs/heads/'):]
+        urls = []
+        for source in (repository or {}, payload.get('project') or {}):
+            urls += [source.get(k) for k in ('clone_url', 'ssh_url', 'html_url', 'git_url',
+                                             'git_http_url', 'git_ssh_url', 'web_url', 'url')]
+
+    repositories = {normalize_repo_url(url) for url in urls if url} - {''}
+    if not repositories or not branch:
+        return None
+    return {
+        'repositories': repositories,
+        'branch': branch,
+        'commit': payload.get('after') or payload.get('checkout_sha') or payload.get('commit')
+    }
@@ -4,6 +4,15 @@ let autoRefresh = null;
 let stacksChart = null;
 let activityChart = null;
 let securityRefreshInterval = null;
+let eventSource = null;
+
+// Estado recebido pelo canal de eventos (/api/events)
+const liveState = {
+    connected: false,
+    stacks: new Map(),
+    running: new Map(),
+    security: {}
+};
 
 // Inicialização
 document.addEventListener('DOMContentLoaded', function() {
@@ -11,15 +20,106 @@ document.addEventListener('DOMContentLoaded', function() {
     refreshStatus();
     initDashboardCharts();
     
+    // Atualizações via SSE; polling só se o stream cair
+    connectEvents();
+    
+    // Carregar estado da sidebar
+    loadSidebarState();
+});
+
+// Canal de eventos (Server-Sent Events)
+function connectEvents() {
+    if (!window.EventSource) {
+        startPolling();
+        return;
+    }
+    
+    eventSource = new EventSource('/api/events');
+    
+    eventSource.onopen = () => {
+        liveState.connected = true;
+        stopPolling();
+    };
+    
+    eventSource.onerror = () => {
+        // O EventSource reconecta sozinho; enquanto isso, voltar ao polling
+        liveState.connected = false;
+        startPolling();
+    };
+    
+    eventSource.addEventListener('snapshot', (event) => {
+        const state = JSON.parse(event.data);
+        liveState.stacks = new Map((state.stacks || []).map(s => [s.name, s]));
+        liveState.running = new Map((state.status || []).map(s => [s.name, s]));
+        liveState.security = state.security || {};
+        renderLiveStacks();
+        renderLiveStatus();
+        renderLiveSecurity();
+    });
+    
+    eventSource.addEventListener('stacks', (event) => {
+        applyDelta(liveState.stacks, JSON.parse(event.data));
+        renderLiveStacks();
+    });
+    
+    eventSource.addEventListener('status', (event) => {
+        applyDelta(liveState.running, JSON.parse(event.data));
+        renderLiveStatus();
+    });
+    
+    eventSource.addEventListener('security', (event) => {
+        const delta = JSON.parse(event.data);
+        Object.assign(liveState.security, delta.changed || {});
+        (delta.removed || []).forEach(key => delete liveState.security[key]);
+        renderLiveSecurity();
+    });
+}
+
+function applyDelta(map, delta) {
+    (delta.upsert || []).forEach(item => map.set(item.name, item));
+    (delta.remove || []).forEach(name => map.delete(name));
+}
+
+function sortedValues(map) {
+    return [...map.values()].sort((a, b) => a.name.localeCompare(b.name));
+}
+
+function renderLiveStacks() {
+    renderAvailableStacks(sortedValues(liveState.stacks));
+    renderDashboardMetrics(sortedValues(liveState.stacks), sortedValues(liveState.running));
+}
+
+function renderLiveStatus() {
+    renderActiveStacks(sortedValues(liveState.running));
+    renderDashboardMetrics(sortedValues(liveState.stacks), sortedValues(liveState.running));
+}
+
+function renderLiveSecurity() {
+    if (liveState.security.sonarqube) {
+        renderSonarQube(liveState.security.sonarqube);
+    }
+    if (liveState.security.trivy) {
+        renderTrivy(liveState.security.trivy);
+    }
+}
+
+function startPolling() {
+    if (autoRefresh) {
+        return;
+    }
     // Auto-refresh a cada 10 segundos
     autoRefresh = setInterval(() => {
         refreshStatus();
         updateDashboardMetrics();
     }, 10000);
-    
-    // Carregar estado da sidebar
-    loadSidebarState();
-});
+}
+
+function stopPolling() {
+    if (autoRefresh) {
+        clearInterval(autoRefresh);
+        autoRefresh = null;
+    }
+}
 
 // Sidebar Functions
 function toggleSidebar() {
@@ -116,98 +216,67 @@ async function loadAvailableStacks() {
     try {
         const response = await fetch('/api/stacks');
         const stacks = await response.json();
-        
-        const container = document.getElementById('availableStacksList');
-        
-        if (stacks.length === 0) {
-            container.innerHTML = '<p class="loading">Nenhum stack disponível</p>';
-            return;
-        }
-        
-        container.innerHTML = stacks.map(stack => `
-            <div class="stack-card">
-                <h3>📦 ${capitalizeFirst(stack.name)}</h3>
-                <div class="services">
-                    <strong>${stack.services.length}</strong> serviço(s)
-                    ${stack.services.length > 0 ? `
-                        <div class="services-list">
-                            ${stack.services.map(s => `<span class="service-tag">${s}</span>`).join('')}
-                        </div>
-                    ` : ''}
-                    ${(stack.urls && stack.urls.length > 0) || (stack.ports && stack.ports.length > 0) ? `
-                        <div class="ports-list">
-                            ${stack.urls && stack.urls.length > 0 ? stack.urls.map(url => `
-                                <a href="${url}" target="_blank" class="port-link">
-                                    🌐 ${url.replace('http://', '')}
-                                </a>
-                            `).join('') : ''}
-                            ${stack.ports && stack.ports.length > 0 ? stack.ports.map(port => `
-                                <a href="http://localhost:${port}" target="_blank" class="port-link">
-                                    🌐 localhost:${port}
-                                </a>
-                            `).join('') : ''}
-                        </div>
-                    ` : ''}
-                </div>
-                <div class="actions">
-                    <button onclick="deployStack('${stack.name}')" class="btn btn-success">
-                        <span class="icon">🚀</span> Deploy
-                    </button>
-                    <button onclick="viewStackYaml('${stack.name}')" class="btn btn-secondary">
-                        <span class="icon">✏️</span> Editar YAML
-                    </button>
-                    <button onclick="removeStack('${stack.name}')" class="btn btn-danger">
-                        <span class="icon">🗑️</span> Remover
-                    </button>
-                </div>
-            </div>
-        `).join('');
-        
+        renderAvailableStacks(stacks);
     } catch (error) {
         console.error('Erro ao carregar stacks:', error);
         logConsole('Erro ao carregar stacks disponíveis', 'error');
     }
 }
 
+function renderAvailableStacks(stacks) {
+    const container = document.getElementById('availableStacksList');
+    
+    if (stacks.length === 0) {
+        container.innerHTML = '<p class="loading">Nenhum stack disponível</p>';
+        return;
+    }
+    
+    container.innerHTML = stacks.map(stack => `
+        <div class="stack-card">
+            <h3>📦 ${capitalizeFirst(stack.name)}</h3>
+            <div class="services">
+                <strong>${stack.services.length}</strong> serviço(s)
+                ${stack.services.length > 0 ? `
+                    <div class="services-list">
+                        ${stack.services.map(s => `<span class="service-tag">${s}</span>`).join('')}
+                    </div>
+                ` : ''}
+                ${(stack.urls && stack.urls.length > 0) || (stack.ports && stack.ports.length > 0) ? `
+                    <div class="ports-list">
+                        ${stack.urls && stack.urls.length > 0 ? stack.urls.map(url => `
+                            <a href="${url}" target="_blank" class="port-link">
+                                🌐 ${url.replace('http://', '')}
+                            </a>
+                        `).join('') : ''}
+                        ${stack.ports && stack.ports.length > 0 ? stack.ports.map(port => `
+                            <a href="http://localhost:${port}" target="_blank" class="port-link">
+                                🌐 localhost:${port}
+                            </a>
+                        `).join('') : ''}
+                    </div>
+                ` : ''}
+            </div>
+            <div class="actions">
+                <button onclick="deployStack('${stack.name}')" class="btn btn-success">
+                    <span class="icon">🚀</span> Deploy
+                </button>
+                <button onclick="viewStackYaml('${stack.name}')" class="btn btn-secondary">
+                    <span class="icon">✏️</span> Editar YAML
+                </button>
+                <button onclick="removeStack('${stack.name}')" class="btn btn-danger">
+                    <span class="icon">🗑️</span> Remover
+                </button>
+            </div>
+        </div>
+    `).join('');
+}
+
 // Atualizar status dos stacks ativos
 async function refreshStatus() {
     try {
         const response = await fetch('/api/status');
         const data = await response.json();
-        
-        const container = document.getElementById('activeStacksList');
-        
-        if (!data.running_stacks || data.running_stacks.length === 0) {
-            container.innerHTML = '<p class="loading">Nenhum stack ativo no momento</p>';
-            return;
-        }
-        
-        container.innerHTML = data.running_stacks.map(stack => `
-            <div class="active-stack-item">
-                <div class="stack-info-left">
-                    <h4>✅ ${capitalizeFirst(stack.name)}</h4>
-                    <div class="info">${stack.services} serviço(s) rodando</div>
-                    ${(stack.urls && stack.urls.length > 0) || (stack.ports && stack.ports.length > 0) ? `
-                        <div class="ports-list-inline">
-                            ${stack.urls && stack.urls.length > 0 ? stack.urls.map(url => `
-                                <a href="${url}" target="_blank" class="port-link-small">
-                                    🌐 ${url.replace('http://', '')}
-                                </a>
-                            `).join('') : ''}
-                            ${stack.ports && stack.ports.length > 0 ? stack.ports.map(port => `
-                                <a href="http://localhost:${port}" target="_blank" class="port-link-small">
-                                    🌐 localhost:${port}
-                                </a>
-                            `).join('') : ''}
-                        </div>
-                    ` : ''}
-                </div>
-                <button onclick="removeStack('${stack.name}')" class="btn btn-danger">
-                    <span class="icon">🗑️</span> Remover
-                </button>
-            </div>
-        `).join('');
-        
+        renderActiveStacks(data.running_stacks);
     } catch (error) {
         console.error('Erro ao atualizar status:', error);
         const container = document.getElementById('activeStacksList');
@@ -215,6 +284,44 @@ async function refreshStatus() {
     }
 }
 
+function renderActiveStacks(runningStacks) {
+    const container = document.getElementById('activeStacksList');
+    
+    if (!runningStacks || runningStacks.length === 0) {
+        container.innerHTML = '<p class="loading">Nenhum stack ativo no momento</p>';
+        return;
+    }
+    
+    container.innerHTML = runningStacks.map(stack => `
+        <div class="active-stack-item">
+            <div class="stack-info-left">
+                <h4>✅ ${capitalizeFirst(stack.name)}</h4>
+                <div class="info">${stack.services} serviço(s) rodando</div>
+                ${stack.replicas && stack.replicas.length > 0 ? `
+                    <div class="info">${stack.replicas.map(r => `${r.service}: ${r.running}/${r.desired}`).join(' · ')}</div>
+                ` : ''}
+                ${(stack.urls && stack.urls.length > 0) || (stack.ports && stack.ports.length > 0) ? `
+                    <div class="ports-list-inline">
+                        ${stack.urls && stack.urls.length > 0 ? stack.urls.map(url => `
+                            <a href="${url}" target="_blank" class="port-link-small">
+                                🌐 ${url.replace('http://', '')}
+                            </a>
+                        `).join('') : ''}
+                        ${stack.ports && stack.ports.length > 0 ? stack.ports.map(port => `
+                            <a href="http://localhost:${port}" target="_blank" class="port-link-small">
+                                🌐 localhost:${port}
+                            </a>
+                        `).join('') : ''}
+                    </div>
+                ` : ''}
+            </div>
+            <button onclick="removeStack('${stack.name}')" class="btn btn-danger">
+                <span class="icon">🗑️</span> Remover
+            </button>
+        </div>
+    `).join('');
+}
+
 // Criar Nova Stack
 function showCreateStackModal() {
     document.getElementById('createStackModal').classList.add('active');
@@ -255,6 +362,12 @@ function toggleDatabaseConfig() {
     config.style.display = checkbox.checked ? 'block' : 'none';
 }
 
+function togglePoolerConfig() {
+    const checkbox = document.getElementById('usePooler');
+    const config = document.getElementById('poolerConfig');
+    config.style.display = checkbox.checked ? 'block' : 'none';
+}
+
 function toggleCICDConfig() {
     const checkbox = document.getElementById('enableCICD');
     const config = document.getElementById('cicdConfig');
@@ -303,6 +416,14 @@ async function createNewStack(event) {
             user: formData.get('dbUser'),
             password: formData.get('dbPassword')
         };
+        
+        if (formData.get('usePooler') === 'on') {
+            const poolSize = formData.get('poolSize');
+            stackData.database.pooler = {
+                mode: formData.get('poolMode') || 'transaction',
+                poolSize: poolSize ? parseInt(poolSize) : 20
+            };
+        }
     }
     
     // Adicionar configuração de CI/CD se selecionado
@@ -398,21 +519,10 @@ async function deployStack(stackName) {
             disableButtons();
             
             try {
-                const response = await fetch('/api/deploy', {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json'
-                    },
-                    body: JSON.stringify({ stack: stackName })
-                });
-                
-                const result = await response.json();
+                const result = await runJob('/api/deploy', { stack: stackName });
                 
                 if (result.success) {
                     logConsole(`✅ Stack "${stackName}" deployado com sucesso!`, 'success');
-                    if (result.output) {
-                        logConsole(result.output, 'info');
-                    }
                     setTimeout(refreshStatus, 2000);
                 } else {
                     logConsole(`❌ Erro ao deployar stack "${stackName}"`, 'error');
@@ -440,21 +550,10 @@ async function removeStack(stackName) {
             disableButtons();
             
             try {
-                const response = await fetch('/api/remove', {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json'
-                    },
-                    body: JSON.stringify({ stack: stackName })
-                });
-                
-                const result = await response.json();
+                const result = await runJob('/api/remove', { stack: stackName });
                 
                 if (result.success) {
                     logConsole(`✅ Stack "${stackName}" removido com sucesso!`, 'success');
-                    if (result.output) {
-                        logConsole(result.output, 'info');
-                    }
                     // Recarregar ambas as listas
                     await loadAvailableStacks();
                     await refreshStatus();
@@ -527,23 +626,20 @@ async function saveAndDeployYaml() {
     disableButtons();
     
     try {
-        const response = await fetch('/api/update-stack', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
-            },
-            body: JSON.stringify({
-                stack: currentEditingStack,
-                yaml: yamlContent
-            })
+        const stackName = currentEditingStack;
+        const result = await runJob('/api/update-stack', {
+            stack: stackName,
+            yaml: yamlContent
         });
         
-        const result = await response.json();
-        
         if (result.success) {
-            logConsole(`✅ Stack "${currentEditingStack}" atualizada e redeployada com sucesso!`, 'success');
-            if (result.output) {
-                logConsole(result.output, 'info');
+            if (result.skipped) {
+                logConsole(`ℹ️ Stack "${stackName}" sem alterações; nenhum serviço foi atualizado.`, 'info');
+            } else {
+                const changed = Object.entries(result.changes || {})
+                    .filter(([, change]) => change.action !== 'unchanged')
+                    .map(([service, change]) => `${service} (${change.action})`);
+                logConsole(`✅ Stack "${stackName}" atualizada in-place: ${changed.join(', ') || 'configuração da stack'}`, 'success');
             }
             closeYamlEditor();
             await loadAvailableStacks();
@@ -590,17 +686,10 @@ async function startLab() {
     disableButtons();
     
     try {
-        const response = await fetch('/api/lab/start', {
-            method: 'POST'
-        });
-        
-        const result = await response.json();
+        const result = await runJob('/api/lab/start');
         
         if (result.success) {
             logConsole('✅ Lab iniciado com sucesso!', 'success');
-            if (result.output) {
-                logConsole(result.output, 'info');
-            }
             setTimeout(refreshStatus, 3000);
             updateDashboardMetrics();
         } else {
@@ -623,17 +712,10 @@ async function destroyLab() {
     disableButtons();
     
     try {
-        const response = await fetch('/api/lab/destroy', {
-            method: 'POST'
-        });
-        
-        const result = await response.json();
+        const result = await runJob('/api/lab/destroy');
         
         if (result.success) {
             logConsole('✅ Lab destruído com sucesso!', 'success');
-            if (result.output) {
-                logConsole(result.output, 'info');
-            }
             setTimeout(() => {
                 refreshStatus();
                 updateDashboardMetrics();
@@ -652,6 +734,73 @@ async function destroyLab() {
     }
 }
 
+// Jobs assíncronos: dispara a operação e acompanha o log em tempo real
+async function runJob(url, body) {
+    const response = await fetch(url, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify(body || {})
+    });
+    
+    const accepted = await response.json();
+    if (!accepted.job_id) {
+        // Erro de validação: resposta síncrona
+        return accepted;
+    }
+    
+    logConsole(`📋 Job ${accepted.job_id} enfileirado`, 'info');
+    const job = await followJob(accepted);
+    return job.result || { success: false, error: job.error || 'Job falhou' };
+}
+
+function followJob(accepted) {
+    return new Promise((resolve) => {
+        let received = 0;
+        const source = new EventSource(accepted.logs_url);
+        
+        source.addEventListener('log', (event) => {
+            const entry = JSON.parse(event.data);
+            received = entry.n + 1;
+            logConsole(entry.line, entry.stream === 'stderr' ? 'warning' : 'info');
+        });
+        
+        source.addEventListener('end', (event) => {
+            source.close();
+            resolve(JSON.parse(event.data));
+        });
+        
+        source.onerror = () => {
+            // Stream caiu: consultar o job até terminar
+            source.close();
+            pollJob(accepted.job_url, received).then(resolve);
+        };
+    });
+}
+
+async function pollJob(jobUrl, received) {
+    while (true) {
+        try {
+            const response = await fetch(`${jobUrl}?log=1`);
+            const data = await response.json();
+            const job = data.job;
+            
+            job.log.slice(received).forEach(entry => {
+                logConsole(entry.line, entry.stream === 'stderr' ? 'warning' : 'info');
+            });
+            received = job.log.length;
+            
+            if (job.status === 'succeeded' || job.status === 'failed') {
+                return job;
+            }
+        } catch (error) {
+            console.error('Erro ao consultar job:', error);
+        }
+        await new Promise(resolve => setTimeout(resolve, 2000));
+    }
+}
+
 // Modal
 function showModal(title, message, onConfirm) {
     document.getElementById('modalTitle').textContent = title;
@@ -805,32 +954,34 @@ async function updateDashboardMetrics() {
         
         const stacks = await stacksResponse.json();
         const activeData = await activeResponse.json();
-        
-        // Contar stacks ativos
-        const activeStacks = activeData.stacks ? activeData.stacks.length : 0;
-        const totalStacks = stacks.length;
-        
-        // Contar total de serviços
-        let totalServices = 0;
-        stacks.forEach(stack => {
-            totalServices += stack.services.length;
-        });
-        
-        // Atualizar cards de métricas
-        document.getElementById('totalStacks').textContent = totalStacks;
-        document.getElementById('activeStacks').textContent = activeStacks;
-        document.getElementById('totalServices').textContent = totalServices;
-        
-        // Atualizar gráfico de stacks
-        if (stacksChart) {
-            stacksChart.data.datasets[0].data = [activeStacks, totalStacks - activeStacks];
-            stacksChart.update('none');
-        }
-        
+        renderDashboardMetrics(stacks, activeData.running_stacks);
     } catch (error) {
         console.error('Erro ao atualizar métricas:', error);
     }
 }
+
+function renderDashboardMetrics(stacks, runningStacks) {
+    // Contar stacks ativos
+    const activeStacks = runningStacks ? runningStacks.length : 0;
+    const totalStacks = stacks.length;
+    
+    // Contar total de serviços
+    let totalServices = 0;
+    stacks.forEach(stack => {
+        totalServices += stack.services.length;
+    });
+    
+    // Atualizar cards de métricas
+    document.getElementById('totalStacks').textContent = totalStacks;
+    document.getElementById('activeStacks').textContent = activeStacks;
+    document.getElementById('totalServices').textContent = totalServices;
+    
+    // Atualizar gráfico de stacks
+    if (stacksChart) {
+        stacksChart.data.datasets[0].data = [activeStacks, totalStacks - activeStacks];
+        stacksChart.update('none');
+    }
+}
 // ==============================================
 // Security Functions
 // ==============================================
@@ -838,15 +989,27 @@ async function updateDashboardMetrics() {
 function loadSecurityData() {
     console.log('Loading security data...');
     try {
+        loadScanHistory();
+        
+        // Com o stream de eventos ativo, as métricas chegam por push
+        if (liveState.connected && liveState.security.sonarqube && liveState.security.trivy) {
+            renderLiveSecurity();
+            return;
+        }
+        
         refreshSonarQube();
         refreshTrivy();
-        loadScanHistory();
         
-        // Auto-refresh a cada 30 segundos quando estiver na tela de segurança
+        // Auto-refresh a cada 30 segundos quando estiver na tela de segurança (sem stream)
         if (securityRefreshInterval) {
             clearInterval(securityRefreshInterval);
         }
         securityRefreshInterval = setInterval(() => {
+            if (liveState.connected) {
+                clearInterval(securityRefreshInterval);
+                securityRefreshInterval = null;
+                return;
+            }
             refreshSonarQube();
             refreshTrivy();
         }, 30000);
@@ -873,55 +1036,68 @@ async function refreshSonarQube() {
         
         console.log('SonarQube response:', data);
         
-        if (data.success) {
-            statusEl.innerHTML = '<span class="status-dot status-online"></span><span>Online</span>';
-            
-            // Atualizar métricas principais
-            document.getElementById('sonarBugs').textContent = data.bugs || '0';
-            document.getElementById('sonarVulnerabilities').textContent = data.vulnerabilities || '0';
-            document.getElementById('sonarCoverage').textContent = data.coverage ? `${data.coverage}%` : '-';
-            
-            // Exibir detalhes
-            dataEl.innerHTML = `
-                <div class="security-metrics">
-                    <div class="metric-row">
-                        <span class="metric-label">🐛 Bugs:</span>
-                        <span class="metric-value ${data.bugs > 0 ? 'text-warning' : 'text-success'}">${data.bugs || 0}</span>
-                    </div>
-                    <div class="metric-row">
-                        <span class="metric-label">🔴 Vulnerabilidades:</span>
-                        <span class="metric-value ${data.vulnerabilities > 0 ? 'text-danger' : 'text-success'}">${data.vulnerabilities || 0}</span>
-                    </div>
-                    <div class="metric-row">
-                        <span class="metric-label">⚠️ Code Smells:</span>
-                        <span class="metric-value">${data.code_smells || 0}</span>
-                    </div>
-                    <div class="metric-row">
-                        <span class="metric-label">📊 Cobertura:</span>
-                        <span class="metric-value">${data.coverage ? data.coverage + '%' : 'N/A'}</span>
-                    </div>
-                    <div class="metric-row">
-                        <span class="metric-label">📈 Qualidade:</span>
-                        <span class="metric-value ${data.quality_gate === 'OK' ? 'text-success' : 'text-danger'}">${data.quality_gate || 'N/A'}</span>
-                    </div>
-                    ${data.projects && data.projects.length > 0 ? `
-                        <div class="projects-list">
-                            <strong>Projetos Analisados:</strong>
-                            ${data.projects.map(p => `<span class="project-tag">${p}</span>`).join('')}
-                        </div>
-                    ` : ''}
-                </div>
-            `;
-        } else {
-            statusEl.innerHTML = '<span class="status-dot status-offline"></span><span>Offline</span>';
-            dataEl.innerHTML = `<div class="error-message">⚠️ ${data.error || 'Não foi possível conectar ao SonarQube'}</div>`;
-        }
+        renderSonarQube(data);
     } catch (error) {
         statusEl.innerHTML = '<span class="status-dot status-offline"></span><span>Erro</span>';
         dataEl.innerHTML = `<div class="error-message">❌ Erro ao conectar: ${error.message}</div>`;
     }
 }
 
+function renderSonarQube(data) {
+    const statusEl = document.getElementById('sonarqubeStatus');
+    const dataEl = document.getElementById('sonarqubeData');
+    
+    if (!statusEl || !dataEl) {
+        return;
+    }
+    
+    if (data.success) {
+        statusEl.innerHTML = '<span class="status-dot status-online"></span><span>Online</span>';
+        
+        // Atualizar métricas principais
+        document.getElementById('sonarBugs').textContent = data.bugs || '0';
+        document.getElementById('sonarVulnerabilities').textContent = data.vulnerabilities || '0';
+        document.getElementById('sonarCoverage').textContent = data.coverage ? `${data.coverage}%` : '-';
+        
+        // Exibir detalhes
+        dataEl.innerHTML = `
+            <div class="security-metrics">
+                <div class="metric-row">
+                    <span class="metric-label">🐛 Bugs:</span>
+                    <span class="metric-value ${data.bugs > 0 ? 'text-warning' : 'text-success'}">${data.bugs || 0}</span>
+                </div>
+                <div class="metric-row">
+                    <span class="metric-label">🔴 Vulnerabilidades:</span>
+                    <span class="metric-value ${data.vulnerabilities > 0 ? 'text-danger' : 'text-success'}">${data.vulnerabilities || 0}</span>
+                </div>
+                <div class="metric-row">
+                    <span class="metric-label">⚠️ Code Smells:</span>
+                    <span class="metric-value">${data.code_smells || 0}</span>
+                </div>
+                <div class="metric-row">
+                    <span class="metric-label">📊 Cobertura:</span>
+                    <span class="metric-value">${data.coverage ? data.coverage + '%' : 'N/A'}</span>
+                </div>
+                <div class="metric-row">
+                    <span class="metric-label">📈 Qualidade:</span>
+                    <span class="metric-value ${data.quality_gate === 'OK' ? 'text-success' : 'text-danger'}">${data.quality_gate || 'N/A'}</span>
+                </div>
+                ${data.projects && data.projects.length > 0 ? `
+                    <div class="projects-list">
+                        <strong>Projetos Analisados:</strong>
+                        ${data.projects.map(p => `<span class="project-tag ${p.quality_gate === 'OK' ? 'text-success' : p.quality_gate === 'ERROR' ? 'text-danger' : ''}"
+                            title="${p.error ? p.error : `Bugs: ${p.bugs} · Vulnerabilidades: ${p.vulnerabilities} · Code Smells: ${p.code_smells}`}">${p.name}</span>`).join('')}
+                    </div>
+                ` : ''}
+                ${data.stale ? '<div class="text-warning">⏳ Dados em cache, atualizando...</div>' : ''}
+            </div>
+        `;
+    } else {
+        statusEl.innerHTML = '<span class="status-dot status-offline"></span><span>Offline</span>';
+        dataEl.innerHTML = `<div class="error-message">⚠️ ${data.error || 'Não foi possível conectar ao SonarQube'}</div>`;
+    }
+}
+
 async function refreshTrivy() {
     console.log('Refreshing Trivy data...');
     const statusEl = document.getElementById('trivyStatus');
@@ -940,70 +1116,87 @@ async function refreshTrivy() {
         
         console.log('Trivy response:', data);
         
-        if (data.success) {
-            statusEl.innerHTML = '<span class="status-dot status-online"></span><span>Online</span>';
-            
-            // Atualizar métrica principal
-            const totalVulns = (data.critical || 0) + (data.high || 0) + (data.medium || 0) + (data.low || 0);
-            document.getElementById('trivyVulnerabilities').textContent = totalVulns;
-            
-            // Exibir detalhes
-            dataEl.innerHTML = `
-                <div class="security-metrics">
-                    <div class="metric-row">
-                        <span class="metric-label">🔴 Críticas:</span>
-                        <span class="metric-value text-danger">${data.critical || 0}</span>
-                    </div>
-                    <div class="metric-row">
-                        <span class="metric-label">🟠 Altas:</span>
-                        <span class="metric-value text-warning">${data.high || 0}</span>
-                    </div>
-                    <div class="metric-row">
-                        <span class="metric-label">🟡 Médias:</span>
-                        <span class="metric-value text-info">${data.medium || 0}</span>
-                    </div>
+        renderTrivy(data);
+    } catch (error) {
+        statusEl.innerHTML = '<span class="status-dot status-offline"></span><span>Erro</span>';
+        dataEl.innerHTML = `<div class="error-message">❌ Erro ao conectar: ${error.message}</div>`;
+    }
+}
+
+function renderTrivy(data) {
+    const statusEl = document.getElementById('trivyStatus');
+    const dataEl = document.getElementById('trivyData');
+    
+    if (!statusEl || !dataEl) {
+        return;
+    }
+    
+    if (data.success) {
+        statusEl.innerHTML = '<span class="status-dot status-online"></span><span>Online</span>';
+        
+        // Atualizar métrica principal
+        const totalVulns = (data.critical || 0) + (data.high || 0) + (data.medium || 0) + (data.low || 0);
+        document.getElementById('trivyVulnerabilities').textContent = totalVulns;
+        
+        // Exibir detalhes
+        dataEl.innerHTML = `
+            <div class="security-metrics">
+                <div class="metric-row">
+                    <span class="metric-label">🔴 Críticas:</span>
+                    <span class="metric-value text-danger">${data.critical || 0}</span>
+                </div>
+                <div class="metric-row">
+                    <span class="metric-label">🟠 Altas:</span>
+                    <span class="metric-value text-warning">${data.high || 0}</span>
+                </div>
+                <div class="metric-row">
+                    <span class="metric-label">🟡 Médias:</span>
+                    <span class="metric-value text-info">${data.medium || 0}</span>
+                </div>
+                <div class="metric-row">
+                    <span class="metric-label">🟢 Baixas:</span>
+                    <span class="metric-value text-success">${data.low || 0}</span>
+                </div>
+                <div class="metric-row">
+                    <span class="metric-label">📦 Total:</span>
+                    <span class="metric-value">${totalVulns}</span>
+                </div>
+                ${data.images ? `
                     <div class="metric-row">
-                        <span class="metric-label">🟢 Baixas:</span>
-                        <span class="metric-value text-success">${data.low || 0}</span>
+                        <span class="metric-label">🖼️ Imagens:</span>
+                        <span class="metric-value">${data.images}</span>
                     </div>
+                ` : ''}
+                ${data.last_scan ? `
                     <div class="metric-row">
-                        <span class="metric-label">📦 Total:</span>
-                        <span class="metric-value">${totalVulns}</span>
+                        <span class="metric-label">🕐 Último Scan:</span>
+                        <span class="metric-value">${new Date(data.last_scan).toLocaleString('pt-BR')}</span>
                     </div>
-                    ${data.last_scan ? `
-                        <div class="metric-row">
-                            <span class="metric-label">🕐 Último Scan:</span>
-                            <span class="metric-value">${new Date(data.last_scan).toLocaleString('pt-BR')}</span>
-                        </div>
-                    ` : ''}
-                </div>
-            `;
-        } else {
-            statusEl.innerHTML = '<span class="status-dot status-offline"></span><span>Offline</span>';
-            dataEl.innerHTML = `<div class="error-message">⚠️ ${data.error || 'Não foi possível conectar ao Trivy'}</div>`;
-        }
-    } catch (error) {
-        statusEl.innerHTML = '<span class="status-dot status-offline"></span><span>Erro</span>';
-        dataEl.innerHTML = `<div class="error-message">❌ Erro ao conectar: ${error.message}</div>`;
+                ` : ''}
+            </div>
+        `;
+    } else {
+        statusEl.innerHTML = '<span class="status-dot status-offline"></span><span>Offline</span>';
+        dataEl.innerHTML = `<div class="error-message">⚠️ ${data.error || 'Não foi possível conectar ao Trivy'}</div>`;
     }
 }
 
 async function startTrivyScan() {
-    if (!confirm('Iniciar scan de vulnerabilidades? Isso pode levar alguns minutos.')) {
+    if (!confirm('Escanear todas as imagens dos stacks e do Swarm? Isso pode levar alguns minutos.')) {
         return;
     }
     
     try {
-        logConsole('Iniciando scan do Trivy...', 'info');
-        const response = await fetch('/api/security/trivy/scan', { method: 'POST' });
-        const data = await response.json();
+        logConsole('Iniciando scan de todas as imagens com o Trivy...', 'info');
+        toggleConsoleModal();
+        const result = await runJob('/api/security/trivy/scan-all');
         
-        if (data.success) {
-            logConsole('✅ Scan iniciado com sucesso!', 'success');
-            setTimeout(() => refreshTrivy(), 2000);
+        if (result.success) {
+            logConsole(`✅ Scan concluído: ${result.images.length} imagens em ${result.seconds}s`, 'success');
         } else {
-            logConsole(`❌ Erro ao iniciar scan: ${data.error}`, 'error');
+            logConsole(`❌ Erro no scan: ${result.error}`, 'error');
         }
+        refreshTrivy();
     } catch (error) {
         logConsole(`❌ Erro: ${error.message}`, 'error');
     }
@@ -1046,7 +1239,7 @@ async function scanDockerImage() {
         
         if (data.success) {
             statusEl.innerHTML = '<span class="status-dot status-online"></span><span>Scan Concluído</span>';
-            logConsole(`✅ Scan concluído para ${imageName}`, 'success');
+            logConsole(`✅ Scan concluído para ${imageName}${data.cached ? ' (resultado em cache)' : ''}`, 'success');
             
             // Processar resultados
             displayTrivyResults(data.results, imageName);
@@ -1139,8 +1332,8 @@ function displayTrivyResults(results, imageName) {
                             </div>
                         </div>
                     `).join('')}
-                    ${results.vulnerabilities.length > 10 ? `
-                        <p class="more-vulns">... e mais ${results.vulnerabilities.length - 10} vulnerabilidades</p>
+                    ${(results.total || results.vulnerabilities.length) > 10 ? `
+                        <p class="more-vulns">... e mais ${(results.total || results.vulnerabilities.length) - 10} vulnerabilidades</p>
                     ` : ''}
                 </div>
             ` : '<p class="no-vulns">✅ Nenhuma vulnerabilidade encontrada!</p>'}
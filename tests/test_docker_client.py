@@ -0,0 +1,178 @@
+"""DockerClient contra um servidor falso da Engine API num socket Unix"""
+import json
+import os
+import socketserver
+import struct
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+from stack_manager.docker_client import DockerAPIError, DockerClient
+
+
+def frame(stream_type, payload):
+    return struct.pack('>BxxxL', stream_type, len(payload)) + payload
+
+
+class FakeEngine(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path):
+        super().__init__(path, FakeEngineHandler)
+        self.containers = {'lab-swarm1'}
+        # cmd[0] -> (frames, código de saída)
+        self.scripts = {}
+        # Quantas consultas a /exec/{id}/json ainda respondem Running=true
+        self.running_polls = 0
+        self.inspects = 0
+        self.execs = {}
+
+
+class FakeEngineHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length)) if length else {}
+
+    def do_GET(self):
+        server = self.server
+        if self.path == '/_ping':
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain')
+            self.send_header('Content-Length', '2')
+            self.end_headers()
+            self.wfile.write(b'OK')
+        elif self.path.startswith('/exec/') and self.path.endswith('/json'):
+            exec_id = self.path.split('/')[2]
+            server.inspects += 1
+            running = server.running_polls > 0
+            server.running_polls -= 1
+            exit_code = None if running else server.scripts[server.execs[exec_id]][1]
+            self._json(200, {'ID': exec_id, 'Running': running, 'ExitCode': exit_code})
+        else:
+            self._json(404, {'message': f'page not found: {self.path}'})
+
+    def do_POST(self):
+        server = self.server
+        parts = self.path.split('?')[0].split('/')
+        body = self._body()
+        if len(parts) == 4 and parts[1] == 'containers' and parts[3] == 'exec':
+            if parts[2] not in server.containers:
+                self._json(404, {'message': f'No such container: {parts[2]}'})
+                return
+            exec_id = f'exec{len(server.execs)}'
+            server.execs[exec_id] = body['Cmd'][0]
+            self._json(201, {'Id': exec_id})
+        elif len(parts) == 4 and parts[1] == 'exec' and parts[3] == 'start':
+            frames = server.scripts[server.execs[parts[2]]][0]
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/vnd.docker.raw-stream')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            self.wfile.flush()
+            # Cada frame sai em dois pedaços: o cliente precisa remontar cabeçalho e payload
+            for data in frames:
+                half = len(data) // 2
+                for chunk in (data[:half], data[half:]):
+                    self.wfile.write(chunk)
+                    self.wfile.flush()
+                    time.sleep(0.005)
+            self.close_connection = True
+        else:
+            self._json(404, {'message': f'page not found: {self.path}'})
+
+
+@pytest.fixture
+def engine():
+    directory = tempfile.mkdtemp()
+    server = FakeEngine(os.path.join(directory, 'docker.sock'))
+    thread = threading.Thread(target=server.serve_forever, args=(0.01,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client(engine):
+    return DockerClient(socket_path=engine.server_address, timeout=5)
+
+
+MIXED = [
+    frame(1, b'hel'),
+    frame(1, b'lo\nwor'),
+    frame(2, b'oops\n'),
+    frame(1, b'ld\nlast')
+]
+
+
+def test_ping(client, engine):
+    assert client.ping() is True
+    assert DockerClient(socket_path=engine.server_address + '.missing').ping() is False
+
+
+def test_exec_run_demultiplexes_stdout_and_stderr(client, engine):
+    engine.scripts['sh'] = (MIXED, 3)
+    result = client.exec_run('lab-swarm1', ['sh', '-c', 'true'])
+    assert result == {'success': False, 'stdout': 'hello\nworld\nlast', 'stderr': 'oops\n', 'returncode': 3}
+
+
+def test_exec_run_on_line_joins_lines_split_across_frames(client, engine):
+    engine.scripts['sh'] = (MIXED, 0)
+    lines = []
+    result = client.exec_run('lab-swarm1', ['sh'], on_line=lambda stream, line: lines.append((stream, line)))
+    assert lines == [('stdout', 'hello'), ('stderr', 'oops'), ('stdout', 'world'), ('stdout', 'last')]
+    # A saída não ganha uma quebra de linha que o processo não escreveu
+    assert result['stdout'] == 'hello\nworld\nlast'
+    assert result['stderr'] == 'oops\n'
+    assert result['success'] is True
+
+
+def test_exec_stream_lines(client, engine):
+    engine.scripts['sh'] = ([frame(1, b'a\nb'), frame(1, b'\n'), frame(2, b'err')], 0)
+    stream = client.exec_start('lab-swarm1', ['sh'])
+    assert list(stream.lines()) == [('stdout', 'a'), ('stdout', 'b'), ('stderr', 'err')]
+
+
+def test_exit_code_waits_for_process_to_finish(client, engine):
+    engine.scripts['sh'] = ([frame(1, b'ok\n')], 7)
+    engine.running_polls = 3
+    result = client.exec_run('lab-swarm1', ['sh'])
+    assert result['returncode'] == 7
+    assert engine.inspects == 4
+
+
+def test_exit_code_none_while_still_running(client, engine):
+    engine.scripts['sh'] = ([], 0)
+    engine.running_polls = 10 ** 6
+    stream = client.exec_start('lab-swarm1', ['sh'])
+    list(stream)
+    assert stream.exit_code(wait=0.05) is None
+
+
+def test_missing_container_raises_api_error(client):
+    with pytest.raises(DockerAPIError) as error:
+        client.exec_run('nope', ['sh'])
+    assert error.value.status == 404
+    assert error.value.message == 'No such container: nope'
+
+
+def test_unknown_endpoint_raises_api_error(client):
+    with pytest.raises(DockerAPIError) as error:
+        client.inspect_container('lab-swarm1')
+    assert error.value.status == 404
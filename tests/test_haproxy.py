@@ -0,0 +1,104 @@
+"""Slots de servidores no haproxy.cfg e caminho pela Runtime API"""
+import os
+import socket
+import threading
+
+from stack_manager.haproxy import HAProxyRuntime, runtime_operations
+from stack_manager.haproxy_config import HAProxyConfig
+
+SERVERS = [('swarm1', '172.31.0.11'), ('swarm2', '172.31.0.12')]
+RANGES = [(8084, 8086)]
+BASE = """global
+    master-worker
+
+frontend http_front
+    bind *:80
+    default_backend swarm_nodes
+
+backend swarm_nodes
+    balance roundrobin
+    server swarm1 172.31.0.11:80 check
+"""
+
+
+def slotted(text=BASE):
+    config = HAProxyConfig.parse(text)
+    config.ensure_port_slots(RANGES, SERVERS)
+    return config.render()
+
+
+def change(text, fn):
+    config = HAProxyConfig.parse(text)
+    config.ensure_port_slots(RANGES, SERVERS)
+    fn(config)
+    return config.render()
+
+
+def test_ensure_port_slots_is_idempotent():
+    text = slotted()
+    config = HAProxyConfig.parse(text)
+    assert config.get('frontend', 'stack_ports').lines == ['bind *:8084-8086', 'use_backend port_%[dst_port]']
+    assert [s.name for s in config.sections if s.kind == 'backend'] == [
+        'swarm_nodes', 'port_8084', 'port_8085', 'port_8086']
+    assert slotted(text) == text
+    assert runtime_operations(text, slotted(text)) == []
+
+
+def test_ensure_port_slots_migrates_legacy_routes():
+    config = HAProxyConfig.parse(BASE)
+    config.add_route('web', 8085, SERVERS)
+    config.ensure_port_slots(RANGES, SERVERS)
+    assert config.get('frontend', 'web_8085') is None
+    assert config.get('backend', 'web_8085_backend') is None
+    assert config.stack_ports('web') == [8085]
+    assert config.get('backend', 'port_8085').lines == [
+        'balance roundrobin', '# stack web',
+        'server slot1 172.31.0.11:8085 check', 'server slot2 172.31.0.12:8085 check']
+
+
+def test_adding_and_removing_a_stack_uses_the_runtime_api():
+    before = slotted()
+    after = change(before, lambda c: c.set_stack_routes('web', [8084], SERVERS))
+    assert runtime_operations(before, after) == [
+        'set server port_8084/slot1 addr 172.31.0.11 port 8084',
+        'set server port_8084/slot1 state ready',
+        'set server port_8084/slot2 addr 172.31.0.12 port 8084',
+        'set server port_8084/slot2 state ready',
+    ]
+
+    removed = change(after, lambda c: c.remove_stack_routes('web'))
+    assert removed == before
+    assert runtime_operations(after, removed) == [
+        'set server port_8084/slot1 state maint',
+        'set server port_8084/slot2 state maint',
+    ]
+
+
+def test_slot_owned_by_another_stack_is_kept():
+    owned = change(BASE, lambda c: c.set_stack_routes('web', [8084], SERVERS))
+    assert change(owned, lambda c: c.set_stack_routes('api', [8084], SERVERS)) == owned
+    assert HAProxyConfig.parse(owned).stack_ports('api') == []
+
+
+def test_runtime_over_unix_socket(tmp_path):
+    path = str(tmp_path / 'admin.sock')
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen(1)
+    received = []
+
+    def serve():
+        conn, _ = server.accept()
+        with conn:
+            received.append(conn.recv(1024))
+            conn.sendall(b'ok\n')
+
+    thread = threading.Thread(target=serve)
+    thread.start()
+    try:
+        assert HAProxyRuntime(path).execute('show info').strip() == 'ok'
+    finally:
+        thread.join(5)
+        server.close()
+        os.unlink(path)
+    assert received == [b'show info\n']
@@ -0,0 +1,63 @@
+"""Alocador de portas públicas"""
+import pytest
+
+from stack_manager.ports import PortAllocator, PortUnavailable, parse_ranges
+
+
+@pytest.fixture
+def allocator(tmp_path):
+    return PortAllocator(str(tmp_path / 'ports.db'), [(8084, 8090)])
+
+
+def owners(allocator):
+    return sorted(allocator._conn().execute('SELECT port, owner, state FROM allocations'))
+
+
+def test_parse_ranges():
+    assert parse_ranges('8084-8299, 9100-9199,9300') == [(8084, 8299), (9100, 9199), (9300, 9300)]
+
+
+def test_allocate_next_free_and_preferred(allocator):
+    assert allocator.allocate('web') == 8084
+    assert allocator.allocate('api', preferred=8088) == 8088
+    assert allocator.allocate('db') == 8085
+    with pytest.raises(PortUnavailable):
+        allocator.allocate('other', preferred=8088)
+
+
+def test_invalid_or_out_of_range_preferred_port(allocator):
+    with pytest.raises(PortUnavailable):
+        allocator.allocate('web', preferred='abc')
+    with pytest.raises(PortUnavailable):
+        allocator.allocate('web', preferred=9999)
+    assert owners(allocator) == []
+
+
+def test_recreating_a_stack_reuses_its_port(allocator):
+    assert allocator.allocate('web') == 8084
+    allocator.confirm('web')
+    assert allocator.allocate('web') == 8084
+    assert owners(allocator) == [(8084, 'web', 'bound')]
+
+
+def test_recreating_with_a_new_port_frees_the_old_one(allocator):
+    allocator.allocate('web')
+    allocator.confirm('web')
+    assert allocator.allocate('web', preferred=8089) == 8089
+    assert owners(allocator) == [(8089, 'web', 'reserved')]
+    assert allocator.allocate('api') == 8084
+
+
+def test_allocate_many_reports_errors_per_stack(allocator):
+    allocator.allocate('taken', preferred=8086)
+    result = allocator.allocate_many([('a', None), ('b', 8086), ('c', 'x'), ('d', 8085)])
+    assert result['a'] == 8084
+    assert result['d'] == 8085
+    assert isinstance(result['b'], PortUnavailable)
+    assert isinstance(result['c'], PortUnavailable)
+
+
+def test_release_returns_ports(allocator):
+    allocator.allocate('web')
+    allocator.release('web')
+    assert allocator.allocate('api') == 8084
@@ -0,0 +1,70 @@
+"""Plano de atualização e acompanhamento do rolling update"""
+from stack_manager.stack_update import plan_stack_update, snapshot_updates, wait_for_rollout
+
+
+class FakeSwarm:
+    """`run` falso: cada inspect devolve o próximo estado de cada serviço"""
+
+    def __init__(self, timeline):
+        # {serviço: [(index, state, started_at), ...]}; o último se repete
+        self.timeline = timeline
+        self.calls = 0
+
+    def __call__(self, args):
+        self.calls += 1
+        lines = []
+        for full_name in args[5:]:
+            name = full_name.split('_', 1)[1]
+            steps = self.timeline[name]
+            index, state, started_at = steps[min(self.calls - 1, len(steps) - 1)]
+            status = f'{state} {started_at}' if state else ''
+            lines.append(f'{full_name} {index} {status}')
+        return {'success': True, 'stdout': '\n'.join(lines) + '\n', 'stderr': ''}
+
+
+OLD = '2026-10-01 10:00:00 +0000 UTC'
+NEW = '2026-10-17 12:00:00 +0000 UTC'
+
+
+def test_old_final_state_is_not_taken_as_the_new_update():
+    swarm = FakeSwarm({'web': [
+        (10, 'completed', OLD),
+        (12, 'completed', OLD),
+        (13, 'updating', NEW),
+        (15, 'completed', NEW)
+    ]})
+    before = snapshot_updates(swarm, 'shop', ['web'])
+    assert before == {'web': (10, 'completed', OLD)}
+    assert wait_for_rollout(swarm, 'shop', ['web'], before, interval=0) == {'web': 'completed'}
+    assert swarm.calls == 4
+
+
+def test_rollback_of_new_update_is_reported():
+    swarm = FakeSwarm({'web': [(10, '', ''), (11, 'updating', NEW), (14, 'rollback_completed', NEW)]})
+    before = snapshot_updates(swarm, 'shop', ['web'])
+    assert wait_for_rollout(swarm, 'shop', ['web'], before, interval=0) == {'web': 'rollback_completed'}
+
+
+def test_spec_change_without_update_settles_after_grace():
+    swarm = FakeSwarm({'web': [(10, '', ''), (11, '', '')], 'db': [(5, 'completed', OLD)]})
+    before = snapshot_updates(swarm, 'shop', ['web', 'db'])
+    states = wait_for_rollout(swarm, 'shop', ['web', 'db'], before, interval=0.01, start_grace=0.05)
+    assert states == {'web': 'completed', 'db': 'unchanged'}
+
+
+def test_timeout():
+    swarm = FakeSwarm({'web': [(10, '', ''), (11, 'updating', NEW)]})
+    before = snapshot_updates(swarm, 'shop', ['web'])
+    assert wait_for_rollout(swarm, 'shop', ['web'], before, timeout=0.05, interval=0.01) == {'web': 'timeout'}
+
+
+def test_plan_stack_update():
+    old = {'services': {'web': {'image': 'nginx:1', 'environment': ['A=1']}, 'db': {'image': 'postgres:15'}}}
+    new = {'services': {'web': {'image': 'nginx:1', 'environment': {'A': 1}}, 'api': {'image': 'api:2'}}}
+    plan = plan_stack_update(old, new, ['web', 'db'])
+    assert plan['services'] == {
+        'web': {'action': 'unchanged', 'fields': []},
+        'api': {'action': 'added', 'fields': []},
+        'db': {'action': 'removed', 'fields': []}
+    }
+    assert plan['needs_deploy'] is True
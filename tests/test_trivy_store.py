@@ -0,0 +1,97 @@
+"""Limpeza dos resultados antigos do Trivy"""
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+from stack_manager.docker_client import DockerAPIError
+from stack_manager.trivy import TrivyResultStore, TrivyScanner
+
+
+def record(store, image, digest, db_version, scanned_at):
+    writer = store.writer()
+    for i in range(3):
+        writer.add('alpine', {'VulnerabilityID': f'CVE-{db_version}-{i}', 'Severity': 'HIGH', 'PkgName': 'musl'})
+    result_id = store.key(digest, db_version)
+    writer.commit(result_id)
+    store.put({'image': image, 'digest': digest, 'db_version': db_version, 'result_id': result_id,
+               'scanned_at': scanned_at.isoformat(), 'summary': writer.summary, 'total': writer.count})
+    return result_id
+
+
+def stored_results(store):
+    return {row[0] for row in store._conn().execute('SELECT DISTINCT result FROM vulnerabilities')}
+
+
+def json_files(path):
+    return sorted(f for f in os.listdir(path) if f.endswith('.json'))
+
+
+def test_prune_keeps_latest_two_db_versions_per_digest(tmp_path):
+    store = TrivyResultStore(str(tmp_path))
+    now = datetime.now()
+    ids = [record(store, 'web', 'sha256:a', f'v{n}', now - timedelta(days=5 - n)) for n in range(5)]
+
+    assert store.prune() == 3
+    assert stored_results(store) == set(ids[-2:])
+    assert len(json_files(tmp_path)) == 2
+    assert store.get('sha256:a', 'v0') is None
+    assert store.get('sha256:a', 'v4')['result_id'] == ids[-1]
+    assert store.prune() == 0
+
+
+def test_prune_drops_superseded_digests_after_ttl(tmp_path):
+    store = TrivyResultStore(str(tmp_path))
+    now = datetime.now()
+    old = record(store, 'api', 'sha256:old', 'v1', now - timedelta(days=30))
+    recent = record(store, 'worker', 'sha256:w1', 'v1', now - timedelta(hours=1))
+    current = record(store, 'api', 'sha256:new', 'v1', now)
+    record(store, 'worker', 'sha256:w2', 'v1', now)
+    store.put_sbom('sha256:old', 'api', 'lab-swarm1', '/sbom/old.json')
+
+    assert store.prune() == 1
+    assert old not in stored_results(store)
+    assert {recent, current} <= stored_results(store)
+    assert store.sbom('sha256:old') is None
+    assert [e['digest'] for e in store.latest()] == ['sha256:new', 'sha256:w2']
+
+
+def test_orphan_rows_removed_on_startup(tmp_path):
+    store = TrivyResultStore(str(tmp_path))
+    kept = record(store, 'web', 'sha256:a', 'v1', datetime.now())
+    conn = store._conn()
+    with conn:
+        conn.execute("INSERT INTO vulnerabilities VALUES ('orphan', 0, 'CVE-1', 1, 'p', '', '', '', '', '')")
+
+    reopened = TrivyResultStore(str(tmp_path))
+    assert stored_results(reopened) == {kept}
+
+
+class FakeStream:
+    def __init__(self, lines):
+        self._lines = lines
+
+    def lines(self):
+        return iter(self._lines)
+
+    def exit_code(self):
+        return 0
+
+
+def test_server_exec_error_falls_back_to_local_db(tmp_path):
+    calls = []
+
+    def stream(args, timeout, node):
+        calls.append('server' if '--server' in args else 'local')
+        if '--server' in args:
+            raise DockerAPIError(500, 'container not running')
+        vuln = {'VulnerabilityID': 'CVE-1', 'Severity': 'HIGH', 'PkgName': 'musl'}
+        return FakeStream([('stdout', json.dumps({'target': 'alpine', 'vuln': vuln}))])
+
+    scanner = TrivyScanner(None, stream, TrivyResultStore(str(tmp_path)), server_url='http://trivy:4954')
+    scanner._server_ok = (True, time.monotonic())
+    scanner.db_version = lambda refresh=False, node=None: 'v1'
+
+    mode, writer = scanner._scan_sbom({'digest': 'sha256:a', 'path': '/sbom/a.cdx.json', 'node': None})
+    assert (mode, calls, writer.count) == ('local', ['server', 'local'], 1)
+    writer.abort()